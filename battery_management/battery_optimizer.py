@@ -1,9 +1,10 @@
-from typing import Union
+from typing import Optional, Union
 
 from battery_management.optimizer.battery_optimization_or import FleetOptimizationOR
 from battery_management.optimizer.battery_optimization_scipy import (
     FleetOptimizationSciPy,
 )
+from battery_management.optimizer.solver_settings import SolverSettings
 
 
 def create(
@@ -13,6 +14,8 @@ def create(
     dt: float = 1,
     fully_charged_as_penalty: bool = False,
     single_continuous_session_allowed: bool = False,
+    builder: str = "expression",
+    solver_settings: Optional[SolverSettings] = None,
 ) -> Union[FleetOptimizationSciPy, FleetOptimizationOR]:
     """
     Factory method to create a battery optimizer.
@@ -31,6 +34,10 @@ def create(
         Whether to treat fully charged state as a penalty, by default False.
     single_continuous_session_allowed : bool, optional
         Whether to allow single continuous charging session, by default False.
+    builder : str, optional
+        Model builder of the OR optimizer, "expression" or "matrix", by default "expression".
+    solver_settings : SolverSettings, optional
+        Backend, threads, time limit and relative gap of the OR optimizer, by default CBC/GLOP without limits.
 
     Returns
     -------
@@ -51,6 +58,8 @@ def create(
             dt=dt,
             fully_charged_as_penalty=fully_charged_as_penalty,
             single_continuous_session_allowed=single_continuous_session_allowed,
+            builder=builder,
+            solver_settings=solver_settings,
         )
     else:
         raise ValueError(f"Type {type} is not supported. Use 'SciPy' or 'OR'.")
@@ -0,0 +1,92 @@
+from typing import List
+
+import numpy as np
+
+from battery_management.assets.battery import Battery
+
+# Parameters that have to match for batteries to be aggregated, next to the connected mask
+AGGREGATION_KEYS = [
+    "capacity",
+    "energy_min",
+    "energy_max",
+    "energy_start",
+    "energy_end",
+    "power_charge_max",
+    "power_discharge_max",
+    "power_charge_min",
+    "efficiency_charge",
+    "efficiency_discharge",
+    "stationary",
+    "cycle_life",
+    "cycle_usage",
+    "battery_costs",
+]
+
+# Parameters that scale with the number of batteries in a group
+SCALED_KEYS = [
+    "capacity",
+    "energy_min",
+    "energy_max",
+    "energy_start",
+    "energy_end",
+    "power_charge_max",
+    "power_discharge_max",
+    "power_charge_min",
+    "battery_costs",
+]
+
+
+def group_batteries(batteries: List[Battery]) -> List[List[Battery]]:
+    """
+    Group batteries with identical parameters and connected masks, in order of first appearance
+
+    Parameters
+    ----------
+    batteries: List[Battery]
+
+    Returns
+    -------
+    List[List[Battery]]
+    """
+    groups = {}
+    for battery in batteries:
+        key = tuple(getattr(battery, name) for name in AGGREGATION_KEYS) + (
+            np.asarray(battery.connected, dtype=bool).tobytes(),
+        )
+        groups.setdefault(key, []).append(battery)
+    return list(groups.values())
+
+
+def virtual_battery(batteries: List[Battery]) -> Battery:
+    """
+    One battery standing for a group of identical batteries: energies, powers and costs are multiplied by the
+    size of the group, efficiencies and the connected mask are kept. The virtual battery takes the id of the first
+    battery of the group.
+
+    If the model of the fleet is a pure LP, this is exact: the sum of the schedules of the group is a schedule of
+    the virtual battery and, the other way round, a schedule of the virtual battery split equally is a schedule
+    of each battery, at the same cost.
+
+    Parameters
+    ----------
+    batteries: List[Battery]
+        Identical batteries, cf. group_batteries
+
+    Returns
+    -------
+    Battery
+    """
+    first = batteries[0]
+    if len(batteries) == 1:
+        return first
+
+    parameters = {name: getattr(first, name) for name in AGGREGATION_KEYS}
+    for name in SCALED_KEYS:
+        parameters[name] = parameters[name] * len(batteries)
+
+    return Battery(
+        id=first.id,
+        connected=first.connected,
+        affected_charging_point_id=first.affected_charging_point_id,
+        **parameters,
+    )
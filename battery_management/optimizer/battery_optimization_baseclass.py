@@ -44,7 +44,8 @@ class FleetOptimizationBaseclass(ABC):
              false it is added as a condition in the optimizer. For details see the different implementations
 
          dt: float
-             delta time, the time step for a single data point. Used to convert power into energy
+             delta time, the time step for a single data point. Used to convert power into energy. Either one
+             duration for all time steps or one duration per time step (multi-resolution grid, cf. time_grid)
 
         penalize_spiky_behaviour: bool
              Under some conditions (mostly flat prices), the optimization might not have any incentive to follow a
@@ -149,9 +150,21 @@ class FleetOptimizationBaseclass(ABC):
             self.mask_marketed = np.array([False] * self.n_t)
         else:
             assert self.n_t == len(battery.connected)
+        assert np.ndim(self.dt) == 0 or len(self.dt) == self.n_t
 
         self.batteries.append(battery)
 
+    def step_durations(self) -> np.ndarray:
+        """
+        Duration of every time step, cf. dt
+
+        Returns
+        -------
+        np.ndarray
+            One duration per time step
+        """
+        return np.broadcast_to(np.asarray(self.dt, dtype=float), (self.n_t,))
+
     # --------------------- Charging Points -----------------------------
 
     def add_charging_point(self, charging_point: ChargingPoint):
@@ -1,4 +1,7 @@
+import copy
 import os
+from dataclasses import asdict, replace
+from typing import Dict, List
 
 import numpy as np
 import pandas as pd
@@ -6,9 +9,22 @@ from loguru import logger
 from ortools.linear_solver import pywraplp
 
 from battery_management.assets.battery import Battery
+from battery_management.optimizer.aggregation import group_batteries, virtual_battery
 from battery_management.optimizer.battery_optimization_baseclass import (
     FleetOptimizationBaseclass,
 )
+from battery_management.optimizer.battery_optimization_or_matrix import (
+    FleetMatrixBuilder,
+)
+from battery_management.optimizer.hint_store import HintStore
+from battery_management.optimizer.model_cache import (
+    MODEL_ATTRIBUTES,
+    ModelCache,
+    hash_inputs,
+)
+from battery_management.optimizer.model_export import FILE_FORMATS, export_model
+from battery_management.optimizer.presolve import energy_envelopes, feasibility_check
+from battery_management.optimizer.solver_settings import SolverSettings
 from battery_management.results_handler.site_result import SiteResult
 
 np.random.seed(42)
@@ -19,7 +35,24 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
     ORTools implementation of the FleetOptimization. This is curently the only implementation fully up-to-date.
     """
 
-    def __init__(self, *args, **kwargs):
+    builders = ["expression", "matrix"]
+    energy_formulations = ["cumulative", "state"]
+    infeasibility_handlings = [None, "clip", "penalty"]
+
+    def __init__(
+        self,
+        *args,
+        builder: str = "expression",
+        energy_formulation: str = "cumulative",
+        sparse_time: bool = False,
+        relax_binaries: bool = True,
+        solver_settings: SolverSettings = None,
+        tighten_bounds: bool = True,
+        aggregate_batteries: bool = False,
+        infeasible_targets: str = None,
+        compress_time: bool = False,
+        **kwargs,
+    ):
         """
 
         Parameters
@@ -30,19 +63,146 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
             Time discretization to convert power into energy.
             If dt=1, then it can be seen as using energy kwh (v2g case).
             If using power and time interval is 15min (eva case) then dt should be 0.25.
+            Can also be one duration per time step, e.g. 15min steps for the next hours followed by hourly steps,
+            cf. time_grid.
+        builder: str
+            How the model is put together:
+            - "expression": every variable and constraint is created through pywraplp (default)
+            - "matrix": variable bounds, constraint matrix and objective are assembled with NumPy for the whole
+              fleet and loaded in bulk as MPModelProto, cf. FleetMatrixBuilder. Much faster for large fleets.
+        energy_formulation: str
+            How the energy content of the batteries is modelled in the expression builder:
+            - "cumulative": the energy at t is the expression energy_start + sum of all (dis-)charging up to t.
+              Expression size and the work to expand the energy constraints grow with O(n_t^2) per battery
+            - "state": one energy variable per time step, linked to the previous one by a single balance equality.
+              Model size grows linearly with n_t, this is preferable for long horizons (e.g. n_t=672)
+            The matrix builder always uses the state formulation.
+        sparse_time: bool
+            If True, per-battery variables (power, energy, booleans, flexibility) are only created for the time steps
+            in which the battery is connected. Outside the connected windows the battery is a constant: no power, no
+            flexibility and the energy of the last connected step. For EV fleets plugged in for a fraction of the
+            horizon this removes most of the model.
+        relax_binaries: bool
+            If True, groups of binaries that provably cannot change the optimum are dropped before solving, cf.
+            _redundant_binaries. If no binaries remain, the model is solved as pure LP with GLOP instead of CBC.
+            The mode used is reported as solver_mode ("LP" or "MIP") in the result.
+        solver_settings: SolverSettings
+            Backend, threads, time limit and relative gap of the solver. Defaults to CBC for MIPs and GLOP for LPs
+            without limits. The achieved gap, the best bound and whether the time limit was hit are reported as
+            mip_gap, best_bound and limit_reached in the result. With SolverSettings.anytime a solve stopped at
+            the limit returns its best incumbent.
+        tighten_bounds: bool
+            If True, the static energy bounds [energy_min, energy_max] are replaced by the energy that is reachable
+            from energy_start and still able to meet energy_end, per time step, cf. presolve.energy_envelopes.
+            Steps in which a battery has to charge get a lower bound on the charging power, variables without slack
+            are fixed. This tightens the LP relaxation without changing the optimum.
+        aggregate_batteries: bool
+            If True, batteries with identical parameters and connected masks are modelled as one virtual battery,
+            scaled by the size of the group, and the schedule of the virtual battery is split equally among the group
+            in the result. Model size then grows with the number of distinct batteries. This is only exact if the
+            fleet needs no binaries (cf. _redundant_binaries) and is skipped otherwise, as well as with charging
+            points.
+        infeasible_targets: str
+            What to do if the feasibility check before building (cf. _check_feasibility) finds charging targets that
+            cannot be reached or a hard purchase limit that cannot cover the demand:
+            - None: the solve is skipped and the default strategy is used (default)
+            - "clip": unreachable targets are lowered to the reachable energy in the model
+            - "penalty": unreachable targets become penalties (as with fully_charged_as_penalty)
+            With "clip" and "penalty" an insufficient purchase limit becomes a penalty (as with limit_as_penalty).
+            The batteries and the flags of the optimizer are not changed, the fallbacks only apply to the model of
+            the current check. The findings are reported as feasibility_check in the extra info of the result.
+        compress_time: bool
+            If True, consecutive time steps in which tariffs, site load, marketed volumes, masks and the connected
+            state of every battery are all constant are merged into one longer step before building, cf.
+            time_grid.constant_blocks, and the result is expanded back to the original time steps. Fixed tariffs and
+            flat price periods then shrink the model without changing the optimum. This is only exact for a pure LP
+            without flexibility and spiky penalty (cf. _compressible) and is skipped otherwise, as well as with
+            charging points.
 
         args
         kwargs
         """
         super().__init__(**kwargs)
 
+        if builder not in self.builders:
+            raise ValueError(
+                f"Builder {builder} is not supported. Use one of {self.builders}."
+            )
+        if infeasible_targets not in self.infeasibility_handlings:
+            raise ValueError(
+                f"Handling {infeasible_targets} of infeasible targets is not supported. "
+                f"Use one of {self.infeasibility_handlings}."
+            )
+        if energy_formulation not in self.energy_formulations:
+            raise ValueError(
+                f"Energy formulation {energy_formulation} is not supported. "
+                f"Use one of {self.energy_formulations}."
+            )
+
         self.type = "OR"
+        self.builder = builder
+        self.energy_formulation = energy_formulation
+        self.sparse_time = sparse_time
+        self.relax_binaries = relax_binaries
+        self.tighten_bounds = tighten_bounds
+        self.aggregate_batteries = aggregate_batteries
+        self.compress_time = compress_time
+        self.infeasible_targets = infeasible_targets
+        self.feasibility_check = {}
+        self.precheck_failed = False
+        # Fallbacks of the last feasibility check for the model, cf. _check_feasibility
+        self.clipped_targets = {}
+        self.penalized_targets = set()
+        self.site_limit_penalty = False
+        self.solver_settings = (
+            SolverSettings() if solver_settings is None else solver_settings
+        )
+        self.has_solution = False
+        self.best_bound = np.nan
+        self.mip_gap = np.nan
+        self.limit_reached = False
+        self.dropped_binaries = {"fleet": False, "grid": False}
+        self.solver_mode = None
 
         self.id_list = set()
         self.batteries = []
+        # Batteries the model is built from: the batteries themselves or virtual batteries, cf. aggregate_batteries
+        self.model_batteries = self.batteries
+        self.battery_groups = {}
+
+        self._reset_model()
+
+        self.limit_purchase_cost = None
+        self.limit_purchase_penalty = 5000
+        self.fully_charged_penalty = 1000
+        self.spiky_behaviour_penalty = (
+            0.01  # cf. description of flag penalize_spiky_behaviour in baseclass. this
+        )
+        # penalty would be maybe better under the base class as well, but it is useful to have it here next to the
+        # other penalties for comparison
+        # NOTE: spiky_behaviour_penalty could be interacting with an optimization over low prices and so should stay low
+        # ideally lower than the prices
+
+        self.model = None
+        self.results = {}
+        self._built_structure = None
+
+        # Warm start, cf. add_hint_store
+        self.hint_store = None
+        self.hint_elapsed_steps = None
+
+        # Reuse of built models, cf. add_model_cache
+        self.model_cache = None
+        self.model_fingerprint = None
 
-        # Create Parameter Shells
+        # Models written to disk before solving, cf. add_model_export
+        self.model_export = None
+        self.exported_model = None
 
+    def _reset_model(self):
+        """
+        Create empty Parameter Shells. Every build starts from here so that nothing of a previous model is kept.
+        """
         self.grid_power = {"feed": {}, "purchase": {}, "curtail": {}}
         self.grid_peak = {"feed": None, "purchase": None}
         self.fleet_power = {}  # first key will be vehicle_id, then "charge" and "discharge"
@@ -61,19 +221,18 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
         # Collect Cost components in dictionary
         self.cost = {}
 
-        self.limit_purchase_cost = None
-        self.limit_purchase_penalty = 5000
-        self.fully_charged_penalty = 1000
-        self.spiky_behaviour_penalty = (
-            0.01  # cf. description of flag penalize_spiky_behaviour in baseclass. this
-        )
-        # penalty would be maybe better under the base class as well, but it is useful to have it here next to the
-        # other penalties for comparison
-        # NOTE: spiky_behaviour_penalty could be interacting with an optimization over low prices and so should stay low
-        # ideally lower than the prices
+        # Constraints that are updated in place between two solves (cf. update_prices), one per time step
+        self.constraints = {}
+        self.marketed_volumes_diff = {"pos": [], "neg": []}
+        # Indices of the constraints of each battery (cf. retire_battery)
+        self.battery_constraints = {}
+        # Energy and charging power bounds of each battery, cf. _set_battery_bounds
+        self.battery_bounds = {}
 
-        self.model = None
-        self.results = {}
+        # Shared by all optimizers using the model, "owner" is the token of the one whose prices and site load are
+        # set in it, cf. _claim_model
+        self._model_owner = {}
+        self._model_token = object()
 
     # ---------------------------------------------------
     #  Initialize Variables
@@ -95,6 +254,9 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
                     upper_limit = self.model.infinity()
                 self.grid_power[key][t] = self.model.NumVar(0, upper_limit, label)
 
+            if self.dropped_binaries["grid"]:
+                continue
+
             for key in self.grid_bool:
                 label = f"grid_bool_{key}_{t}"
                 self.grid_bool[key][t] = self.model.BoolVar(label)
@@ -107,6 +269,262 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
 
         return 0
 
+    def _redundant_binaries(self) -> Dict[str, bool]:
+        """
+        Check which groups of binaries can be dropped without changing the optimum.
+
+        - "fleet": the charge/discharge/disconnected booleans. Without minimum charging power and single continuous
+          sessions they only prevent simultaneous charging and discharging. With a round-trip efficiency below 1
+          this burns energy, which is never profitable as long as no import or export price is negative and no
+          flexibility is rewarded (a battery charging and discharging at the same time offers more flex). Burning
+          energy could however be used to stay below a hard feed limit (at no cost compared to curtailment), so
+          neither may apply.
+        - "grid": the feed/purchase/curtail booleans. Feeding in what is purchased at the same time is never
+          profitable if the export price never exceeds the import price. Purchasing to curtail additionally requires
+          a non-negative import price.
+
+        Returns
+        -------
+        Dict[str, bool]
+            For "fleet" and "grid", whether the binaries are redundant
+        """
+        if not self.relax_binaries:
+            return {"fleet": False, "grid": False}
+
+        def as_array(x):
+            return np.zeros(self.n_t) if x is None else np.asarray(x, dtype=float)
+
+        # Effective energy prices per time step as they enter the objective
+        mm = as_array(self.mask_marketed)
+        price_import = (1 - mm) * as_array(self.tariffs_import) + as_array(
+            self.triad_tariffs_import
+        )
+        price_export = (1 - mm) * as_array(self.tariffs_export) + as_array(
+            self.triad_tariffs_export
+        )
+
+        flex = any(
+            x is not None
+            for x in [
+                self.prices_flex_pos,
+                self.prices_flex_neg,
+                self.marketed_flex_pos,
+                self.marketed_flex_neg,
+            ]
+        )
+        fleet = (
+            not self.single_continuous_session_allowed
+            and not flex
+            and all(battery.power_charge_min == 0 for battery in self.batteries)
+            and all(
+                battery.efficiency_charge * battery.efficiency_discharge < 1
+                for battery in self.batteries
+            )
+            and np.all(price_import >= 0)
+            and np.all(price_export >= 0)
+            and self.site_load_restriction_discharge is None
+            and not self.allow_curtailment
+        )
+        grid = bool(np.all(price_export <= price_import)) and (
+            not self.allow_curtailment or bool(np.all(price_import >= 0))
+        )
+        return {"fleet": bool(fleet), "grid": grid}
+
+    def _track_constraints(self, battery_id: int, start: int):
+        """
+        Register the constraints created since index start as belonging to the battery
+        """
+        self.battery_constraints.setdefault(battery_id, []).extend(
+            range(start, self.model.NumConstraints())
+        )
+
+    def _group_batteries(self):
+        """
+        Replace groups of identical batteries by virtual batteries in the model if aggregate_batteries, cf.
+        aggregation.virtual_battery. battery_groups maps the id of each virtual battery to its group.
+        """
+        self.model_batteries = self._clipped_batteries()
+        self.battery_groups = {}
+        if not self.aggregate_batteries:
+            return 0
+        if self.charging_points or not self.dropped_binaries["fleet"]:
+            logger.debug(
+                "Batteries are not aggregated: charging points or binaries in the model"
+            )
+            return 0
+
+        groups = group_batteries(self.model_batteries)
+        self.model_batteries = [virtual_battery(group) for group in groups]
+        self.battery_groups = {group[0].id: group for group in groups if len(group) > 1}
+        logger.debug(
+            f"Aggregation: {len(self.batteries)} batteries modelled as {len(self.model_batteries)}"
+        )
+
+        return 0
+
+    def _clipped_batteries(self) -> List[Battery]:
+        """
+        The batteries as modelled: copies with the reachable energy_end for clipped targets, cf. _check_feasibility
+        """
+        if not self.clipped_targets:
+            return self.batteries
+        return [
+            replace(bat, energy_end=self.clipped_targets[bat.id])
+            if bat.id in self.clipped_targets
+            else bat
+            for bat in self.batteries
+        ]
+
+    def _target_as_penalty(self, battery_id: int) -> bool:
+        """
+        Whether the charging target of a battery is a penalty rather than a constraint
+        """
+        return self.fully_charged_as_penalty or battery_id in self.penalized_targets
+
+    def _site_limit_as_penalty(self) -> bool:
+        """
+        Whether the purchase limit is a penalty rather than a constraint
+        """
+        return self.limit_as_penalty or self.site_limit_penalty
+
+    def _fallbacks(self, exclude: int = None) -> tuple:
+        """
+        Fallbacks of the feasibility check that shape the model, except for those of the battery exclude
+        """
+        return (
+            tuple(
+                sorted(
+                    (i, energy_end)
+                    for i, energy_end in self.clipped_targets.items()
+                    if i != exclude
+                )
+            ),
+            tuple(sorted(i for i in self.penalized_targets if i != exclude)),
+            self.site_limit_penalty,
+        )
+
+    def _hard_targets(self, batteries: List[Battery]) -> np.ndarray:
+        """
+        One flag per battery, True if energy_end is a constraint of the model
+        """
+        return np.array(
+            [
+                not (bat.stationary or self._target_as_penalty(bat.id))
+                and bat.is_connected()
+                for bat in batteries
+            ],
+            dtype=bool,
+        )
+
+    def _check_feasibility(self):
+        """
+        Pre-flight check of the charging targets and the purchase limit, cf. presolve.feasibility_check. Depending
+        on infeasible_targets, unreachable targets are clipped or turned into penalties, or the solve is skipped.
+
+        The fallbacks are recomputed on every check and only apply to the model (clipped_targets, penalized_targets,
+        site_limit_penalty): the batteries and the flags of the optimizer are left as they are.
+        """
+        self.clipped_targets = {}
+        self.penalized_targets = set()
+        self.site_limit_penalty = False
+        check = feasibility_check(
+            self.batteries,
+            self.n_t,
+            self.step_durations(),
+            self._hard_targets(self.batteries),
+            site_load=self.site_load,
+            purchase_limit=None
+            if self.limit_as_penalty
+            else self.site_load_restriction_charge,
+            purchase_efficiency=self.purchase_efficiency,
+        )
+
+        self.feasibility_check = {
+            "unreachable_targets": {},
+            "site_limit": check["site_limit"],
+        }
+        for battery, unreachable, reachable in zip(
+            self.batteries, check["unreachable"], check["reachable"]
+        ):
+            if not unreachable:
+                continue
+            logger.warning(
+                f"Battery {battery.id}: energy_end {battery.energy_end} cannot be reached, at most {reachable}"
+            )
+            self.feasibility_check["unreachable_targets"][battery.id] = {
+                "energy_end": battery.energy_end,
+                "reachable": reachable,
+            }
+            if self.infeasible_targets == "clip":
+                self.clipped_targets[battery.id] = reachable
+            elif self.infeasible_targets == "penalty":
+                self.penalized_targets.add(battery.id)
+        if check["site_limit"]:
+            logger.warning(
+                f"Purchase limit {self.site_load_restriction_charge} cannot cover the demand of the site"
+            )
+
+        if self.infeasible_targets is not None and check["site_limit"]:
+            self.site_limit_penalty = True
+        self.precheck_failed = self.infeasible_targets is None and (
+            check["site_limit"] or bool(np.any(check["unreachable"]))
+        )
+
+        return 0
+
+    def _set_battery_bounds(self, batteries: List[Battery]):
+        """
+        Bounds of the energy and the charging power per battery and time step: the reachability envelopes of
+        presolve.energy_envelopes if tighten_bounds, the static bounds otherwise.
+        """
+        if not batteries:
+            return 0
+
+        if self.tighten_bounds:
+            bounds = energy_envelopes(
+                batteries,
+                self.n_t,
+                self.step_durations(),
+                self._hard_targets(batteries),
+            )
+            logger.debug(
+                f"Presolve: {np.sum(bounds['energy_min'] == bounds['energy_max'])} energy variables fixed, "
+                f"{np.count_nonzero(bounds['charge_min'])} charging powers bounded from below"
+            )
+        else:
+            shape = (len(batteries), self.n_t)
+            bounds = {
+                "energy_min": np.array([[bat.energy_min] for bat in batteries])
+                * np.ones(shape),
+                "energy_max": np.array([[bat.energy_max] for bat in batteries])
+                * np.ones(shape),
+                "charge_min": np.zeros(shape),
+            }
+
+        for b, battery in enumerate(batteries):
+            self.battery_bounds[battery.id] = {
+                key: value[b] for key, value in bounds.items()
+            }
+
+        return 0
+
+    def _active_time_steps(self, battery: Battery):
+        """
+        Time steps in which the battery gets variables in the model.
+
+        Parameters
+        ----------
+        battery: Battery
+
+        Returns
+        -------
+        List[bool]
+            One flag per time step. All True unless sparse_time is set, then only the connected steps.
+        """
+        if not self.sparse_time:
+            return [True] * self.n_t
+        return [bool(c) for c in battery.connected]
+
     def _initialize_battery(self, battery: Battery):
         """
         Initialize the power and energy variables for the individual batteries and charger
@@ -123,11 +541,9 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
         -------
 
         """
-        # Maybe the battery could not be allocated to a charge point so we should not add it to the optimizer
-        if not battery.is_connected():
-            return {"message": f"Battery {battery.id} is not connected."}
-
         i = battery.id
+        active = self._active_time_steps(battery)
+        bounds = self.battery_bounds[i]
 
         # ----------------------------------------------------------------------
         #  Battery Variables for Charging/Discharging
@@ -135,11 +551,23 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
 
         self.fleet_power[i] = {"charge": {}, "discharge": {}}
         self.fleet_energy[i] = {}
-        self.fleet_bool[i] = {"charge": {}, "discharge": {}, "disconnected": {}}
+        keep_bools = not self.dropped_binaries["fleet"]
+        if keep_bools:
+            self.fleet_bool[i] = {"charge": {}, "discharge": {}, "disconnected": {}}
         for t in range(self.n_t):
+            if not active[t]:
+                # Sparse time: the battery is a constant outside its connected windows
+                self.fleet_power[i]["charge"][t] = 0
+                self.fleet_power[i]["discharge"][t] = 0
+                if keep_bools:
+                    self.fleet_bool[i]["charge"][t] = 0
+                    self.fleet_bool[i]["discharge"][t] = 0
+                    self.fleet_bool[i]["disconnected"][t] = 1
+                continue
+
             # (Dis-)charge Variables
             self.fleet_power[i]["charge"][t] = self.model.NumVar(
-                0,
+                bounds["charge_min"][t],
                 battery.power_charge_max if battery.connected[t] else 0,
                 f"power_{i}_charge_{t}",
             )
@@ -151,9 +579,12 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
             )
 
             self.fleet_energy[i][t] = self.model.NumVar(
-                battery.energy_min, battery.energy_max, f"energy_{i}_{t}"
+                bounds["energy_min"][t], bounds["energy_max"][t], f"energy_{i}_{t}"
             )
 
+            if not keep_bools:
+                continue
+
             # (Dis-)charge Booleans (ensure only one is ever used)
             # Disconnect Flag allows to stop the charging session (and so setting power to 0 when charging_power_min>0)
             self.fleet_bool[i]["charge"][t] = self.model.BoolVar(f"bool_{i}_charge_{t}")
@@ -164,47 +595,75 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
                 f"bool_{i}_disconnected_{t}"
             )
 
+        # Maybe the battery could not be allocated to a charge point so we should not add it to the optimizer
+        if not battery.is_connected():
+            self.fleet_energy[i] = {t: battery.energy_start for t in range(self.n_t)}
+            return {"message": f"Battery {battery.id} is not connected."}
+
         # ----------------------------------------------------------------------
         #  Current energy per Vehicle (so far we have only considered deltas)
         #  and Charging Targets
         # ----------------------------------------------------------------------
 
-        # The change in battery status from power depends on the efficiency. Values around 95% are typical
-        self.fleet_energy[i][0] = (
-            battery.energy_start
-            + self.fleet_power[i]["charge"][0] * self.dt
-            - self.fleet_power[i]["discharge"][0] * self.dt
-        )
-        self.model.Add(
-            self.fleet_energy[i][0] >= battery.energy_min,
-            f"energy_min_constraint_{i}_{0}",
-        )
-        self.model.Add(
-            self.fleet_energy[i][0] <= battery.energy_max,
-            f"energy_max_constraint_{i}_{0}",
-        )
-
-        for t in range(1, self.n_t):
-            self.fleet_energy[i][t] = self.fleet_energy[i][t - 1] + (
-                self.fleet_power[i]["charge"][t] * self.dt
-                - self.fleet_power[i]["discharge"][t] * self.dt
+        dt = self.step_durations()
+        if self.energy_formulation == "state":
+            # One energy state variable per time step, bounded upon creation (cf. _set_battery_bounds). Each
+            # step is linked to the previous one by a single balance equality
+            for t in range(self.n_t):
+                energy_previous = (
+                    battery.energy_start if t == 0 else self.fleet_energy[i][t - 1]
+                )
+                if not active[t]:
+                    self.fleet_energy[i][t] = energy_previous
+                    continue
+                self.model.Add(
+                    self.fleet_energy[i][t]
+                    == energy_previous
+                    + self.fleet_power[i]["charge"][t] * dt[t]
+                    - self.fleet_power[i]["discharge"][t] * dt[t],
+                    f"energy_balance_{i}_{t}",
+                )
+        else:
+            # The change in battery status from power depends on the efficiency. Values around 95% are typical
+            self.fleet_energy[i][0] = (
+                battery.energy_start
+                + self.fleet_power[i]["charge"][0] * dt[0]
+                - self.fleet_power[i]["discharge"][0] * dt[0]
             )
+            if active[0]:
+                self.model.Add(
+                    self.fleet_energy[i][0] >= bounds["energy_min"][0],
+                    f"energy_min_constraint_{i}_{0}",
+                )
+                self.model.Add(
+                    self.fleet_energy[i][0] <= bounds["energy_max"][0],
+                    f"energy_max_constraint_{i}_{0}",
+                )
 
-            self.model.Add(
-                self.fleet_energy[i][t] >= battery.energy_min,
-                f"energy_min_constraint_{i}_{t}",
-            )
-            self.model.Add(
-                self.fleet_energy[i][t] <= battery.energy_max,
-                f"energy_max_constraint_{i}_{t}",
-            )
+            for t in range(1, self.n_t):
+                if not active[t]:
+                    self.fleet_energy[i][t] = self.fleet_energy[i][t - 1]
+                    continue
+                self.fleet_energy[i][t] = self.fleet_energy[i][t - 1] + (
+                    self.fleet_power[i]["charge"][t] * dt[t]
+                    - self.fleet_power[i]["discharge"][t] * dt[t]
+                )
+
+                self.model.Add(
+                    self.fleet_energy[i][t] >= bounds["energy_min"][t],
+                    f"energy_min_constraint_{i}_{t}",
+                )
+                self.model.Add(
+                    self.fleet_energy[i][t] <= bounds["energy_max"][t],
+                    f"energy_max_constraint_{i}_{t}",
+                )
 
         # Stationary batteries do not require to be charged to a certain amount at the end of the period
         # In contrario, non-stationary batteries (EVs) have to be charged at the end of the period to a certain level
         # Note that even using "fully_charged_as_penalty" and energy_end=energy_min will constrain the optimization
         # to charge the battery because it is rewarding to do so (as per definition).
         if not battery.stationary:
-            if not self.fully_charged_as_penalty:
+            if not self._target_as_penalty(i):
                 # Fully charged is a constraint
                 self.model.Add(
                     self.fleet_energy[i][self.n_t - 1] >= battery.energy_end,
@@ -229,8 +688,15 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
         # ----------------------------------------------------------------------
         # Prevent simultaneous charging and discharging of the battery
         # ----------------------------------------------------------------------
+        # Without the booleans, the bounds of the power variables are all that remains of these constraints
+        if not keep_bools:
+            return 0
+
         first_time_connected = True
         for t in range(self.n_t):
+            # Steps dropped from the sparse model are fixed to zero power and "disconnected"
+            if not active[t]:
+                continue
             self.model.Add(
                 self.fleet_power[i]["charge"][t]
                 <= self.fleet_bool[i]["charge"][t] * battery.power_charge_max,
@@ -304,6 +770,7 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
         # ----------------------------------------------------------------------
         # Define abbreviations for electricity sources and sinks
         # NOTE: All of these should be in kW if self.dt!=1 (INCLUDING site_load)
+        self.constraints["overall_electricity_balance"] = []
         for t in range(self.n_t):
             # Here is where we need to adjust for the efficiency:
             source = self.grid_power["purchase"][
@@ -312,13 +779,13 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
                 [
                     self.fleet_power[battery.id]["discharge"][t]
                     * battery.efficiency_discharge
-                    for battery in self.batteries
+                    for battery in self.model_batteries
                 ]
             )
 
             batteries_charge = [
                 self.fleet_power[battery.id]["charge"][t] / battery.efficiency_charge
-                for battery in self.batteries
+                for battery in self.model_batteries
             ]
             sink = (
                 self.grid_power["feed"][t] / self.feed_efficiency
@@ -333,38 +800,48 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
                 else:
                     source -= sl
 
-            self.model.Add(source == sink, f"overall_electricity_balance_{t}")
+            self.constraints["overall_electricity_balance"].append(
+                self.model.Add(source == sink, f"overall_electricity_balance_{t}")
+            )
 
         # ----------------------------------------------------------------------
         # Prevent simultaneous feed-in and purchase from the grid
         # ----------------------------------------------------------------------
 
-        for t in range(self.n_t):
-            self.model.Add(
-                self.grid_bool["feed"][t]
-                + self.grid_bool["curtail"][t]
-                + self.grid_bool["purchase"][t]
-                == 1,
-                f"prevent_simultaneous_feed_in_and_purchase_{t}",
-            )
+        # Not needed if the grid booleans were dropped, cf. _redundant_binaries
+        if not self.dropped_binaries["grid"]:
+            for t in range(self.n_t):
+                self.model.Add(
+                    self.grid_bool["feed"][t]
+                    + self.grid_bool["curtail"][t]
+                    + self.grid_bool["purchase"][t]
+                    == 1,
+                    f"prevent_simultaneous_feed_in_and_purchase_{t}",
+                )
 
         # ----------------------------------------------------------------------
         #  Totals for Charge/Discharge <=> sum over all assets
         # ----------------------------------------------------------------------
-        # This needs to be updated after every battery
-        # Since no variables are affected this can be done
+        self._calc_sum_power_fleet()
+
+        return 0
 
+    def _calc_sum_power_fleet(self):
+        """
+        Totals for Charge/Discharge over all batteries. This needs to be updated after every battery
+        Since no variables are affected this can be done
+        """
         for t in range(self.n_t):
             self.sum_power_fleet["charge"][t] = self.model.Sum(
                 [
                     self.fleet_power[battery.id]["charge"][t]
-                    for battery in self.batteries
+                    for battery in self.model_batteries
                 ]
             )
             self.sum_power_fleet["discharge"][t] = self.model.Sum(
                 [
                     self.fleet_power[battery.id]["discharge"][t]
-                    for battery in self.batteries
+                    for battery in self.model_batteries
                 ]
             )
 
@@ -385,7 +862,7 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
         -------
 
         """
-        if self.limit_as_penalty:
+        if self._site_limit_as_penalty():
             # This was written by Quentin for EVA. Is there a reason we only have a restriction for charging?
             # This is the more likely of the two cases, yet not the only option
             if self.site_load_restriction_charge is not None:
@@ -412,19 +889,23 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
                     * self.limit_purchase_penalty,
                 ]
         else:
+            # Without grid booleans the limits are plain upper bounds
+            grid_bool = (
+                {key: [1] * self.n_t for key in self.grid_bool}
+                if self.dropped_binaries["grid"]
+                else self.grid_bool
+            )
             for t in range(self.n_t):
                 if self.site_load_restriction_discharge is not None:
                     self.model.Add(
                         self.grid_power["feed"][t]
-                        <= self.grid_bool["feed"][t]
-                        * self.site_load_restriction_discharge,
+                        <= grid_bool["feed"][t] * self.site_load_restriction_discharge,
                         f"maximum_limit_feed_in_{t}",
                     )
                 if self.site_load_restriction_charge is not None:
                     self.model.Add(
                         self.grid_power["purchase"][t]
-                        <= self.grid_bool["purchase"][t]
-                        * self.site_load_restriction_charge,
+                        <= grid_bool["purchase"][t] * self.site_load_restriction_charge,
                         f"maximum_limit_purchase_{t}",
                     )
 
@@ -464,13 +945,14 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
             site_load_pos = [0] * self.n_t
             site_load_neg = [0] * self.n_t
 
+        dt = self.step_durations()
         if self.tariffs_import is not None:
             cost_import = [
                 (1 - mm[t])
                 * (
                     self.tariffs_import[t]
                     * (self.grid_power["purchase"][t] - site_load_pos[t])
-                    * self.dt
+                    * dt[t]
                 )
                 for t in range(self.n_t)
             ]
@@ -483,7 +965,7 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
                 * (
                     self.tariffs_export[t]
                     * (self.grid_power["feed"][t] - site_load_neg[t])
-                    * self.dt
+                    * dt[t]
                 )
                 for t in range(self.n_t)
             ]
@@ -498,7 +980,7 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
         ]
 
         if (self.tariffs_export is not None) and (self.tariffs_import is not None):
-            _ = [
+            self.constraints["const_tariff_var"] = [
                 self.model.Add(
                     self.cost["Spot"][t] == cost_import[t] + cost_export[t],
                     f"const_tariff_var_{t}",
@@ -506,14 +988,14 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
                 for t in range(self.n_t)
             ]
         elif self.tariffs_export is not None:
-            _ = [
+            self.constraints["const_tariff_var"] = [
                 self.model.Add(
                     self.cost["Spot"][t] == cost_export[t], f"const_tariff_var_{t}"
                 )
                 for t in range(self.n_t)
             ]
         elif self.tariffs_import is not None:
-            _ = [
+            self.constraints["const_tariff_var"] = [
                 self.model.Add(
                     self.cost["Spot"][t] == cost_import[t], f"const_tariff_var_{t}"
                 )
@@ -597,17 +1079,22 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
 
         # Notice that diff was only added for readability.
         diff = [0] * self.n_t
+        self.marketed_volumes_diff = {"pos": diff_pos, "neg": diff_neg}
+        self.constraints["marketed_volumes_diff"] = []
+        dt = self.step_durations()
         for t in range(self.n_t):
             if self.mask_marketed[t]:
                 # Marketed Volumes are in kWh, sum_power_fleet in kW
-                diff[t] = self.marketed_volumes[t] - self.dt * (
+                diff[t] = self.marketed_volumes[t] - dt[t] * (
                     self.sum_power_fleet["charge"][t]
                     - self.sum_power_fleet["discharge"][t]
                 )
             else:
                 diff[t] = 0
-            self.model.Add(
-                diff[t] == diff_pos[t] - diff_neg[t], f"marketed_volumes_diff_{t}"
+            self.constraints["marketed_volumes_diff"].append(
+                self.model.Add(
+                    diff[t] == diff_pos[t] - diff_neg[t], f"marketed_volumes_diff_{t}"
+                )
             )
 
         # ---------------------------------------------------------------------------------------------------------
@@ -669,7 +1156,7 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
                 [
                     self.fleet_power[battery.id]["charge"][t]
                     - self.fleet_power[battery.id]["discharge"][t]
-                    for battery in self.batteries
+                    for battery in self.model_batteries
                 ]
             )
             for t in range(self.n_t - 1)
@@ -679,7 +1166,7 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
                 [
                     self.fleet_power[battery.id]["charge"][t + 1]
                     - self.fleet_power[battery.id]["discharge"][t + 1]
-                    for battery in self.batteries
+                    for battery in self.model_batteries
                 ]
             )
             for t in range(self.n_t - 1)
@@ -687,13 +1174,15 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
         fleet_power_diff = np.array(fleet_power_after) - np.array(fleet_power_before)
 
         # Adding constraint that Increasing+Decreasing == Diff at all t
-        for t in range(self.n_t - 1):
+        self.constraints["fleet_power_diff"] = [
             self.model.Add(
                 fleet_power_diff[t]
                 == self.sum_power_fleet_diff[t]["decreasing"]
                 - self.sum_power_fleet_diff[t]["increasing"],
                 f"fleet_power_diff_constraint_{t}",
             )
+            for t in range(self.n_t - 1)
+        ]
 
         # Costs is the sum of Increasing and Decreasing which will be minimized
         spiky_costs = np.array(
@@ -716,7 +1205,7 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
         -------
 
         """
-        if sum([bat.cycle_cost_per_kwh for bat in self.batteries]) == 0:
+        if sum([bat.cycle_cost_per_kwh for bat in self.model_batteries]) == 0:
             print(
                 "WARNING: Trying to include battery cycle costs but the cycle costs are 0.Please use "
                 "Battery.add_cycle_costs()"
@@ -726,35 +1215,53 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
                 "Battery.add_cycle_costs()"
             )
 
-        self.battery_costs = {
-            bat.id: self.model.NumVar(
-                0, self.model.infinity(), name=f"BatteryCost_{bat.id}"
-            )
-            for bat in self.batteries
-        }
+        self.battery_costs = {}
+        for bat in self.model_batteries:
+            start = self.model.NumConstraints()
+            self._calc_battery_cost(bat)
+            self._track_constraints(bat.id, start)
 
-        for bat in self.batteries:
-            i = bat.id
-            logger.info(
-                f"Battery {i}: Adding cycle costs of {bat.cycle_cost_per_kwh} €/kWh"
-            )
-            print(f"Battery {i}: Adding cycle costs of {bat.cycle_cost_per_kwh} €/kWh")
-            self.model.Add(
-                self.battery_costs[i]
-                == self.model.Sum(
-                    [
+        self.cost["battery_costs"] = [
+            self.battery_costs[i] for i in self.battery_costs.keys()
+        ]
+
+    def _calc_battery_cost(self, bat: Battery):
+        """
+        Ageing cost variable of a single battery, cf. _calc_battery_costs
+
+        Parameters
+        ----------
+        bat: Battery
+
+        Returns
+        -------
+
+        """
+        i = bat.id
+        self.battery_costs[i] = self.model.NumVar(
+            0, self.model.infinity(), name=f"BatteryCost_{i}"
+        )
+        logger.info(
+            f"Battery {i}: Adding cycle costs of {bat.cycle_cost_per_kwh} €/kWh"
+        )
+        print(f"Battery {i}: Adding cycle costs of {bat.cycle_cost_per_kwh} €/kWh")
+        dt = self.step_durations()
+        self.model.Add(
+            self.battery_costs[i]
+            == self.model.Sum(
+                [
+                    (
                         self.fleet_power[i]["charge"][t]
                         + self.fleet_power[i]["discharge"][t]
-                        for t in range(self.n_t)
-                    ]
-                )
-                * self.dt
-                * bat.cycle_cost_per_kwh
+                    )
+                    * dt[t]
+                    for t in range(self.n_t)
+                ]
             )
+            * bat.cycle_cost_per_kwh
+        )
 
-        self.cost["battery_costs"] = [
-            self.battery_costs[i] for i in self.battery_costs.keys()
-        ]
+        return 0
 
     # ---------------------------------------------------
     #  Cost Components Price, marketed volumes (UK)
@@ -784,30 +1291,27 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
         # with vehicles is in grid power. Hence we need to subtract the baseline from the optimized site to extract
         # the vehicle only part
 
+        dt = self.step_durations()
         if self.site_load is not None:
-            _ = [
+            self.constraints["cost_triad"] = [
                 self.model.Add(
                     self.cost["Triad"][t]
                     == self.triad_tariffs_import[t]
                     * (self.grid_power["purchase"][t] - self.site_load[t])
-                    * self.dt
-                    - self.triad_tariffs_export[t]
-                    * self.grid_power["feed"][t]
-                    * self.dt,
+                    * dt[t]
+                    - self.triad_tariffs_export[t] * self.grid_power["feed"][t] * dt[t],
                     f"constraint_triad_{t}",
                 )
                 for t in range(self.n_t)
             ]
         else:
-            _ = [
+            self.constraints["cost_triad"] = [
                 self.model.Add(
                     self.cost["Triad"][t]
                     == self.triad_tariffs_import[t]
                     * self.grid_power["purchase"][t]
-                    * self.dt
-                    - self.triad_tariffs_export[t]
-                    * self.grid_power["feed"][t]
-                    * self.dt,
+                    * dt[t]
+                    - self.triad_tariffs_export[t] * self.grid_power["feed"][t] * dt[t],
                     f"constraint_triad_{t}",
                 )
                 for t in range(self.n_t)
@@ -853,66 +1357,10 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
             FlexPos[i] =  EV_simulation_sample['FFR Marketing'][i]*(min(Buffer_Energy_Factor*(min(SOC[i],SOC[i-1])-min_energy_content),\
                                                      MaxDischargingPower + x[i]))  
         """
-        for battery in self.batteries:
-            i = battery.id
-
-            # ---- Define Variables ----
-            self.flex_pos[i] = [
-                self.model.NumVar(0, self.model.infinity(), name=f"pos_flex_{i}_{t}")
-                for t in range(self.n_t)
-            ]
-
-            # ---- Fill Variables with life -----
-            for t in range(self.n_t):
-                energy_current = self.fleet_energy[i][t]
-                if t == 0:
-                    energy_previous = battery.energy_start
-                else:
-                    energy_previous = self.fleet_energy[i][t - 1]
-
-                # Current Power in our convention
-                # Here we need the power wrt to the grid rather than the charger -> Correct for efficiency
-                power_current = (
-                    self.fleet_power[i]["charge"][t] / battery.efficiency_charge
-                    - self.fleet_power[i]["discharge"][t] * battery.efficiency_discharge
-                )
-
-                # ---- Positive Flex -----
-                # 1) Energy that could maximally be discharged:
-                delta_energy_discharge_max_0 = energy_previous - battery.energy_min
-                delta_energy_discharge_max_1 = energy_current - battery.energy_min
-
-                # 2) Power from this
-                # Efficiency: we get less power at the charger -> multiply
-                power_discharge_max_0 = (
-                    delta_energy_discharge_max_0
-                    * battery.efficiency_discharge
-                    / self.dt
-                )
-                power_discharge_max_1 = (
-                    delta_energy_discharge_max_1
-                    * battery.efficiency_discharge
-                    / self.dt
-                )
-
-                # 3) Difference between max discharge and current charging power
-                power_discharge_max_2 = (
-                    battery.power_discharge_max * battery.efficiency_discharge
-                    + power_current
-                )
-
-                self.model.Add(
-                    self.flex_buffer * power_discharge_max_0 >= self.flex_pos[i][t],
-                    f"constraint_flex_pos_1_{i}_{t}",
-                )
-                self.model.Add(
-                    self.flex_buffer * power_discharge_max_1 >= self.flex_pos[i][t],
-                    f"constraint_flex_pos_2_{i}_{t}",
-                )
-                self.model.Add(
-                    power_discharge_max_2 >= self.flex_pos[i][t],
-                    f"constraint_flex_pos_3_{i}_{t}",
-                )
+        for battery in self.model_batteries:
+            start = self.model.NumConstraints()
+            self._calc_pos_flex_battery(battery)
+            self._track_constraints(battery.id, start)
 
         # Sum flex over all batteries
         self.flex_pos_total = {
@@ -924,33 +1372,114 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
             for t in range(self.n_t)
         }
 
-        for t in range(self.n_t):
-            # TODO: add grid efficiencies if different than 1 (as in Ladepark Duisburg)
+        # TODO: add grid efficiencies if different than 1 (as in Ladepark Duisburg)
+        self.constraints["flex_pos_total"] = [
             self.model.Add(
                 self.flex_pos_total[t]
-                == sum([self.flex_pos[battery.id][t] for battery in self.batteries]),
+                == sum(
+                    [self.flex_pos[battery.id][t] for battery in self.model_batteries]
+                ),
                 f"constraint_flex_pos_{t}",
             )
+            for t in range(self.n_t)
+        ]
 
         return 0
 
-    def _calc_neg_flex(self):
+    def _calc_pos_flex_battery(self, battery: Battery):
         """
-        Calculate the flexibility. This is done without a specific cost/penalty in mind. It can be used
-        in (at least) two distinct cases: flex forecast where we have prices for flex availability and
-        flex matching where we have previously marketed flexibility that needs to be matched
+        Variables and constraints of the positive flexibility of a single battery, cf. _calc_pos_flex
+
+        Parameters
+        ----------
+        battery: Battery
 
         Returns
         -------
 
         """
+        i = battery.id
 
-        """
-        The calculation of flexibility requires the minimum of three variables y_1, y_2, y_3.
-        In principle this is a complicated situation in linear optimization. However, in this specific case we are 
-        lucky by circumstances. The total cost function gets a correction Δy:
-            y - Δy
-        Now, Δy is the minimum of the above-mentioned y_i. So we need to make sure that 
+        # ---- Define Variables ----
+        # No flexibility can be offered by a battery that is not part of the sparse model at t
+        active = self._active_time_steps(battery)
+        self.flex_pos[i] = [
+            self.model.NumVar(0, self.model.infinity(), name=f"pos_flex_{i}_{t}")
+            if active[t]
+            else 0
+            for t in range(self.n_t)
+        ]
+
+        # ---- Fill Variables with life -----
+        dt = self.step_durations()
+        for t in range(self.n_t):
+            if not active[t]:
+                continue
+            energy_current = self.fleet_energy[i][t]
+            if t == 0:
+                energy_previous = battery.energy_start
+            else:
+                energy_previous = self.fleet_energy[i][t - 1]
+
+            # Current Power in our convention
+            # Here we need the power wrt to the grid rather than the charger -> Correct for efficiency
+            power_current = (
+                self.fleet_power[i]["charge"][t] / battery.efficiency_charge
+                - self.fleet_power[i]["discharge"][t] * battery.efficiency_discharge
+            )
+
+            # ---- Positive Flex -----
+            # 1) Energy that could maximally be discharged:
+            delta_energy_discharge_max_0 = energy_previous - battery.energy_min
+            delta_energy_discharge_max_1 = energy_current - battery.energy_min
+
+            # 2) Power from this
+            # Efficiency: we get less power at the charger -> multiply
+            power_discharge_max_0 = (
+                delta_energy_discharge_max_0 * battery.efficiency_discharge / dt[t]
+            )
+            power_discharge_max_1 = (
+                delta_energy_discharge_max_1 * battery.efficiency_discharge / dt[t]
+            )
+
+            # 3) Difference between max discharge and current charging power
+            power_discharge_max_2 = (
+                battery.power_discharge_max * battery.efficiency_discharge
+                + power_current
+            )
+
+            self.model.Add(
+                self.flex_buffer * power_discharge_max_0 >= self.flex_pos[i][t],
+                f"constraint_flex_pos_1_{i}_{t}",
+            )
+            self.model.Add(
+                self.flex_buffer * power_discharge_max_1 >= self.flex_pos[i][t],
+                f"constraint_flex_pos_2_{i}_{t}",
+            )
+            self.model.Add(
+                power_discharge_max_2 >= self.flex_pos[i][t],
+                f"constraint_flex_pos_3_{i}_{t}",
+            )
+
+        return 0
+
+    def _calc_neg_flex(self):
+        """
+        Calculate the flexibility. This is done without a specific cost/penalty in mind. It can be used
+        in (at least) two distinct cases: flex forecast where we have prices for flex availability and
+        flex matching where we have previously marketed flexibility that needs to be matched
+
+        Returns
+        -------
+
+        """
+
+        """
+        The calculation of flexibility requires the minimum of three variables y_1, y_2, y_3.
+        In principle this is a complicated situation in linear optimization. However, in this specific case we are 
+        lucky by circumstances. The total cost function gets a correction Δy:
+            y - Δy
+        Now, Δy is the minimum of the above-mentioned y_i. So we need to make sure that 
             y_i >= Δy
         which is easy to program. With a lower limit for Δy of zero (which is in line with the problem) we also by 
         minimising the target function that Δy becomes as large as possible and thus hits to smallest of the y_i  
@@ -968,62 +1497,10 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
             FlexNeg[i] = EV_simulation_sample['FFR Marketing'][i]*(min(Buffer_Energy_Factor*(max_energy_content-max(SOC[i],SOC[i-1])), \
                                                     MaxChargingPower/Chargingefficiency - x[i]))   
         """
-        for battery in self.batteries:
-            i = battery.id
-
-            # ---- Define Variables ----
-            self.flex_neg[i] = [
-                self.model.NumVar(0, self.model.infinity(), name=f"neg_flex_{i}_{t}")
-                for t in range(self.n_t)
-            ]
-
-            # ---- Fill Variables with life -----
-            for t in range(self.n_t):
-                energy_current = self.fleet_energy[i][t]
-                if t == 0:
-                    energy_previous = battery.energy_start
-                else:
-                    energy_previous = self.fleet_energy[i][t - 1]
-
-                # Current Power in our convention
-                # Here we need the power wrt to the grid rather than the charger -> Correct for efficiency
-                power_current = (
-                    self.fleet_power[i]["charge"][t] / battery.efficiency_charge
-                    - self.fleet_power[i]["discharge"][t] * battery.efficiency_discharge
-                )
-
-                # ---- Negative Flex -----
-
-                # 1) Energy that could maximally be charged:
-                delta_energy_charge_max_0 = battery.energy_max - energy_previous
-                delta_energy_charge_max_1 = battery.energy_max - energy_current
-
-                # 2) Power from this
-                # Efficiency: we need power at the charger -> divide
-                power_charge_max_0 = (
-                    delta_energy_charge_max_0 / battery.efficiency_charge / self.dt
-                )
-                power_charge_max_1 = (
-                    delta_energy_charge_max_1 / battery.efficiency_charge / self.dt
-                )
-
-                # 3) Difference between max charging power and current charging power
-                power_charge_max_2 = (
-                    battery.power_charge_max / battery.efficiency_charge - power_current
-                )
-
-                self.model.Add(
-                    self.flex_buffer * power_charge_max_0 >= self.flex_neg[i][t],
-                    f"constraint_flex_neg_1_{i}_{t}",
-                )
-                self.model.Add(
-                    self.flex_buffer * power_charge_max_1 >= self.flex_neg[i][t],
-                    f"constraint_flex_neg_2_{i}_{t}",
-                )
-                self.model.Add(
-                    power_charge_max_2 >= self.flex_neg[i][t],
-                    f"constraint_flex_neg_3_{i}_{t}",
-                )
+        for battery in self.model_batteries:
+            start = self.model.NumConstraints()
+            self._calc_neg_flex_battery(battery)
+            self._track_constraints(battery.id, start)
 
         # Sum flex over all batteries
         self.flex_neg_total = {
@@ -1035,13 +1512,94 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
             for t in range(self.n_t)
         }
 
-        for t in range(self.n_t):
-            # TODO: add grid efficiencies if different than 1 (as in Ladepark Duisburg)
+        # TODO: add grid efficiencies if different than 1 (as in Ladepark Duisburg)
+        self.constraints["flex_neg_total"] = [
             self.model.Add(
                 self.flex_neg_total[t]
-                == sum([self.flex_neg[battery.id][t] for battery in self.batteries]),
+                == sum(
+                    [self.flex_neg[battery.id][t] for battery in self.model_batteries]
+                ),
                 f"constraint_flex_neg_{t}",
             )
+            for t in range(self.n_t)
+        ]
+
+        return 0
+
+    def _calc_neg_flex_battery(self, battery: Battery):
+        """
+        Variables and constraints of the negative flexibility of a single battery, cf. _calc_neg_flex
+
+        Parameters
+        ----------
+        battery: Battery
+
+        Returns
+        -------
+
+        """
+        i = battery.id
+
+        # ---- Define Variables ----
+        # No flexibility can be offered by a battery that is not part of the sparse model at t
+        active = self._active_time_steps(battery)
+        self.flex_neg[i] = [
+            self.model.NumVar(0, self.model.infinity(), name=f"neg_flex_{i}_{t}")
+            if active[t]
+            else 0
+            for t in range(self.n_t)
+        ]
+
+        # ---- Fill Variables with life -----
+        dt = self.step_durations()
+        for t in range(self.n_t):
+            if not active[t]:
+                continue
+            energy_current = self.fleet_energy[i][t]
+            if t == 0:
+                energy_previous = battery.energy_start
+            else:
+                energy_previous = self.fleet_energy[i][t - 1]
+
+            # Current Power in our convention
+            # Here we need the power wrt to the grid rather than the charger -> Correct for efficiency
+            power_current = (
+                self.fleet_power[i]["charge"][t] / battery.efficiency_charge
+                - self.fleet_power[i]["discharge"][t] * battery.efficiency_discharge
+            )
+
+            # ---- Negative Flex -----
+
+            # 1) Energy that could maximally be charged:
+            delta_energy_charge_max_0 = battery.energy_max - energy_previous
+            delta_energy_charge_max_1 = battery.energy_max - energy_current
+
+            # 2) Power from this
+            # Efficiency: we need power at the charger -> divide
+            power_charge_max_0 = (
+                delta_energy_charge_max_0 / battery.efficiency_charge / dt[t]
+            )
+            power_charge_max_1 = (
+                delta_energy_charge_max_1 / battery.efficiency_charge / dt[t]
+            )
+
+            # 3) Difference between max charging power and current charging power
+            power_charge_max_2 = (
+                battery.power_charge_max / battery.efficiency_charge - power_current
+            )
+
+            self.model.Add(
+                self.flex_buffer * power_charge_max_0 >= self.flex_neg[i][t],
+                f"constraint_flex_neg_1_{i}_{t}",
+            )
+            self.model.Add(
+                self.flex_buffer * power_charge_max_1 >= self.flex_neg[i][t],
+                f"constraint_flex_neg_2_{i}_{t}",
+            )
+            self.model.Add(
+                power_charge_max_2 >= self.flex_neg[i][t],
+                f"constraint_flex_neg_3_{i}_{t}",
+            )
 
         return 0
 
@@ -1238,59 +1796,395 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
 
         return 0
 
-    def optimize(self):
-        # ------------------------------------------------
-        #  Initialize
-        # ------------------------------------------------
-        self.model = pywraplp.Solver(
-            "model", pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING
+    def _model_structure(self):
+        """
+        Everything an in-place update of prices cannot change. If this differs from the built model, a rebuild is
+        required.
+        """
+        return (
+            (self.tariffs_import is not None) or (self.tariffs_export is not None),
+            self.marketed_volumes is not None,
+            tuple(sorted(self._redundant_binaries().items())),
         )
 
-        self.model.Clear()
-        self.model.SuppressOutput()
-
-        # Initialize Basic Parameters
-        self._initialize_grid_power()
+    def _build_model(self):
+        """
+        Create a new solver and build the whole model from scratch
+        """
+        self._reset_model()
 
         # [OPTIONAL]
         if self.charging_points:
             self.assign_batteries_to_charging_point()
 
-        _ = [self._initialize_battery(battery) for battery in self.batteries]
+        self._check_feasibility()
 
-        self._initialize_fleet_power()
+        # Without any binaries left the problem is a pure LP
+        self.dropped_binaries = self._redundant_binaries()
+        self.solver_mode = "LP" if all(self.dropped_binaries.values()) else "MIP"
 
-        # Calculate the objective function parts depending on the setup
-        self._calc_objectives()
+        self.model_fingerprint = None
+        if self.model_cache is not None:
+            self.model_fingerprint = self.fingerprint()
+            if self._restore_model():
+                self._model_owner["owner"] = self._model_token
+                return 0
+
+        self.model = self.solver_settings.create_solver(self.solver_mode)
+        logger.debug(
+            f"Solver mode {self.solver_mode}, dropped binaries: {self.dropped_binaries}"
+        )
+
+        self.model.Clear()
+        self.model.SuppressOutput()
+
+        self._group_batteries()
+        self._set_battery_bounds(self.model_batteries)
+
+        if self.builder == "matrix":
+            # Assemble the whole model with NumPy and load it in bulk, objective included
+            builder = FleetMatrixBuilder(self)
+            builder.load(self.model, builder.build())
+        else:
+            # Initialize Basic Parameters
+            self._initialize_grid_power()
+
+            for battery in self.model_batteries:
+                start = self.model.NumConstraints()
+                self._initialize_battery(battery)
+                self._track_constraints(battery.id, start)
+
+            self._initialize_fleet_power()
+
+            # Calculate the objective function parts depending on the setup
+            self._calc_objectives()
 
-        # ------------------------------------------------
-        #  Optimizer
-        # ------------------------------------------------
         logger.debug(
             f"Model: constraints = {self.model.NumConstraints()} | variables = {self.model.NumVariables()} \n"
-            + f"time steps: {self.n_t} vehicles: {len(self.batteries)}"
+            + f"time steps: {self.n_t} vehicles: {len(self.model_batteries)}"
         )
         logger.debug(f"costs: {self.cost.keys()}")
 
-        self.model.Minimize(sum([sum(v) for v in self.cost.values()]))
+        if self.builder != "matrix":
+            self.model.Minimize(sum([sum(v) for v in self.cost.values()]))
+
+        self._built_structure = self._model_structure()
+        self._model_owner["owner"] = self._model_token
+
+        if self.model_cache is not None:
+            self.model_cache.put(
+                self.model_fingerprint,
+                {
+                    key: getattr(self, key)
+                    for key in MODEL_ATTRIBUTES
+                    if hasattr(self, key)
+                },
+            )
+
+        return 0
+
+    def fingerprint(self) -> str:
+        """
+        Hash of everything the structure of the model depends on: builder and formulation, time steps, batteries
+        including their connected masks, charging points, site limits, penalties and flags, the tariffs that enter
+        as coefficients (capacity, triad, flexibility) and the solver settings.
+
+        Energy tariffs, marketed volumes and the site load are not part of it as they can be patched into a built
+        model, cf. update_prices and update_site_load.
+
+        Returns
+        -------
+        str
+        """
+        charging_points = [
+            (
+                cp.asset_id,
+                cp.charging_power_kw,
+                cp.discharging_power_kw,
+                cp.expected_charging_efficiency,
+                cp.expected_discharging_efficiency,
+            )
+            for cp in self.charging_points or []
+        ]
+        inputs = {
+            "type": self.type,
+            "builder": self.builder,
+            "energy_formulation": self.energy_formulation,
+            "sparse_time": self.sparse_time,
+            "relax_binaries": self.relax_binaries,
+            "tighten_bounds": self.tighten_bounds,
+            "aggregate_batteries": self.aggregate_batteries,
+            "n_t": self.n_t,
+            "dt": self.dt,
+            "batteries": [
+                {"class": type(bat).__name__, **asdict(bat)} for bat in self.batteries
+            ],
+            "charging_points": charging_points,
+            "solver_settings": self.solver_settings.dict(),
+            "structure": self._model_structure(),
+            "fallbacks": self._fallbacks(),
+        }
+        for key in [
+            "site_load_restriction_charge",
+            "site_load_restriction_discharge",
+            "purchase_efficiency",
+            "feed_efficiency",
+            "limit_as_penalty",
+            "allow_curtailment",
+            "fully_charged_as_penalty",
+            "single_continuous_session_allowed",
+            "penalize_spiky_behaviour",
+            "include_battery_costs",
+            "symmetrical_flex",
+            "flex_buffer",
+            "marketed_flex_coeff",
+            "limit_purchase_penalty",
+            "fully_charged_penalty",
+            "spiky_behaviour_penalty",
+            "capacity_tariffs_import",
+            "capacity_tariffs_export",
+            "triad_tariffs_import",
+            "triad_tariffs_export",
+            "prices_flex_pos",
+            "prices_flex_neg",
+            "marketed_flex_pos",
+            "marketed_flex_neg",
+            "mask_flex_pos",
+            "mask_flex_neg",
+        ]:
+            inputs[key] = getattr(self, key)
+
+        return hash_inputs(inputs)
+
+    def derive(self, **changes) -> "FleetOptimizationOR":
+        """
+        Copy of the optimizer with some inputs replaced and without a model, e.g. a window of the horizon (cf.
+        rolling_horizon) or a coarser time grid (cf. time_grid.coarsen). Prices, flags and settings are shared with
+        the original, the built model and its results are not.
+
+        Parameters
+        ----------
+        changes
+            Attributes to replace, e.g. n_t, dt, batteries, tariffs_import
+
+        Returns
+        -------
+        FleetOptimizationOR
+        """
+        derived = copy.copy(self)
+        for key, value in changes.items():
+            setattr(derived, key, value)
+        derived.batteries = list(derived.batteries)
+        derived.model_batteries = derived.batteries
+        derived.battery_groups = {}
+        derived.model = None
+        derived._built_structure = None
+        derived.model_fingerprint = None
+        derived.results = {}
+        derived._reset_model()
+
+        return derived
+
+    def add_model_cache(self, model_cache: ModelCache):
+        """
+        Reuse built models across optimizations. Before building, the fingerprint of the optimizer is looked up in
+        model_cache: if a model with the same structure was built before, it is taken from the cache and only the
+        energy tariffs, marketed volumes and the site load are patched in place. Otherwise the model is built and
+        stored.
+
+        The cached model is shared: it holds the prices and site load of the optimizer that took or updated it last.
+        Updates and resolve() of another optimizer sharing it patch its own values first. Attaching or retiring
+        batteries changes the model in place and removes it from the cache, the other optimizers sharing it rebuild
+        on their next resolve().
+
+        Parameters
+        ----------
+        model_cache: ModelCache
+
+        Returns
+        -------
+
+        """
+        self.model_cache = model_cache
+
+        return 0
+
+    def _restore_model(self) -> bool:
+        """
+        Take the model with the fingerprint of the optimizer from the cache and patch prices and site load
+
+        Returns
+        -------
+        bool
+            False if the cache holds no such model
+        """
+        state = self.model_cache.get(self.model_fingerprint)
+        if state is None:
+            return False
+
+        self.__dict__.update(state)
+        self._group_batteries()
+        self._patch_prices()
+        self._patch_site_load()
+        logger.debug(
+            f"Model {self.model_fingerprint[:12]} taken from the cache: constraints = "
+            f"{self.model.NumConstraints()} | variables = {self.model.NumVariables()}"
+        )
+
+        return True
+
+    def _discard_cached_model(self):
+        """
+        Remove the model from the cache before it is changed in place
+        """
+        if self.model_cache is not None and self.model_fingerprint is not None:
+            self.model_cache.discard(self.model_fingerprint)
+            self.model_fingerprint = None
+            # Other optimizers sharing the model can no longer use it
+            self._model_owner["changed"] = True
+            self._model_owner = {"owner": self._model_token}
+
+        return 0
+
+    def _claim_model(self):
+        """
+        Patch prices and site load of this optimizer into a built model that is shared through the model cache and was
+        last patched by another optimizer. If another optimizer changed the model in place (cf. attach_battery), it
+        is rebuilt instead on the next resolve().
+        """
+        if self.model is None or self._model_owner.get("owner") is self._model_token:
+            return 0
+        if self._model_owner.get("changed"):
+            logger.debug("Shared model changed by another optimizer, rebuild required")
+            self._built_structure = None
+            return 0
+
+        self._patch_site_load()
+        self._patch_prices()
+        self._model_owner["owner"] = self._model_token
+        return 0
+
+    def add_model_export(self, path: str, file_format: str = "mps"):
+        """
+        Write every model to disk right before it is solved, with prices and site load as solved, together with a
+        json file holding the fingerprint of the inputs (cf. fingerprint), the solver mode and settings. The path of
+        the last file is kept as exported_model. Exported models can be solved offline with other solver settings,
+        cf. model_export.replay.
+
+        Parameters
+        ----------
+        path: str
+            Directory of the files, one file per solve named after the site id and the time of the export
+        file_format: str
+            "mps" or "proto" (serialized MPModelProto)
+
+        Returns
+        -------
+
+        """
+        if file_format not in FILE_FORMATS:
+            raise ValueError(f"file_format must be one of {list(FILE_FORMATS)}")
+        os.makedirs(path, exist_ok=True)
+        self.model_export = (path, file_format)
+
+        return 0
+
+    def _export_model(self):
+        """
+        Write the current model to disk, cf. add_model_export
+        """
+        path, file_format = self.model_export
+        name = f"model_site_{self.id}_{pd.Timestamp.now():%Y%m%dT%H%M%S%f}"
+        self.exported_model = export_model(
+            self.model,
+            os.path.join(path, name),
+            file_format=file_format,
+            metadata={
+                "fingerprint": self.model_fingerprint or self.fingerprint(),
+                "id": self.id,
+                "start": None
+                if self.date_range is None
+                else pd.Timestamp(self.date_range[0]).isoformat(),
+                "n_t": self.n_t,
+                "dt": np.asarray(self.dt).tolist(),
+                "batteries": len(self.batteries),
+                "builder": self.builder,
+                "solver_mode": self.solver_mode,
+                "solver_settings": self.solver_settings.dict(),
+            },
+        )
+
+        return 0
+
+    def add_hint_store(self, hint_store: HintStore, elapsed_steps: int = None):
+        """
+        Warm start from the previous solution of this site (same id). Before solving, the solution stored in
+        hint_store is shifted by the elapsed time steps and passed to the solver as hint. After solving, the new
+        solution is stored for the next request.
+
+        Hints are used by SCIP, cf. SolverSettings.mip_backend. The CBC interface of ortools ignores them.
+
+        Parameters
+        ----------
+        hint_store: HintStore
+        elapsed_steps: int
+            Time steps between the stored solution and this optimization. If None, it is derived from the date
+            ranges of both.
+
+        Returns
+        -------
+
+        """
+        self.hint_store = hint_store
+        self.hint_elapsed_steps = elapsed_steps
+
+        return 0
+
+    def _solve(self):
+        """
+        Solve the current model and parse the result
+        """
+        if self.hint_store is not None:
+            variables, values = self.hint_store.hint(self, self.hint_elapsed_steps)
+            if variables:
+                self.model.SetHint(variables, values)
+        if self.model_export is not None:
+            self._export_model()
 
         start_solving = pd.Timestamp.now()
 
         # self.model.EnableOutput()
-        self.status = self.model.Solve()
+        if self.precheck_failed:
+            logger.warning("Feasibility check failed, the model is not solved")
+            self.status = pywraplp.Solver.INFEASIBLE
+        else:
+            self.status = self.model.Solve(self.solver_settings.parameters())
 
         self.solve_time = pd.Timedelta(
             pd.Timestamp.now() - start_solving
         ).total_seconds()
+        # In anytime mode the best incumbent of a solve stopped at the limit is used as well
+        self.has_solution = self.status == pywraplp.Solver.OPTIMAL or (
+            self.solver_settings.anytime and self.status == pywraplp.Solver.FEASIBLE
+        )
         self.objective_value = (
-            self.model.Objective().Value() if self.status == 0 else np.nan
+            self.model.Objective().Value() if self.has_solution else np.nan
         )
+        self._solver_statistics()
 
-        if self.status == 0:
-            logger.debug(
-                f"Problem solved | {self.model.wall_time()} milliseconds | "
-                f"{self.model.iterations()} iterations"
-            )
+        if self.has_solution:
+            if self.status == pywraplp.Solver.OPTIMAL:
+                logger.debug(
+                    f"Problem solved | {self.model.wall_time()} milliseconds | "
+                    f"{self.model.iterations()} iterations"
+                )
+            else:
+                logger.warning(
+                    f"Solver stopped at the limit, using the best incumbent | objective {self.objective_value}, "
+                    f"bound {self.best_bound}, gap {self.mip_gap:.2%}"
+                )
+            if self.hint_store is not None:
+                self.hint_store.save(self)
         else:
             logger.warning("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
             logger.warning("Not solved! Assign linear charging")
@@ -1299,12 +2193,540 @@ class FleetOptimizationOR(FleetOptimizationBaseclass):
         # ------------------------------------------------
         #  Parse Result
         # ------------------------------------------------
+        results = self.__dict__
+        if self.battery_groups and self.has_solution:
+            results = self._disaggregate()
         result = SiteResult.create(
-            self.__dict__, optimizer="or", default_strategy=self.default_strategy
+            results, optimizer="or", default_strategy=self.default_strategy
         )
 
         return result
 
+    def _disaggregate(self) -> Dict:
+        """
+        The attributes of the optimizer with the solution of each virtual battery split equally among its group,
+        cf. _group_batteries. The model itself is left as it is.
+        """
+
+        def value(x):
+            return x.solution_value() if hasattr(x, "solution_value") else float(x)
+
+        fleet_power = dict(self.fleet_power)
+        fleet_energy = dict(self.fleet_energy)
+        fleet_bool = dict(self.fleet_bool)
+        for i, group in self.battery_groups.items():
+            k = len(group)
+            power = {
+                key: {t: value(x) / k for t, x in shell.items()}
+                for key, shell in fleet_power.pop(i).items()
+            }
+            energy = {t: value(x) / k for t, x in fleet_energy.pop(i).items()}
+            fleet_bool.pop(i, None)
+            for battery in group:
+                fleet_power[battery.id] = power
+                fleet_energy[battery.id] = energy
+
+        return {
+            **self.__dict__,
+            "fleet_power": fleet_power,
+            "fleet_energy": fleet_energy,
+            "fleet_bool": fleet_bool,
+        }
+
+    def _solver_statistics(self):
+        """
+        Best bound, relative gap between the incumbent and the best bound, and whether the solve stopped at the
+        time limit
+        """
+        self.limit_reached = self.solver_settings.time_limit is not None and (
+            self.status in [pywraplp.Solver.FEASIBLE, pywraplp.Solver.NOT_SOLVED]
+        )
+
+        self.best_bound = np.nan
+        self.mip_gap = np.nan
+        if self.status in [pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE]:
+            if self.solver_mode == "LP":
+                self.best_bound = self.model.Objective().Value()
+                self.mip_gap = 0.0
+            else:
+                value = self.model.Objective().Value()
+                bound = self.model.Objective().BestBound()
+                self.best_bound = bound
+                # Some backends report a missing bound as a huge finite number (SCIP: 1e20)
+                if max(abs(value), abs(bound)) < 1e19:
+                    self.mip_gap = abs(value - bound) / max(abs(value), 1e-9)
+                else:
+                    self.mip_gap = np.inf
+
+        return 0
+
+    def optimize(self):
+        """
+        Build the model from scratch and solve it
+
+        Returns
+        -------
+        SiteResult
+        """
+        if self.compress_time and self._compressible():
+            return self._optimize_compressed()
+        self._build_model()
+        return self._solve()
+
+    def _compressible(self) -> bool:
+        """
+        Whether merging time steps with constant inputs keeps the optimum: any schedule can then be replaced by its
+        average over the merged steps at no extra cost. This holds for a pure LP (cf. _redundant_binaries), but not
+        for the flexibility limits, which depend on the duration of a step, nor for the spiky penalty.
+        """
+        flex = any(
+            x is not None
+            for x in [
+                self.prices_flex_pos,
+                self.prices_flex_neg,
+                self.marketed_flex_pos,
+                self.marketed_flex_neg,
+            ]
+        )
+        compressible = (
+            all(self._redundant_binaries().values())
+            and not flex
+            and not self.penalize_spiky_behaviour
+            and not self.charging_points
+        )
+        if not compressible:
+            logger.debug(
+                "Time steps are not merged: binaries, flex, spiky penalty or charging points in the model"
+            )
+        return compressible
+
+    def _optimize_compressed(self) -> SiteResult:
+        """
+        Optimize on the grid of constant blocks and expand the result to the original time steps, cf.
+        compress_time
+        """
+        from battery_management.optimizer.time_grid import coarsen, constant_blocks
+
+        groups = constant_blocks(self)
+        compressed = coarsen(self, groups)
+        compressed.compress_time = False
+        compressed.calculate_savings = False
+        compressed.save_file = None
+        # Hints are stored per time step of the original grid
+        compressed.hint_store = None
+        logger.debug(f"Time steps merged from {self.n_t} to {compressed.n_t}")
+
+        result = compressed.optimize()
+        for key in [
+            "status",
+            "solve_time",
+            "has_solution",
+            "objective_value",
+            "best_bound",
+            "mip_gap",
+            "limit_reached",
+            "solver_mode",
+            "dropped_binaries",
+            "feasibility_check",
+            "precheck_failed",
+        ]:
+            setattr(self, key, getattr(compressed, key))
+
+        return result.expand(
+            groups,
+            self.dt,
+            date_range=self.date_range,
+            batteries=self.batteries,
+            calculate_savings=self.calculate_savings,
+            save_file=self.save_file,
+        )
+
+    def update_prices(
+        self,
+        tariffs_import: np.array = None,
+        tariffs_export: np.array = None,
+        marketed_volumes: np.array = None,
+    ):
+        """
+        Update energy tariffs and marketed volumes of an already built model in place: only the coefficients and
+        right hand sides of the cost constraints (const_tariff_var_{t}, marketed_volumes_diff_{t}) are changed.
+        Call resolve() afterwards.
+
+        If the update affects the structure of the model (tariffs or marketed volumes that were not part of the
+        built model, or binaries that are no longer redundant) the next resolve() rebuilds the model instead.
+
+        Parameters
+        ----------
+        tariffs_import : np.array
+            time series of prices for purchasing energy from the grid
+        tariffs_export : np.array
+            time series of prices for feeding energy into the grid
+        marketed_volumes: np.array
+            Time series for marketed volumes, cf. add_marketed_volumes
+
+        Returns
+        -------
+
+        """
+        self.add_prices(tariffs_import=tariffs_import, tariffs_export=tariffs_export)
+        if marketed_volumes is not None:
+            self.add_marketed_volumes(marketed_volumes)
+        self._claim_model()
+
+        if self.model is None or self._model_structure() != self._built_structure:
+            logger.debug("Price update changes the model structure, rebuild required")
+            return 0
+
+        return self._patch_prices()
+
+    def update_site_load(self, site_load: np.array):
+        """
+        Update the site load of an already built model in place: only the right hand sides of the electricity
+        balance (overall_electricity_balance_{t}) and of the cost constraints (const_tariff_var_{t},
+        constraint_triad_{t}) are changed. Call resolve() afterwards.
+
+        If the new site load changes the outcome of the feasibility check (cf. _check_feasibility) so that targets
+        are clipped or penalties switched on or off, the next resolve() rebuilds the model instead.
+
+        Parameters
+        ----------
+        site_load: np.array
+            Time series of the site load, cf. add_site_load
+
+        Returns
+        -------
+
+        """
+        self.add_site_load(site_load)
+        self._claim_model()
+        fallbacks = self._fallbacks()
+        self._check_feasibility()
+
+        if (
+            self.model is None
+            or self._built_structure is None
+            or fallbacks != self._fallbacks()
+        ):
+            logger.debug(
+                "Site load update changes the model structure, rebuild required"
+            )
+            self._built_structure = None
+            return 0
+
+        self._patch_site_load()
+        return self._patch_prices()
+
+    def _patch_site_load(self):
+        """
+        Set the right hand sides that depend on the site load, except for the energy tariffs (cf. _patch_prices)
+        """
+        site_load = (
+            np.zeros(self.n_t)
+            if self.site_load is None
+            else np.asarray(self.site_load, dtype=float)
+        )
+
+        # purchase * efficiency + discharge - feed / efficiency - curtail - charge == site_load[t]
+        for t, constraint in enumerate(
+            self.constraints.get("overall_electricity_balance", [])
+        ):
+            constraint.SetBounds(site_load[t], site_load[t])
+
+        # cost[t] - triad_import * dt * purchase[t] + triad_export * dt * feed[t] == -triad_import * dt * site_load
+        dt = self.step_durations()
+        if self.triad_tariffs_import is not None:
+            triad_import = np.asarray(self.triad_tariffs_import, dtype=float)
+            for t, constraint in enumerate(self.constraints.get("cost_triad", [])):
+                rhs = -triad_import[t] * site_load[t] * dt[t]
+                constraint.SetBounds(rhs, rhs)
+
+        return 0
+
+    def _patch_prices(self):
+        """
+        Set coefficients and right hand sides of the cost constraints from the current energy tariffs and marketed
+        volumes, cf. update_prices
+        """
+
+        def as_array(x):
+            return np.zeros(self.n_t) if x is None else np.asarray(x, dtype=float)
+
+        mm = as_array(self.mask_marketed)
+        site_load = as_array(self.site_load)
+        site_load_pos = np.where(site_load > 0, site_load, 0)
+        site_load_neg = np.where(site_load < 0, -site_load, 0)
+        dt = self.step_durations()
+        coeff_import = (1 - mm) * as_array(self.tariffs_import) * dt
+        coeff_export = (1 - mm) * as_array(self.tariffs_export) * dt
+
+        # cost[t] - coeff_import * purchase[t] + coeff_export * feed[t] == rhs[t]
+        for t, constraint in enumerate(self.constraints.get("const_tariff_var", [])):
+            constraint.SetCoefficient(self.grid_power["purchase"][t], -coeff_import[t])
+            constraint.SetCoefficient(self.grid_power["feed"][t], coeff_export[t])
+            rhs = (
+                -coeff_import[t] * site_load_pos[t] + coeff_export[t] * site_load_neg[t]
+            )
+            constraint.SetBounds(rhs, rhs)
+
+        # -dt * (charge[t] - discharge[t]) - diff_pos[t] + diff_neg[t] == -marketed[t] where volumes are marketed,
+        # - diff_pos[t] + diff_neg[t] == 0 otherwise
+        volumes = np.where(mm > 0, as_array(self.marketed_volumes), 0)
+        for t, constraint in enumerate(
+            self.constraints.get("marketed_volumes_diff", [])
+        ):
+            constraint.SetCoefficient(self.marketed_volumes_diff["pos"][t], -1)
+            constraint.SetCoefficient(self.marketed_volumes_diff["neg"][t], 1)
+            for battery in self.model_batteries:
+                self._set_power_coefficients(
+                    constraint, battery.id, t, -dt[t] * mm[t], dt[t] * mm[t]
+                )
+            constraint.SetBounds(-volumes[t], -volumes[t])
+
+        return 0
+
+    def resolve(self):
+        """
+        Solve the model again after in place updates (cf. update_prices). Rebuilds the model if there is none yet
+        or the structure changed. A model shared through the model cache gets the prices and site load of this
+        optimizer first, cf. _claim_model.
+
+        Returns
+        -------
+        SiteResult
+        """
+        self._claim_model()
+        if self.model is None or self._model_structure() != self._built_structure:
+            return self.optimize()
+        return self._solve()
+
+    # ---------------------------------------------------
+    #  Live model: attach and retire batteries
+    # ---------------------------------------------------
+
+    def _set_power_coefficients(
+        self, constraint, battery_id: int, t: int, charge: float, discharge: float
+    ):
+        """
+        Set the coefficients of the (dis-)charging power of a battery at time step t in a constraint
+        """
+        for key, coefficient in [("charge", charge), ("discharge", discharge)]:
+            power = self.fleet_power[battery_id][key][t]
+            # Constants of a sparse model have no coefficient
+            if isinstance(power, pywraplp.Variable):
+                constraint.SetCoefficient(power, coefficient)
+
+    def _set_shared_terms(self, battery: Battery, scale: float = 1):
+        """
+        Set the terms of a battery in the constraints shared by the whole fleet: overall electricity balance,
+        marketed volumes, spiky behaviour and flex totals. scale=0 removes the terms.
+        """
+        i = battery.id
+        mm = (
+            np.zeros(self.n_t)
+            if self.mask_marketed is None
+            else np.asarray(self.mask_marketed, dtype=float)
+        )
+        dt = self.step_durations()
+        for t, constraint in enumerate(
+            self.constraints.get("overall_electricity_balance", [])
+        ):
+            self._set_power_coefficients(
+                constraint,
+                i,
+                t,
+                -scale / battery.efficiency_charge,
+                scale * battery.efficiency_discharge,
+            )
+        for t, constraint in enumerate(
+            self.constraints.get("marketed_volumes_diff", [])
+        ):
+            self._set_power_coefficients(
+                constraint, i, t, -scale * dt[t] * mm[t], scale * dt[t] * mm[t]
+            )
+        for t, constraint in enumerate(self.constraints.get("fleet_power_diff", [])):
+            self._set_power_coefficients(constraint, i, t + 1, scale, -scale)
+            self._set_power_coefficients(constraint, i, t, -scale, scale)
+        for direction in ["pos", "neg"]:
+            flex = getattr(self, f"flex_{direction}").get(i)
+            for t, constraint in enumerate(
+                self.constraints.get(f"flex_{direction}_total", [])
+            ):
+                if isinstance(flex[t], pywraplp.Variable):
+                    constraint.SetCoefficient(flex[t], -scale)
+
+    def _battery_variables(self, battery_id: int):
+        """
+        All solver variables of a battery except the energy
+        """
+        variables = [
+            value
+            for values in self.fleet_power[battery_id].values()
+            for value in values.values()
+        ]
+        for values in self.fleet_bool.get(battery_id, {}).values():
+            variables += list(values.values())
+        variables += self.flex_pos.get(battery_id, []) + self.flex_neg.get(
+            battery_id, []
+        )
+        if battery_id in getattr(self, "battery_costs", {}):
+            variables.append(self.battery_costs[battery_id])
+        return [var for var in variables if isinstance(var, pywraplp.Variable)]
+
+    def attach_battery(self, battery: Battery):
+        """
+        Add a battery to the built model. Only the variables and constraints of this battery are created, and its
+        terms are added to the constraints shared by the fleet (overall_electricity_balance_{t}, marketed volumes,
+        spiky behaviour, flex totals) and to the objective. Call resolve() afterwards.
+
+        Without a built model, with charging points or aggregated batteries or if the battery changes the structure
+        of the model (e.g. it needs binaries that were dropped) the battery is only added and the next resolve()
+        rebuilds the model.
+
+        Parameters
+        ----------
+        battery: Battery
+
+        Returns
+        -------
+
+        """
+        if battery.id in [bat.id for bat in self.batteries]:
+            raise ValueError(
+                f"Battery {battery.id} is already part of the optimization."
+            )
+        self.add_battery(battery)
+        self._claim_model()
+        fallbacks = self._fallbacks(exclude=battery.id)
+        self._check_feasibility()
+
+        if (
+            self.model is None
+            or fallbacks != self._fallbacks(exclude=battery.id)
+            or self.charging_points
+            or self.battery_groups
+            or self._model_structure() != self._built_structure
+        ):
+            self._built_structure = None
+            return 0
+
+        self._discard_cached_model()
+        self.model_batteries = self._clipped_batteries()
+        # As modelled, with a clipped target
+        battery = self.model_batteries[-1]
+        i = battery.id
+        objective = self.model.Objective()
+        n_penalties = len(self.cost.get("fully_charged_penalty", []))
+
+        self._set_battery_bounds([battery])
+        start = self.model.NumConstraints()
+        self._initialize_battery(battery)
+        self._track_constraints(i, start)
+        self._calc_sum_power_fleet()
+
+        if "flex_pos_total" in self.constraints:
+            start = self.model.NumConstraints()
+            self._calc_pos_flex_battery(battery)
+            self._track_constraints(i, start)
+        if "flex_neg_total" in self.constraints:
+            start = self.model.NumConstraints()
+            self._calc_neg_flex_battery(battery)
+            self._track_constraints(i, start)
+        self._set_shared_terms(battery)
+
+        # Objective: cost terms of the new battery
+        terms = self.cost.get("fully_charged_penalty", [])[n_penalties:]
+        if self.include_battery_costs:
+            start = self.model.NumConstraints()
+            self._calc_battery_cost(battery)
+            self._track_constraints(i, start)
+            self.cost["battery_costs"].append(self.battery_costs[i])
+            terms.append(self.battery_costs[i])
+        for term in terms:
+            for var, coefficient in term.GetCoeffs().items():
+                if var is pywraplp.OFFSET_KEY:
+                    objective.SetOffset(objective.offset() + coefficient)
+                else:
+                    objective.SetCoefficient(
+                        var, objective.GetCoefficient(var) + coefficient
+                    )
+
+        return 0
+
+    def retire_battery(self, battery_id: int):
+        """
+        Remove a battery from the built model. Variables cannot be deleted from the solver, so the battery's
+        variables are fixed (power and flexibility to 0, energy to energy_start), its own constraints are emptied and
+        its terms are removed from the shared constraints and the objective. Call resolve() afterwards.
+
+        Without a built model, with charging points or aggregated batteries or if the structure of the model
+        changes, the battery is only removed and the next resolve() rebuilds the model.
+
+        Parameters
+        ----------
+        battery_id: int
+
+        Returns
+        -------
+
+        """
+        battery = next((bat for bat in self.batteries if bat.id == battery_id), None)
+        if battery is None:
+            raise ValueError(f"Battery {battery_id} is not part of the optimization.")
+        self.batteries.remove(battery)
+        self._claim_model()
+        fallbacks = self._fallbacks(exclude=battery_id)
+        penalized = self._target_as_penalty(battery_id)
+        battery = next(
+            (bat for bat in self.model_batteries if bat.id == battery_id), battery
+        )
+        self._check_feasibility()
+
+        if (
+            self.model is None
+            or fallbacks != self._fallbacks()
+            or self.charging_points
+            or self.battery_groups
+            or self._model_structure() != self._built_structure
+        ):
+            self._built_structure = None
+            return 0
+
+        self._discard_cached_model()
+        self.model_batteries = self._clipped_batteries()
+        self._set_shared_terms(battery, scale=0)
+
+        for k in self.battery_constraints.pop(battery_id, []):
+            constraint = self.model.constraint(k)
+            constraint.Clear()
+            constraint.SetBounds(-self.model.infinity(), self.model.infinity())
+
+        objective = self.model.Objective()
+        for var in self._battery_variables(battery_id):
+            var.SetBounds(0, 0)
+            objective.SetCoefficient(var, 0)
+        for energy in self.fleet_energy[battery_id].values():
+            if isinstance(energy, pywraplp.Variable):
+                energy.SetBounds(battery.energy_start, battery.energy_start)
+
+        # With the energy fixed, what remains of the penalty for not reaching energy_end is a constant
+        if penalized and not battery.stationary and battery.is_connected():
+            objective.SetOffset(
+                objective.offset()
+                - (battery.energy_end - battery.energy_start)
+                * self.fully_charged_penalty
+            )
+
+        if battery_id in getattr(self, "battery_costs", {}):
+            self.cost["battery_costs"].remove(self.battery_costs.pop(battery_id))
+        for shell in [self.fleet_power, self.fleet_energy, self.fleet_bool]:
+            shell.pop(battery_id, None)
+        self.flex_pos.pop(battery_id, None)
+        self.flex_neg.pop(battery_id, None)
+        self.battery_bounds.pop(battery_id, None)
+        self._calc_sum_power_fleet()
+
+        return 0
+
 
 def main():
     x = np.linspace(0, 2 * np.pi, 30)
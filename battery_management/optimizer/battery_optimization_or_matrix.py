@@ -0,0 +1,866 @@
+from typing import Dict, List
+
+import numpy as np
+import scipy.sparse as sp
+from loguru import logger
+from ortools.linear_solver import linear_solver_pb2, pywraplp
+from ortools.linear_solver.python import model_builder_helper
+
+
+class SparseModel:
+    """
+    Container collecting a linear (mixed-integer) model as NumPy blocks. Variables and constraints are added in
+    whole blocks, the coefficients as (row, column, value) triplets. The model is converted into a CSR matrix and
+    an MPModelProto in a single pass, which avoids creating one Python object per variable and constraint.
+    """
+
+    def __init__(self):
+        self.n_var = 0
+        self.n_row = 0
+        self.objective_offset = 0.0
+
+        self._var_lb = []
+        self._var_ub = []
+        self._var_integer = []
+        self._row_lb = []
+        self._row_ub = []
+        self._rows = []
+        self._cols = []
+        self._vals = []
+        self._obj_cols = []
+        self._obj_vals = []
+
+    @staticmethod
+    def _block(n_start: int, shape, mask) -> np.ndarray:
+        if mask is None:
+            return n_start + np.arange(int(np.prod(shape))).reshape(shape)
+        mask = np.broadcast_to(np.asarray(mask, dtype=bool), shape)
+        index = np.full(shape, -1, dtype=int)
+        index[mask] = n_start + np.arange(int(mask.sum()))
+        return index
+
+    @staticmethod
+    def _select(values, index: np.ndarray) -> np.ndarray:
+        return np.broadcast_to(np.asarray(values, dtype=float), index.shape)[index >= 0]
+
+    def add_variables(
+        self, shape, lb=0.0, ub=np.inf, integer: bool = False, mask=None
+    ) -> np.ndarray:
+        """
+        Add a block of variables
+
+        Parameters
+        ----------
+        shape: int or tuple
+            shape of the block, e.g. (n_batteries, n_t)
+        lb: float or np.array
+            lower bounds, broadcast to shape
+        ub: float or np.array
+            upper bounds, broadcast to shape
+        integer: bool
+            whether the variables are integer (together with bounds [0, 1] this gives booleans)
+        mask: np.array, optional
+            if given, variables are only created where the mask is True
+
+        Returns
+        -------
+        np.ndarray
+            indices of the new variables with the given shape, -1 where masked out
+        """
+        index = self._block(self.n_var, shape, mask)
+        n = int(np.sum(index >= 0))
+        self.n_var += n
+        self._var_lb.append(self._select(lb, index))
+        self._var_ub.append(self._select(ub, index))
+        self._var_integer.append(np.full(n, integer))
+        return index
+
+    def add_constraints(self, shape, lb=-np.inf, ub=np.inf, mask=None) -> np.ndarray:
+        """
+        Add a block of constraints lb <= a * x <= ub. The coefficients are added with add_terms.
+
+        Returns
+        -------
+        np.ndarray
+            indices of the new constraints with the given shape, -1 where masked out
+        """
+        index = self._block(self.n_row, shape, mask)
+        self.n_row += int(np.sum(index >= 0))
+        self._row_lb.append(self._select(lb, index))
+        self._row_ub.append(self._select(ub, index))
+        return index
+
+    def add_terms(self, rows, cols, vals=1.0):
+        """
+        Add coefficients to the constraint matrix. rows, cols and vals are broadcast against each other,
+        duplicate entries are summed up. Entries with a masked out (-1) row or column are dropped.
+        """
+        rows, cols, vals = np.broadcast_arrays(
+            rows, cols, np.asarray(vals, dtype=float)
+        )
+        keep = (rows >= 0) & (cols >= 0)
+        self._rows.append(rows[keep])
+        self._cols.append(cols[keep])
+        self._vals.append(vals[keep])
+
+    def add_objective(self, cols, vals=1.0):
+        """
+        Add coefficients to the (minimized) objective function, duplicate entries are summed up. Masked out (-1)
+        columns are dropped.
+        """
+        cols, vals = np.broadcast_arrays(cols, np.asarray(vals, dtype=float))
+        keep = cols >= 0
+        self._obj_cols.append(cols[keep])
+        self._obj_vals.append(vals[keep])
+
+    @staticmethod
+    def _concat(blocks: List[np.ndarray], dtype=float) -> np.ndarray:
+        if len(blocks) == 0:
+            return np.array([], dtype=dtype)
+        return np.concatenate([np.ravel(b) for b in blocks]).astype(dtype)
+
+    def constraint_matrix(self) -> sp.csr_matrix:
+        return sp.csr_matrix(
+            (
+                self._concat(self._vals),
+                (self._concat(self._rows, int), self._concat(self._cols, int)),
+            ),
+            shape=(self.n_row, self.n_var),
+        )
+
+    def objective(self) -> np.ndarray:
+        return np.bincount(
+            self._concat(self._obj_cols, int),
+            weights=self._concat(self._obj_vals),
+            minlength=self.n_var,
+        )
+
+    def to_proto(self, name: str = "model") -> linear_solver_pb2.MPModelProto:
+        """
+        Convert the collected blocks into an MPModelProto (minimization)
+        """
+        helper = model_builder_helper.ModelBuilderHelper()
+        helper.set_name(name)
+        helper.fill_model_from_sparse_data(
+            self._concat(self._var_lb),
+            self._concat(self._var_ub),
+            self.objective(),
+            self._concat(self._row_lb),
+            self._concat(self._row_ub),
+            self.constraint_matrix(),
+        )
+        for i in np.flatnonzero(self._concat(self._var_integer, bool)):
+            helper.set_var_integrality(int(i), True)
+        helper.set_objective_offset(self.objective_offset)
+        return model_builder_helper.to_mpmodel_proto(helper)
+
+
+class FleetMatrixBuilder:
+    """
+    Bulk builder for the model of FleetOptimizationOR. Instead of creating every variable and constraint through
+    pywraplp, the variable bounds, the constraint matrix (CSR) and the objective vector are put together with NumPy
+    for the whole fleet at once and loaded into the solver as MPModelProto.
+
+    The model is the same as the one of the expression builder, with one difference in the formulation: the energy
+    content is an explicit state variable per time step linked by a balance equality, as the cumulative expressions
+    would create a dense lower-triangular matrix. The feasible set of the power variables and with it the optimum
+    are identical.
+
+    After loading, the parameter shells of the optimizer (fleet_power, grid_power, cost, ...) are filled with the
+    solver variables so that SiteResultOR can be used as before. Cost entries hold the variables carrying the
+    objective terms, the coefficients live in the model objective.
+    """
+
+    def __init__(self, optimizer):
+        self.optimizer = optimizer
+        self.sparse = SparseModel()
+        self.index: Dict[str, np.ndarray] = {}
+        self.rows: Dict[str, np.ndarray] = {}
+        # (battery, row) pairs of the constraints that belong to a single battery
+        self.battery_rows: List[np.ndarray] = []
+
+        fo = optimizer
+        self.n_t = fo.n_t
+        # One duration per time step, cf. FleetOptimizationBaseclass.step_durations
+        self.dt = fo.step_durations()
+        self.batteries = fo.model_batteries
+        self.n_b = len(self.batteries)
+
+        def attr(name):
+            return np.array([getattr(bat, name) for bat in self.batteries], dtype=float)
+
+        self.power_charge_max = attr("power_charge_max")
+        self.power_discharge_max = attr("power_discharge_max")
+        self.power_charge_min = attr("power_charge_min")
+        self.energy_min = attr("energy_min")
+        self.energy_max = attr("energy_max")
+        self.energy_start = attr("energy_start")
+        self.energy_end = attr("energy_end")
+        self.efficiency_charge = attr("efficiency_charge")
+        self.efficiency_discharge = attr("efficiency_discharge")
+        self.target_as_penalty = np.array(
+            [fo._target_as_penalty(bat.id) for bat in self.batteries], dtype=bool
+        )
+        self.stationary = np.array(
+            [bat.stationary for bat in self.batteries], dtype=bool
+        )
+        self.connected = np.array(
+            [np.asarray(bat.connected, dtype=bool) for bat in self.batteries]
+        ).reshape(self.n_b, self.n_t)
+        # Battery variables only exist where active, cf. FleetOptimizationOR sparse_time
+        self.active = (
+            self.connected.copy()
+            if fo.sparse_time
+            else np.ones((self.n_b, self.n_t), dtype=bool)
+        )
+
+    # ---------------------------------------------------
+    #  Build
+    # ---------------------------------------------------
+
+    def _add_battery_rows(self, rows: np.ndarray, batteries: np.ndarray = None):
+        """
+        Register a block of constraints as belonging to single batteries, by default along the first axis
+        """
+        if batteries is None:
+            batteries = np.arange(self.n_b).reshape((-1,) + (1,) * (rows.ndim - 1))
+        batteries, rows = np.broadcast_arrays(batteries, rows)
+        self.battery_rows.append(np.stack([batteries.ravel(), rows.ravel()]))
+
+    def build(self) -> linear_solver_pb2.MPModelProto:
+        """
+        Collect the whole model and return it as MPModelProto
+        """
+        fo = self.optimizer
+
+        self._add_grid_power()
+        self._add_batteries()
+        self._add_fleet_power()
+
+        if (fo.tariffs_export is not None) or (fo.tariffs_import is not None):
+            self._add_cost_prices()
+        if (fo.triad_tariffs_export is not None) or (
+            fo.triad_tariffs_import is not None
+        ):
+            self._add_cost_triad()
+        if (fo.capacity_tariffs_export is not None) or (
+            fo.capacity_tariffs_import is not None
+        ):
+            self._add_capacity_prices()
+        if fo.marketed_volumes is not None:
+            self._add_cost_marketed_volumes()
+        if fo.prices_flex_pos is not None or fo.marketed_flex_pos is not None:
+            self._add_flex("pos")
+        if fo.prices_flex_neg is not None or fo.marketed_flex_neg is not None:
+            self._add_flex("neg")
+        if fo.symmetrical_flex:
+            rows = self.sparse.add_constraints(self.n_t, lb=0, ub=0)
+            self.sparse.add_terms(rows, self.index["flex_pos_total"], 1)
+            self.sparse.add_terms(rows, self.index["flex_neg_total"], -1)
+        if fo.marketed_flex_pos is not None:
+            self._add_flex_matching("pos")
+        if fo.marketed_flex_neg is not None:
+            self._add_flex_matching("neg")
+        if (fo.site_load_restriction_charge is not None) or (
+            fo.site_load_restriction_discharge is not None
+        ):
+            self._add_site_limits()
+        if fo.include_battery_costs:
+            self._add_battery_costs()
+        if fo.penalize_spiky_behaviour:
+            self._add_cost_spiky_behaviour()
+
+        return self.sparse.to_proto()
+
+    def _add_grid_power(self):
+        fo = self.optimizer
+        curtail_ub = np.inf if fo.allow_curtailment else 0
+        for key in ["feed", "purchase", "curtail"]:
+            ub = curtail_ub if key == "curtail" else np.inf
+            self.index[f"grid_{key}"] = self.sparse.add_variables(self.n_t, 0, ub)
+        if fo.dropped_binaries["grid"]:
+            return
+        for key in ["feed", "purchase", "curtail"]:
+            # The cleanest way to disable curtailment is to force the boolean to be zero
+            ub = 0 if (key == "curtail" and not fo.allow_curtailment) else 1
+            self.index[f"grid_bool_{key}"] = self.sparse.add_variables(
+                self.n_t, 0, ub, integer=True
+            )
+
+    def _add_batteries(self):
+        fo = self.optimizer
+        sm = self.sparse
+        shape = (self.n_b, self.n_t)
+        conn = self.connected
+        active = self.active
+
+        # Energy and charging bounds per time step, cf. FleetOptimizationOR._set_battery_bounds
+        bounds = {
+            key: np.array(
+                [fo.battery_bounds[bat.id][key] for bat in self.batteries]
+            ).reshape(shape)
+            for key in ["energy_min", "energy_max", "charge_min"]
+        }
+
+        charge = sm.add_variables(
+            shape,
+            bounds["charge_min"],
+            self.power_charge_max[:, None] * conn,
+            mask=active,
+        )
+        discharge = sm.add_variables(
+            shape, 0, self.power_discharge_max[:, None] * conn, mask=active
+        )
+        energy = sm.add_variables(
+            shape, bounds["energy_min"], bounds["energy_max"], mask=active
+        )
+
+        # Energy variable of the last active step up to t (energy_ref) and before t (energy_previous),
+        # -1 where the energy is still the constant energy_start
+        steps = np.broadcast_to(np.arange(self.n_t), shape)
+        last = np.maximum.accumulate(np.where(active, steps, -1), axis=1)
+        previous = np.concatenate([np.full((self.n_b, 1), -1), last[:, :-1]], axis=1)
+        rows_b = np.arange(self.n_b)[:, None]
+        self.energy_ref = np.where(last >= 0, energy[rows_b, last], -1)
+        self.energy_previous = np.where(previous >= 0, energy[rows_b, previous], -1)
+
+        self.index.update(charge=charge, discharge=discharge, energy=energy)
+
+        # Energy balance: E[t] - E[t-1] - c[t] * dt + d[t] * dt = 0 with E[-1] = energy_start
+        rhs = np.where(self.energy_previous < 0, self.energy_start[:, None], 0)
+        rows = sm.add_constraints(shape, rhs, rhs, mask=active)
+        sm.add_terms(rows, energy, 1)
+        sm.add_terms(rows, self.energy_previous, -1)
+        sm.add_terms(rows, charge, -self.dt)
+        sm.add_terms(rows, discharge, self.dt)
+        self.rows["energy_balance"] = rows
+        self._add_battery_rows(rows)
+
+        # Charging Targets for non-stationary batteries (that are connected at all)
+        ev = ~self.stationary & (self.energy_ref[:, -1] >= 0)
+        soft = ev & self.target_as_penalty
+        hard = ev & ~self.target_as_penalty
+        if hard.any():
+            rows = sm.add_constraints(int(hard.sum()), lb=self.energy_end[hard])
+            sm.add_terms(rows, self.energy_ref[hard, -1], 1)
+            self.rows["fully_charged"] = rows
+            self._add_battery_rows(rows, np.flatnonzero(hard))
+        if soft.any():
+            sm.add_objective(self.energy_ref[soft, -1], -fo.fully_charged_penalty)
+            sm.objective_offset += float(
+                np.sum(self.energy_end[soft]) * fo.fully_charged_penalty
+            )
+
+        # Without the booleans, the bounds of the power variables are all that remains of the constraints below
+        if fo.dropped_binaries["fleet"]:
+            return
+
+        # Disconnect Flag: forced to 1 if not connected. With a single continuous session the flag is 0 at the
+        # first connected time step and can only switch once from 0 to 1 afterwards
+        disconnected_lb = (~conn).astype(float)
+        disconnected_ub = np.ones(shape)
+        first_connected = np.argmax(conn, axis=1)
+        if fo.single_continuous_session_allowed:
+            disconnected_ub[np.arange(self.n_b), first_connected] = np.where(
+                conn.any(axis=1), 0, 1
+            )
+        bool_charge = sm.add_variables(shape, 0, 1, integer=True, mask=active)
+        bool_discharge = sm.add_variables(
+            shape,
+            0,
+            np.where(self.power_discharge_max[:, None] == 0, 0, np.ones(shape)),
+            integer=True,
+            mask=active,
+        )
+        bool_disconnected = sm.add_variables(
+            shape, disconnected_lb, disconnected_ub, integer=True, mask=active
+        )
+
+        self.index.update(
+            bool_charge=bool_charge,
+            bool_discharge=bool_discharge,
+            bool_disconnected=bool_disconnected,
+        )
+
+        # Prevent simultaneous charging and discharging of the battery
+        rows = sm.add_constraints(shape, ub=0, mask=active)
+        sm.add_terms(rows, charge, 1)
+        sm.add_terms(rows, bool_charge, -self.power_charge_max[:, None])
+        self._add_battery_rows(rows)
+
+        rows = sm.add_constraints(shape, ub=0, mask=active)
+        sm.add_terms(rows, discharge, 1)
+        sm.add_terms(rows, bool_discharge, -self.power_discharge_max[:, None])
+        self._add_battery_rows(rows)
+
+        rows = sm.add_constraints(
+            shape,
+            lb=np.broadcast_to(self.power_charge_min[:, None], shape),
+            mask=active,
+        )
+        sm.add_terms(rows, charge, 1)
+        sm.add_terms(rows, bool_disconnected, self.power_charge_min[:, None])
+        self._add_battery_rows(rows)
+
+        rows = sm.add_constraints(shape, ub=1, mask=active)
+        sm.add_terms(rows, bool_charge, 1)
+        sm.add_terms(rows, bool_discharge, 1)
+        sm.add_terms(rows, bool_disconnected, 1)
+        self._add_battery_rows(rows)
+
+        # Only one continuous charging session: once disconnected, the battery stays disconnected
+        if fo.single_continuous_session_allowed:
+            steps = np.arange(self.n_t)[None, :]
+            mask = conn & (steps > first_connected[:, None])
+            bat, t = np.nonzero(mask)
+            # A flag dropped from the sparse model is the constant 1
+            lb = np.where(bool_disconnected[bat, t - 1] < 0, 1, 0)
+            rows = sm.add_constraints(len(bat), lb=lb)
+            sm.add_terms(rows, bool_disconnected[bat, t], 1)
+            sm.add_terms(rows, bool_disconnected[bat, t - 1], -1)
+            self._add_battery_rows(rows, bat)
+
+    def _add_fleet_power(self):
+        fo = self.optimizer
+        sm = self.sparse
+
+        # Overall electricity balance: source - sink == site load
+        site_load = (
+            np.zeros(self.n_t)
+            if fo.site_load is None
+            else np.asarray(fo.site_load, dtype=float)
+        )
+        rows = sm.add_constraints(self.n_t, site_load, site_load)
+        sm.add_terms(rows, self.index["grid_purchase"], fo.purchase_efficiency)
+        sm.add_terms(rows, self.index["grid_feed"], -1 / fo.feed_efficiency)
+        sm.add_terms(rows, self.index["grid_curtail"], -1)
+        sm.add_terms(
+            rows[None, :], self.index["discharge"], self.efficiency_discharge[:, None]
+        )
+        sm.add_terms(
+            rows[None, :], self.index["charge"], -1 / self.efficiency_charge[:, None]
+        )
+        self.rows["overall_electricity_balance"] = rows
+
+        # Prevent simultaneous feed-in and purchase from the grid
+        if not fo.dropped_binaries["grid"]:
+            rows = sm.add_constraints(self.n_t, 1, 1)
+            for key in ["feed", "curtail", "purchase"]:
+                sm.add_terms(rows, self.index[f"grid_bool_{key}"], 1)
+
+    def _add_site_limits(self):
+        fo = self.optimizer
+        sm = self.sparse
+        if fo._site_limit_as_penalty():
+            if fo.site_load_restriction_charge is not None:
+                limit = fo.site_load_restriction_charge
+                site_constraint = sm.add_variables(1, limit, np.inf)
+                rows = sm.add_constraints(self.n_t, ub=0)
+                sm.add_terms(rows, self.index["grid_purchase"], 1)
+                sm.add_terms(rows, site_constraint, -1)
+                sm.add_objective(site_constraint, fo.limit_purchase_penalty)
+                sm.objective_offset -= limit * fo.limit_purchase_penalty
+                self.index["site_constraint_purchase"] = site_constraint
+        else:
+            for key, limit in [
+                ("feed", fo.site_load_restriction_discharge),
+                ("purchase", fo.site_load_restriction_charge),
+            ]:
+                if limit is None:
+                    continue
+                if fo.dropped_binaries["grid"]:
+                    # Without grid booleans the limit is a plain upper bound
+                    rows = sm.add_constraints(self.n_t, ub=limit)
+                    sm.add_terms(rows, self.index[f"grid_{key}"], 1)
+                else:
+                    rows = sm.add_constraints(self.n_t, ub=0)
+                    sm.add_terms(rows, self.index[f"grid_{key}"], 1)
+                    sm.add_terms(rows, self.index[f"grid_bool_{key}"], -limit)
+
+    # ---------------------------------------------------
+    #  Cost Components
+    # ---------------------------------------------------
+
+    def _add_cost_prices(self):
+        fo = self.optimizer
+        sm = self.sparse
+
+        mm = (
+            np.zeros(self.n_t)
+            if fo.mask_marketed is None
+            else np.asarray(fo.mask_marketed, dtype=float)
+        )
+        if fo.site_load is not None:
+            site_load = np.asarray(fo.site_load, dtype=float)
+            site_load_pos = np.where(site_load > 0, site_load, 0)
+            site_load_neg = np.where(site_load < 0, -site_load, 0)
+        else:
+            site_load_pos = np.zeros(self.n_t)
+            site_load_neg = np.zeros(self.n_t)
+
+        tariffs_import = (
+            np.zeros(self.n_t)
+            if fo.tariffs_import is None
+            else np.asarray(fo.tariffs_import, dtype=float)
+        )
+        tariffs_export = (
+            np.zeros(self.n_t)
+            if fo.tariffs_export is None
+            else np.asarray(fo.tariffs_export, dtype=float)
+        )
+        coeff_import = (1 - mm) * tariffs_import * self.dt
+        coeff_export = (1 - mm) * tariffs_export * self.dt
+
+        # cost[t] == coeff_import * (purchase[t] - site_load_pos[t]) - coeff_export * (feed[t] - site_load_neg[t])
+        cost = sm.add_variables(self.n_t, -np.inf, np.inf)
+        rhs = -coeff_import * site_load_pos + coeff_export * site_load_neg
+        rows = sm.add_constraints(self.n_t, rhs, rhs)
+        sm.add_terms(rows, cost, 1)
+        sm.add_terms(rows, self.index["grid_purchase"], -coeff_import)
+        sm.add_terms(rows, self.index["grid_feed"], coeff_export)
+        sm.add_objective(cost, 1)
+        self.index["cost_Spot"] = cost
+        self.rows["const_tariff_var"] = rows
+
+    def _add_cost_triad(self):
+        fo = self.optimizer
+        sm = self.sparse
+
+        def as_array(x):
+            return np.zeros(self.n_t) if x is None else np.asarray(x, dtype=float)
+
+        triad_import = as_array(fo.triad_tariffs_import)
+        triad_export = as_array(fo.triad_tariffs_export)
+        site_load = as_array(fo.site_load)
+
+        cost = sm.add_variables(self.n_t, -np.inf, np.inf)
+        rhs = -triad_import * site_load * self.dt
+        rows = sm.add_constraints(self.n_t, rhs, rhs)
+        self.rows["cost_triad"] = rows
+        sm.add_terms(rows, cost, 1)
+        sm.add_terms(rows, self.index["grid_purchase"], -triad_import * self.dt)
+        sm.add_terms(rows, self.index["grid_feed"], triad_export * self.dt)
+        sm.add_objective(cost, 1)
+        self.index["cost_Triad"] = cost
+
+    def _add_capacity_prices(self):
+        fo = self.optimizer
+        sm = self.sparse
+        for key, tariff in [
+            ("purchase", fo.capacity_tariffs_import),
+            ("feed", fo.capacity_tariffs_export),
+        ]:
+            if tariff is None:
+                continue
+            peak = sm.add_variables(1, 0, np.inf)
+            rows = sm.add_constraints(self.n_t, ub=0)
+            sm.add_terms(rows, self.index[f"grid_{key}"], 1)
+            sm.add_terms(rows, peak, -1)
+            sm.add_objective(peak, tariff)
+            self.index[f"peak_{key}"] = peak
+
+    def _add_cost_marketed_volumes(self):
+        fo = self.optimizer
+        sm = self.sparse
+
+        # marketed[t] - dt * (charge[t] - discharge[t]) == diff_pos[t] - diff_neg[t] where volumes are marketed,
+        # 0 == diff_pos[t] - diff_neg[t] otherwise
+        mask = np.asarray(fo.mask_marketed, dtype=bool)
+        volumes = np.where(mask, np.asarray(fo.marketed_volumes, dtype=float), 0)
+        diff_pos = sm.add_variables(self.n_t, 0, np.inf)
+        diff_neg = sm.add_variables(self.n_t, 0, np.inf)
+        rows = sm.add_constraints(self.n_t, -volumes, -volumes)
+        sm.add_terms(rows, diff_pos, -1)
+        sm.add_terms(rows, diff_neg, 1)
+        sm.add_terms(rows[None, mask], self.index["charge"][:, mask], -self.dt[mask])
+        sm.add_terms(rows[None, mask], self.index["discharge"][:, mask], self.dt[mask])
+        sm.add_objective(diff_pos, 10)
+        sm.add_objective(diff_neg, 10)
+        self.index["marketed_volumes_diff_pos"] = diff_pos
+        self.index["marketed_volumes_diff_neg"] = diff_neg
+        self.rows["marketed_volumes_diff"] = rows
+
+    def _add_cost_spiky_behaviour(self):
+        fo = self.optimizer
+        sm = self.sparse
+        n = self.n_t - 1
+        increasing = sm.add_variables(n, 0, np.inf)
+        decreasing = sm.add_variables(n, 0, np.inf)
+
+        # fleet_power[t+1] - fleet_power[t] == decreasing[t] - increasing[t]
+        rows = sm.add_constraints(n, 0, 0)
+        sm.add_terms(rows[None, :], self.index["charge"][:, 1:], 1)
+        sm.add_terms(rows[None, :], self.index["discharge"][:, 1:], -1)
+        sm.add_terms(rows[None, :], self.index["charge"][:, :-1], -1)
+        sm.add_terms(rows[None, :], self.index["discharge"][:, :-1], 1)
+        sm.add_terms(rows, decreasing, -1)
+        sm.add_terms(rows, increasing, 1)
+        self.rows["fleet_power_diff"] = rows
+        sm.add_objective(increasing, fo.spiky_behaviour_penalty)
+        sm.add_objective(decreasing, fo.spiky_behaviour_penalty)
+        self.index["spiky_increasing"] = increasing
+        self.index["spiky_decreasing"] = decreasing
+
+    def _add_battery_costs(self):
+        sm = self.sparse
+        cycle_cost = np.array([bat.cycle_cost_per_kwh for bat in self.batteries])
+        if cycle_cost.sum() == 0:
+            logger.warning(
+                "Trying to include battery cycle costs but the cycle costs are 0. Please use "
+                "Battery.add_cycle_costs()"
+            )
+
+        costs = sm.add_variables(self.n_b, 0, np.inf)
+        rows = sm.add_constraints(self.n_b, 0, 0)
+        sm.add_terms(rows, costs, 1)
+        coeff = -cycle_cost[:, None] * self.dt
+        sm.add_terms(rows[:, None], self.index["charge"], coeff)
+        sm.add_terms(rows[:, None], self.index["discharge"], coeff)
+        self._add_battery_rows(rows)
+        sm.add_objective(costs, 1)
+        self.index["battery_costs"] = costs
+
+    # ---------------------------------------------------
+    #  Flexibility
+    # ---------------------------------------------------
+
+    def _add_flex(self, direction: str):
+        """
+        Flexibility per battery and time step as the minimum of three quantities, cf.
+        FleetOptimizationOR._calc_pos_flex and FleetOptimizationOR._calc_neg_flex
+        """
+        fo = self.optimizer
+        sm = self.sparse
+        shape = (self.n_b, self.n_t)
+        energy = self.index["energy"]
+        active = self.active
+        charge = self.index["charge"]
+        discharge = self.index["discharge"]
+        eta_c = self.efficiency_charge[:, None]
+        eta_d = self.efficiency_discharge[:, None]
+
+        flex = sm.add_variables(shape, 0, np.inf, mask=active)
+
+        if direction == "pos":
+            # buffer * (E - E_min) * eta_d / dt >= flex for previous and current energy
+            k = fo.flex_buffer * eta_d / self.dt
+            energy_sign = -1
+            ub_energy = np.broadcast_to(-k * self.energy_min[:, None], shape).copy()
+            ub_energy_first = (k * (self.energy_start - self.energy_min)[:, None])[:, 0]
+            # power_discharge_max * eta_d + charge / eta_c - discharge * eta_d >= flex
+            power_sign = -1
+            ub_power = np.broadcast_to(self.power_discharge_max[:, None] * eta_d, shape)
+        else:
+            # buffer * (E_max - E) / eta_c / dt >= flex for previous and current energy
+            k = fo.flex_buffer / eta_c / self.dt
+            energy_sign = 1
+            ub_energy = np.broadcast_to(k * self.energy_max[:, None], shape).copy()
+            ub_energy_first = (k * (self.energy_max - self.energy_start)[:, None])[:, 0]
+            # power_charge_max / eta_c - charge / eta_c + discharge * eta_d >= flex
+            power_sign = 1
+            ub_power = np.broadcast_to(self.power_charge_max[:, None] / eta_c, shape)
+
+        k = np.broadcast_to(k, shape)
+
+        # The previous energy is the constant energy_start until the first active step
+        ub_previous = np.where(
+            self.energy_previous < 0, ub_energy_first[:, None], ub_energy
+        )
+        rows = sm.add_constraints(shape, ub=ub_previous, mask=active)
+        sm.add_terms(rows, flex, 1)
+        sm.add_terms(rows, self.energy_previous, energy_sign * k)
+        self._add_battery_rows(rows)
+
+        rows = sm.add_constraints(shape, ub=ub_energy, mask=active)
+        sm.add_terms(rows, flex, 1)
+        sm.add_terms(rows, energy, energy_sign * k)
+        self._add_battery_rows(rows)
+
+        rows = sm.add_constraints(shape, ub=ub_power, mask=active)
+        sm.add_terms(rows, flex, 1)
+        sm.add_terms(rows, charge, power_sign / eta_c)
+        sm.add_terms(rows, discharge, -power_sign * eta_d)
+        self._add_battery_rows(rows)
+
+        # Sum flex over all batteries
+        total = sm.add_variables(self.n_t, -np.inf, np.inf)
+        rows = sm.add_constraints(self.n_t, 0, 0)
+        sm.add_terms(rows, total, 1)
+        sm.add_terms(rows[None, :], flex, -1)
+        self.rows[f"flex_{direction}_total"] = rows
+
+        prices = getattr(fo, f"prices_flex_{direction}")
+        if prices is not None:
+            mask = np.asarray(getattr(fo, f"mask_flex_{direction}"), dtype=bool)
+            sm.add_objective(total, -np.where(mask, np.asarray(prices, dtype=float), 0))
+
+        self.index[f"flex_{direction}"] = flex
+        self.index[f"flex_{direction}_total"] = total
+
+    def _add_flex_matching(self, direction: str):
+        fo = self.optimizer
+        sm = self.sparse
+        marketed = np.asarray(getattr(fo, f"marketed_flex_{direction}"), dtype=float)
+        mask = np.asarray(getattr(fo, f"mask_flex_{direction}"), dtype=bool)
+
+        # total[t] - marketed[t] == diff_pos[t] - diff_neg[t] where flex is marketed, 0 == ... otherwise
+        diff_pos = sm.add_variables(self.n_t, 0, np.inf)
+        diff_neg = sm.add_variables(self.n_t, 0, np.inf)
+        rhs = np.where(mask, marketed, 0)
+        rows = sm.add_constraints(self.n_t, rhs, rhs)
+        sm.add_terms(rows[mask], self.index[f"flex_{direction}_total"][mask], 1)
+        sm.add_terms(rows, diff_pos, -1)
+        sm.add_terms(rows, diff_neg, 1)
+        sm.add_objective(diff_neg, 1)
+        self.index[f"flex_{direction}_diff_neg"] = diff_neg
+
+    # ---------------------------------------------------
+    #  Load into solver
+    # ---------------------------------------------------
+
+    def load(self, model: pywraplp.Solver, proto: linear_solver_pb2.MPModelProto):
+        """
+        Load the model into the solver and fill the parameter shells of the optimizer with the solver variables
+        """
+        error = model.LoadModelFromProto(proto)
+        if error:
+            raise ValueError(f"Could not load matrix model: {error}")
+
+        fo = self.optimizer
+        variables = model.variables()
+
+        def series(index, constant=0):
+            # Entries dropped from a sparse model are constants
+            return {
+                t: variables[k] if k >= 0 else constant
+                for t, k in enumerate(index.tolist())
+            }
+
+        for key in ["feed", "purchase", "curtail"]:
+            fo.grid_power[key] = series(self.index[f"grid_{key}"])
+            if f"grid_bool_{key}" in self.index:
+                fo.grid_bool[key] = series(self.index[f"grid_bool_{key}"])
+
+        for b, battery in enumerate(self.batteries):
+            i = battery.id
+            fo.fleet_power[i] = {
+                "charge": series(self.index["charge"][b]),
+                "discharge": series(self.index["discharge"][b]),
+            }
+            fo.fleet_energy[i] = series(self.energy_ref[b], battery.energy_start)
+            if "bool_charge" in self.index:
+                fo.fleet_bool[i] = {
+                    key: series(
+                        self.index[f"bool_{key}"][b], int(key == "disconnected")
+                    )
+                    for key in ["charge", "discharge", "disconnected"]
+                }
+
+        for t in range(self.n_t):
+            for key in ["charge", "discharge"]:
+                fo.sum_power_fleet[key][t] = model.Sum(
+                    [fo.fleet_power[battery.id][key][t] for battery in self.batteries]
+                )
+
+        if "site_constraint_purchase" in self.index:
+            fo.site_constraint["purchase"] = variables[
+                int(self.index["site_constraint_purchase"][0])
+            ]
+        for key in ["purchase", "feed"]:
+            if f"peak_{key}" in self.index:
+                fo.grid_peak[key] = variables[int(self.index[f"peak_{key}"][0])]
+
+        for direction in ["pos", "neg"]:
+            if f"flex_{direction}" in self.index:
+                flex = getattr(fo, f"flex_{direction}")
+                for b, battery in enumerate(self.batteries):
+                    flex[battery.id] = list(
+                        series(self.index[f"flex_{direction}"][b]).values()
+                    )
+                setattr(
+                    fo,
+                    f"flex_{direction}_total",
+                    series(self.index[f"flex_{direction}_total"]),
+                )
+
+        # Constraints that are updated in place, cf. FleetOptimizationOR.update_prices
+        constraints = model.constraints()
+        for key in [
+            "const_tariff_var",
+            "marketed_volumes_diff",
+            "overall_electricity_balance",
+            "cost_triad",
+            "fleet_power_diff",
+            "flex_pos_total",
+            "flex_neg_total",
+        ]:
+            if key in self.rows:
+                fo.constraints[key] = [constraints[k] for k in self.rows[key].tolist()]
+        if len(self.battery_rows) > 0:
+            batteries, rows = np.concatenate(self.battery_rows, axis=1)
+            keep = rows >= 0
+            batteries, rows = batteries[keep], rows[keep]
+            rows = rows[np.argsort(batteries, kind="stable")]
+            counts = np.bincount(batteries, minlength=self.n_b)
+            for battery, battery_rows in zip(
+                self.batteries, np.split(rows, np.cumsum(counts)[:-1])
+            ):
+                fo.battery_constraints[battery.id] = battery_rows.tolist()
+        if "marketed_volumes_diff_pos" in self.index:
+            fo.marketed_volumes_diff = {
+                direction: [
+                    variables[k]
+                    for k in self.index[f"marketed_volumes_diff_{direction}"].tolist()
+                ]
+                for direction in ["pos", "neg"]
+            }
+
+        if "spiky_increasing" in self.index:
+            fo.sum_power_fleet_diff = {
+                t: {
+                    "increasing": variables[int(self.index["spiky_increasing"][t])],
+                    "decreasing": variables[int(self.index["spiky_decreasing"][t])],
+                }
+                for t in range(self.n_t - 1)
+            }
+        if "battery_costs" in self.index:
+            fo.battery_costs = {
+                battery.id: variables[k]
+                for battery, k in zip(
+                    self.batteries, self.index["battery_costs"].tolist()
+                )
+            }
+
+        # Variables carrying the objective terms per cost component
+        cost_index = {
+            "Spot": ["cost_Spot"],
+            "Triad": ["cost_Triad"],
+            "Capacity_Purchase": ["peak_purchase"],
+            "Capacity_Feed": ["peak_feed"],
+            "MarketedVolumes": [
+                "marketed_volumes_diff_pos",
+                "marketed_volumes_diff_neg",
+            ],
+            "FlexPos": ["flex_pos_total"] if fo.prices_flex_pos is not None else [],
+            "FlexNeg": ["flex_neg_total"] if fo.prices_flex_neg is not None else [],
+            "FlexMatchPos": ["flex_pos_diff_neg"],
+            "FlexMatchNeg": ["flex_neg_diff_neg"],
+            "site_limit_purchase": ["site_constraint_purchase"],
+            "battery_costs": ["battery_costs"],
+            "Spiky_Behaviour_Penalty": ["spiky_increasing", "spiky_decreasing"],
+        }
+        for cost_name, index_names in cost_index.items():
+            index_names = [name for name in index_names if name in self.index]
+            if len(index_names) > 0:
+                fo.cost[cost_name] = [
+                    variables[k]
+                    for name in index_names
+                    for k in self.index[name].ravel().tolist()
+                ]
+        soft = ~self.stationary & (self.energy_ref[:, -1] >= 0) & self.target_as_penalty
+        if soft.any():
+            fo.cost["fully_charged_penalty"] = [
+                variables[k] for k in self.energy_ref[soft, -1].tolist()
+            ]
+
+        return 0
@@ -0,0 +1,448 @@
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from ortools.linear_solver import pywraplp
+
+from battery_management.optimizer.battery_optimization_or import FleetOptimizationOR
+from battery_management.optimizer.rolling_horizon import TIME_SERIES
+from battery_management.results_handler.site_result import SiteResult
+from battery_management.results_handler.site_result_or import SiteResultOR
+
+
+def _connected(optimizer: FleetOptimizationOR) -> np.ndarray:
+    return np.array(
+        [np.asarray(battery.connected, dtype=bool) for battery in optimizer.batteries]
+    ).reshape(len(optimizer.batteries), optimizer.n_t)
+
+
+def globally_coupled(optimizer: FleetOptimizationOR) -> bool:
+    """
+    Whether the model contains terms over the whole horizon that link all batteries: capacity tariffs (one peak
+    for all time steps), the purchase limit as penalty (one variable for all time steps) and charging points.
+
+    Parameters
+    ----------
+    optimizer: FleetOptimizationOR
+
+    Returns
+    -------
+    bool
+    """
+    return bool(
+        optimizer.capacity_tariffs_import is not None
+        or optimizer.capacity_tariffs_export is not None
+        or (
+            optimizer.limit_as_penalty
+            and optimizer.site_load_restriction_charge is not None
+        )
+        or optimizer.charging_points
+    )
+
+
+def coupled_steps(optimizer: FleetOptimizationOR) -> np.ndarray:
+    """
+    Time steps in which the batteries connected at that time interact.
+
+    Without limits, marketed volumes and flex matching, the batteries only interact through the grid cost. That is
+    linear in the power the fleet draws, and the batteries are independent, unless the grid power can change sign
+    in the step and feeding in pays less than purchasing: then it matters whether one battery discharges what
+    another one charges. This is checked with the power limits of the connected batteries. Binaries on the grid
+    (cf. FleetOptimizationOR._redundant_binaries) and curtailment couple every step.
+
+    Parameters
+    ----------
+    optimizer: FleetOptimizationOR
+
+    Returns
+    -------
+    np.ndarray
+        One boolean per time step
+    """
+    fo = optimizer
+    n_t = fo.n_t
+
+    def as_array(x):
+        return np.zeros(n_t) if x is None else np.asarray(x, dtype=float)
+
+    if (
+        fo.allow_curtailment
+        or fo.symmetrical_flex
+        or not fo._redundant_binaries()["grid"]
+    ):
+        return np.ones(n_t, dtype=bool)
+
+    coupled = np.zeros(n_t, dtype=bool)
+    if (
+        fo.site_load_restriction_charge is not None
+        or fo.site_load_restriction_discharge is not None
+    ):
+        coupled[:] = True
+    for volumes, mask in [
+        (fo.marketed_volumes, fo.mask_marketed),
+        (fo.marketed_flex_pos, fo.mask_flex_pos),
+        (fo.marketed_flex_neg, fo.mask_flex_neg),
+    ]:
+        if volumes is not None:
+            coupled |= np.asarray(mask, dtype=bool)
+
+    # Cost of a kW drawn by the fleet when purchasing and when feeding in, cf. FleetOptimizationOR._redundant_binaries
+    mm = as_array(fo.mask_marketed)
+    price_import = (1 - mm) * as_array(fo.tariffs_import) + as_array(
+        fo.triad_tariffs_import
+    )
+    price_export = (1 - mm) * as_array(fo.tariffs_export) + as_array(
+        fo.triad_tariffs_export
+    )
+    kink = ~np.isclose(
+        price_import / fo.purchase_efficiency, price_export * fo.feed_efficiency
+    )
+
+    connected = _connected(fo)
+    efficiency_charge = np.array([bat.efficiency_charge for bat in fo.batteries])
+    efficiency_discharge = np.array([bat.efficiency_discharge for bat in fo.batteries])
+    draw_max = (
+        np.array([bat.power_charge_max for bat in fo.batteries]) / efficiency_charge
+    )
+    draw_min = (
+        -np.array([bat.power_discharge_max for bat in fo.batteries])
+        * efficiency_discharge
+    )
+    site_load = as_array(fo.site_load)
+    lowest = site_load + draw_min @ connected
+    highest = site_load + draw_max @ connected
+    coupled |= kink & (lowest < 0) & (highest > 0)
+
+    return coupled
+
+
+def independent_components(optimizer: FleetOptimizationOR) -> List[Dict[str, Any]]:
+    """
+    Split the optimization into parts that can be solved on their own.
+
+    Batteries connected in the same coupled step (cf. coupled_steps, with the spiky penalty also in adjacent steps)
+    belong to the same component. The horizon is split where no session of any battery continues, i.e. between two
+    time steps no battery is connected at both. Steps in which no battery is connected are added to the preceding
+    segment; with the spiky penalty the split needs two such steps and the last one goes to the following segment. A
+    battery with several sessions keeps all of them in one segment, so there is no split between its first and last
+    connected step. Neither happens with terms over the whole horizon (cf. globally_coupled).
+
+    Parameters
+    ----------
+    optimizer: FleetOptimizationOR
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        One entry per component with the time steps [start, end) of its segment and the indices of its batteries.
+        All components of a segment share start and end, every segment has at least one component (without
+        batteries if none is connected in it).
+    """
+    fo = optimizer
+    n_b, n_t = len(fo.batteries), fo.n_t
+    if n_b == 0 or globally_coupled(fo):
+        return [{"start": 0, "end": n_t, "batteries": list(range(n_b))}]
+
+    connected = _connected(fo)
+    coupled = coupled_steps(fo)
+
+    # Union-find over the batteries
+    parent = list(range(n_b))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    linked = connected & coupled[None, :]
+    if fo.penalize_spiky_behaviour:
+        linked = connected.copy()
+        linked[:, :-1] |= connected[:, 1:]
+    for t in np.flatnonzero(linked.any(axis=0)):
+        batteries = np.flatnonzero(linked[:, t])
+        root = find(batteries[0])
+        for b in batteries[1:]:
+            parent[find(b)] = root
+
+    # Segments between two steps that no battery session continues over
+    active = connected.any(axis=0)
+    continues = (connected[:, :-1] & connected[:, 1:]).any(axis=0)
+    starts = [0]
+    for t in range(1, n_t):
+        if not active[t] or continues[t - 1] or not active[:t].any():
+            continue
+        if not fo.penalize_spiky_behaviour:
+            starts.append(t)
+        elif t >= 2 and not active[t - 2] and not active[t - 1]:
+            # The penalty on the change of the fleet power needs the idle step before the new segment
+            starts.append(t - 1)
+    # A battery with sessions in several segments keeps them in one: drop the splits between its first and last step
+    plugged = connected.any(axis=1)
+    first = np.where(plugged, np.argmax(connected, axis=1), 0)
+    last = np.where(plugged, n_t - 1 - np.argmax(connected[:, ::-1], axis=1), 0)
+    starts = [
+        start
+        for start in starts
+        if start == 0 or not ((first < start) & (last >= start)).any()
+    ]
+    ends = starts[1:] + [n_t]
+
+    result = []
+    for start, end in zip(starts, ends):
+        members = np.flatnonzero((first >= start) & (first < end))
+        roots = {}
+        for b in members:
+            roots.setdefault(find(b), []).append(int(b))
+        for batteries in roots.values():
+            result.append({"start": start, "end": end, "batteries": batteries})
+        if not roots:
+            # The site load of the segment is still part of the result
+            result.append({"start": start, "end": end, "batteries": []})
+    return result
+
+
+def _optimize(optimizer: FleetOptimizationOR) -> SiteResult:
+    return optimizer.optimize()
+
+
+class ComponentOptimizer:
+    """
+    Optimizes a site as independent components, cf. independent_components, each of them solved on its own in
+    parallel. The results are merged into one SiteResult of the whole site.
+
+    Every component is optimized with the whole site load of its segment. Where batteries of different components
+    are connected at the same time, the grid cost is linear in the power of each of them, so the site load only adds
+    the same constant to every component. The merged costs and grid power subtract it for all but one component.
+    """
+
+    def __init__(self, optimizer: FleetOptimizationOR, processes: Optional[int] = None):
+        """
+
+        Parameters
+        ----------
+        optimizer: FleetOptimizationOR
+            Fully configured optimizer of the site. It is not optimized itself, only copied per component.
+        processes: int, optional
+            Number of worker processes, by default the number of CPUs. With 1 the components are optimized in the
+            calling process.
+        """
+        self.optimizer = optimizer
+        self.processes = os.cpu_count() if processes is None else processes
+        self.components = independent_components(optimizer)
+
+    @staticmethod
+    def _slice(value: Any, start: int, end: int) -> Any:
+        if value is None or np.ndim(value) == 0:
+            return value
+        return value[start:end]
+
+    def _component_optimizer(
+        self, start: int, end: int, batteries: List[int]
+    ) -> FleetOptimizationOR:
+        """
+        Copy of the optimizer cut to the steps [start, end) with only the given batteries
+        """
+        parent = self.optimizer
+        changes = {
+            key: self._slice(getattr(parent, key), start, end) for key in TIME_SERIES
+        }
+        if changes["date_range"] is None:
+            changes["date_range"] = pd.RangeIndex(start, end)
+
+        component_batteries = []
+        for b in batteries:
+            battery = copy.copy(parent.batteries[b])
+            battery.connected = list(battery.connected)[start:end]
+            component_batteries.append(battery)
+
+        return parent.derive(
+            n_t=end - start,
+            batteries=component_batteries,
+            calculate_savings=False,
+            save_file=None,
+            # Solved in other processes, the solver objects of these cannot be sent there
+            hint_store=None,
+            model_cache=None,
+            model_export=None,
+            **changes,
+        )
+
+    @staticmethod
+    def _site_only(fo: FleetOptimizationOR) -> Dict[str, Any]:
+        """
+        Objective, grid power and costs of a segment without batteries. SiteResult needs batteries, so the values
+        are read from the model directly.
+        """
+        fo._build_model()
+        status = fo.model.Solve()
+        if status != pywraplp.Solver.OPTIMAL:
+            raise RuntimeError(f"Site without batteries not solved, status {status}")
+
+        def values(variables):
+            return np.array([SiteResultOR._value(variables[t]) for t in range(fo.n_t)])
+
+        purchase = values(fo.grid_power["purchase"])
+        feed = values(fo.grid_power["feed"])
+        return {
+            "objective_value": fo.model.Objective().Value(),
+            "grid_results": pd.DataFrame(
+                {
+                    "power_kw": purchase - feed,
+                    "curtailed_power_kw": values(fo.grid_power["curtail"]),
+                }
+            ),
+            "SpotCost": values(fo.cost["Spot"]),
+            "CostTriadOptimized": values(fo.cost["Triad"]) if "Triad" in fo.cost else 0,
+        }
+
+    def optimize(self) -> SiteResult:
+        """
+        Optimize all components, in parallel if there is more than one, and merge the results
+
+        Returns
+        -------
+        SiteResult
+            Result of the whole site. The details of every component are in extra_info["components"].
+        """
+        parent = self.optimizer
+        if len(self.components) == 1:
+            return parent.optimize()
+
+        optimizers = [
+            self._component_optimizer(c["start"], c["end"], c["batteries"])
+            for c in self.components
+        ]
+        logger.info(f"Site split into {len(optimizers)} independent components")
+        if self.processes > 1:
+            with ProcessPoolExecutor(
+                max_workers=min(self.processes, len(optimizers)),
+                mp_context=get_context("spawn"),
+            ) as executor:
+                results = list(executor.map(_optimize, optimizers))
+        else:
+            results = [_optimize(fo) for fo in optimizers]
+
+        return self._merge(results)
+
+    def _merge(self, results: List[SiteResult]) -> SiteResult:
+        """
+        One SiteResult of the whole site from the results of the components
+        """
+        parent = self.optimizer
+        date_range = (
+            pd.RangeIndex(0, parent.n_t)
+            if parent.date_range is None
+            else parent.date_range
+        )
+        objective_value = sum(result.objective_value for result in results)
+
+        site_results, grid_results = [], []
+        segments = sorted({(c["start"], c["end"]) for c in self.components})
+        for start, end in segments:
+            members = [
+                result
+                for c, result in zip(self.components, results)
+                if (c["start"], c["end"]) == (start, end)
+            ]
+            site = members[0].site_results.copy()
+            grid = sum(result.grid_results for result in members)
+            columns = [c for c in SiteResult.extensive_columns if c in site.columns]
+            for column in columns:
+                site[column] = sum(result.site_results[column] for result in members)
+            if len(members) > 1:
+                # The site load is part of every component
+                site_only = self._site_only(self._component_optimizer(start, end, []))
+                objective_value -= (len(members) - 1) * site_only["objective_value"]
+                for column in grid.columns:
+                    grid[column] -= (len(members) - 1) * site_only["grid_results"][
+                        column
+                    ].values
+                for column in columns:
+                    if column in site_only:
+                        site[column] -= (len(members) - 1) * site_only[column]
+            site_results.append(site)
+            grid_results.append(grid)
+
+        battery_results = []
+        component_of = {
+            b: i for i, c in enumerate(self.components) for b in c["batteries"]
+        }
+        for b, battery in enumerate(parent.batteries):
+            result = results[component_of[b]]
+            schedule = result.battery_results.xs(battery.id, level="battery_id")
+            schedule = schedule.reindex(date_range)
+            schedule["power_kw"] = schedule["power_kw"].fillna(0)
+            schedule["energy_content_kwh"] = (
+                schedule["energy_content_kwh"].ffill().fillna(battery.energy_start)
+            )
+            schedule["soc_perc"] = schedule["energy_content_kwh"] / battery.capacity
+            schedule["battery_id"] = battery.id
+            battery_results.append(schedule)
+        battery_results = (
+            pd.concat(battery_results)
+            .rename_axis("time")
+            .reset_index()
+            .set_index(["battery_id", "time"])
+        )
+        if not battery_results.index.is_unique:
+            raise ValueError("Battery ids must be unique")
+
+        site_results = pd.concat(site_results)
+        site_results.index = date_range.rename("time")
+        for column in ["power_kw", "energy_content_kwh"]:
+            site_results[column] = (
+                battery_results[column].groupby(["time"]).sum().values
+            )
+        if "site_load_kw" in site_results.columns:
+            site_results["total_load_kw"] = (
+                site_results["site_load_kw"] + site_results["power_kw"]
+            )
+        grid_results = pd.concat(grid_results)
+        grid_results.index = date_range
+
+        statuses = [result.success for result in results]
+        return SiteResult(
+            {
+                "id": parent.id,
+                "type": parent.type,
+                "objective_value": objective_value,
+                "solve_time": sum(result.time_elapsed for result in results),
+                "status": next((status for status in statuses if status != 0), 0),
+                "solver_mode": "MIP"
+                if any(result.solver_mode == "MIP" for result in results)
+                else "LP",
+                "has_solution": all(result.has_solution for result in results),
+                "limit_reached": any(result.limit_reached for result in results),
+                "dt": parent.dt,
+                "n_t": parent.n_t,
+                "date_range": date_range,
+                "batteries": parent.batteries,
+                "battery_results": battery_results,
+                "site_results": site_results,
+                "grid_results": grid_results,
+                "extra_info": {
+                    "components": [
+                        {
+                            "start": c["start"],
+                            "end": c["end"],
+                            "batteries": [
+                                parent.batteries[b].id for b in c["batteries"]
+                            ],
+                            "status": result.success,
+                            "objective_value": result.objective_value,
+                            "solve_time": result.time_elapsed,
+                        }
+                        for c, result in zip(self.components, results)
+                    ]
+                },
+                "calculate_savings": parent.calculate_savings,
+                "tariffs_import": parent.tariffs_import,
+                "save_file": parent.save_file,
+            }
+        )
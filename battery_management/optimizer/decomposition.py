@@ -0,0 +1,491 @@
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from ortools.linear_solver import linear_solver_pb2, pywraplp
+
+from battery_management.optimizer.battery_optimization_or import FleetOptimizationOR
+from battery_management.results_handler.site_result import SiteResult
+
+PDLP = linear_solver_pb2.MPModelRequest.PDLP_LINEAR_PROGRAMMING
+SCIP = linear_solver_pb2.MPModelRequest.SCIP_MIXED_INTEGER_PROGRAMMING
+
+# Iterations in which rho is adapted to the residuals
+ADAPTIVE_ITERATIONS = 50
+
+# Inputs of the site that only enter the grid subproblem
+SITE_INPUTS = [
+    "tariffs_import",
+    "tariffs_export",
+    "triad_tariffs_import",
+    "triad_tariffs_export",
+    "capacity_tariffs_import",
+    "capacity_tariffs_export",
+    "site_load",
+    "site_load_restriction_charge",
+    "site_load_restriction_discharge",
+]
+
+
+def solve_subproblem(
+    model: bytes,
+    solver_type: int,
+    x_index: np.ndarray,
+    rho: float,
+    target: np.ndarray,
+    output: np.ndarray,
+) -> Tuple[int, float, np.ndarray]:
+    """
+    Solve a subproblem of the decomposition: the linear model plus the proximal term rho / 2 * ||x - target||^2 on
+    the coupling variables. Module level so that it can run in a worker process.
+
+    Parameters
+    ----------
+    model: bytes
+        Serialized MPModelProto of the linear model
+    solver_type: int
+        MPModelRequest.SolverType, PDLP for pure LPs, SCIP if the model has integer variables
+    x_index: np.ndarray
+        Index of the coupling variable of every time step
+    rho: float
+        Penalty parameter of the proximal term
+    target: np.ndarray
+        Target of the coupling variables
+    output: np.ndarray
+        Index of the variables whose values are returned, -1 for zero
+
+    Returns
+    -------
+    Tuple[int, float, np.ndarray]
+        Status of the solver, value of the linear objective without the proximal term, values of the output
+        variables
+    """
+    proto = linear_solver_pb2.MPModelProto()
+    proto.ParseFromString(model)
+
+    linear = np.array([v.objective_coefficient for v in proto.variable])
+    for k, value in zip(x_index.tolist(), (-rho * target).tolist()):
+        proto.variable[k].objective_coefficient = linear[k] + value
+    proto.quadratic_objective.qvar1_index.extend(x_index.tolist())
+    proto.quadratic_objective.qvar2_index.extend(x_index.tolist())
+    proto.quadratic_objective.coefficient.extend([rho / 2] * len(x_index))
+
+    request = linear_solver_pb2.MPModelRequest(model=proto, solver_type=solver_type)
+    response = linear_solver_pb2.MPSolutionResponse()
+    pywraplp.Solver.SolveWithProto(request, response)
+    if response.status not in [
+        linear_solver_pb2.MPSOLVER_OPTIMAL,
+        linear_solver_pb2.MPSOLVER_FEASIBLE,
+    ]:
+        return response.status, np.nan, np.array([])
+
+    values = np.array(response.variable_value)
+    objective = float(linear @ values + proto.objective_offset)
+    # -1 for entries that are constant zero, cf. FleetOptimizationOR.sparse_time
+    return response.status, objective, np.where(output >= 0, values[output], 0)
+
+
+def _solve_chunk(tasks: List[tuple]) -> List[Tuple[int, float, np.ndarray]]:
+    return [solve_subproblem(*task) for task in tasks]
+
+
+class ADMMOptimizer:
+    """
+    Optimizes a site by decomposing it into one subproblem per battery, coordinated by ADMM (sharing problem, cf.
+    Boyd et al., "Distributed Optimization and Statistical Learning via the Alternating Direction Method of
+    Multipliers", section 7.3).
+
+    The batteries of a site only interact through the overall electricity balance: the grid power is the site load
+    plus the sum of what the batteries draw. Every battery subproblem contains the constraints and costs of a single
+    battery (limits, energy, targets, cycle costs). The grid subproblem contains everything of the site: energy,
+    triad and capacity tariffs and the purchase and feed limits, with the power drawn by the fleet as variable. Each
+    iteration solves all battery subproblems in parallel with a quadratic penalty pulling them towards their share
+    of the fleet power, then the grid subproblem, and updates the prices (scaled duals) of the balance.
+
+    Subproblems are quadratic programs solved with PDLP, or SCIP if a battery needs binaries (minimum charging
+    power, single continuous sessions), in which case the result is a heuristic. Memory per iteration is bounded
+    by the largest subproblem per worker. At the end the grid subproblem is solved once more as LP with the fleet
+    power of the battery schedules, which gives grid power and costs of the result.
+    """
+
+    def __init__(
+        self,
+        optimizer: FleetOptimizationOR,
+        rho: float = 0.1,
+        max_iterations: int = 200,
+        tolerance: float = 1e-3,
+        processes: Optional[int] = None,
+    ):
+        """
+
+        Parameters
+        ----------
+        optimizer: FleetOptimizationOR
+            Fully configured optimizer of the site: batteries, prices, site load, flags. It is not optimized itself.
+            Charging points, flexibility, marketed volumes and the spiky penalty couple the batteries beyond the
+            balance and are not supported. Feeding in must not pay more than purchasing at any time step (cf.
+            FleetOptimizationOR._redundant_binaries), otherwise the grid subproblem is not convex.
+        rho: float
+            Initial penalty parameter in cost per kW^2. It is adapted during the iterations so that primal and dual
+            residual stay balanced.
+        max_iterations: int
+            Maximum number of iterations. If it is reached, the result is flagged with limit_reached.
+        tolerance: float
+            Absolute (kW per time step) and relative convergence threshold of primal and dual residual.
+        processes: int, optional
+            Number of worker processes for the battery subproblems, by default the number of CPUs. With 1 they are
+            solved in the calling process.
+        """
+        if rho <= 0 or max_iterations < 1 or tolerance <= 0:
+            raise ValueError("rho, max_iterations and tolerance must be positive")
+        if optimizer.charging_points:
+            raise ValueError("ADMM does not support charging points")
+        if any(
+            getattr(optimizer, key) is not None
+            for key in [
+                "prices_flex_pos",
+                "prices_flex_neg",
+                "marketed_flex_pos",
+                "marketed_flex_neg",
+                "marketed_volumes",
+            ]
+        ):
+            raise ValueError("ADMM does not support flexibility or marketed volumes")
+        if optimizer.penalize_spiky_behaviour:
+            raise ValueError("ADMM does not support the spiky penalty")
+
+        self.optimizer = optimizer
+        self.rho = rho
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.processes = os.cpu_count() if processes is None else processes
+
+        self.iterations = []
+        # Grid subproblem with the variables of the fleet power, cf. _grid_subproblem
+        self.fleet_draw = []
+        self.grid_model = None
+
+    # ---------------------------------------------------
+    #  Subproblems
+    # ---------------------------------------------------
+
+    @staticmethod
+    def _index(shell: Dict[int, Any]) -> np.ndarray:
+        # Entries dropped from a sparse model are constants, cf. FleetOptimizationOR.sparse_time
+        return np.array(
+            [x.index() if hasattr(x, "index") else -1 for x in shell.values()], int
+        )
+
+    def _battery_subproblem(self, battery) -> Dict[str, Any]:
+        """
+        Model of a single battery without the site, plus the power it draws from the grid as coupling variable x:
+        x[t] = charge[t] / efficiency_charge - discharge[t] * efficiency_discharge
+        """
+        parent = self.optimizer
+        fo = parent.derive(
+            batteries=[copy.copy(battery)],
+            marketed_volumes=None,
+            mask_marketed=None,
+            # Binaries stay if the fleet needs them
+            relax_binaries=parent.relax_binaries
+            and parent._redundant_binaries()["fleet"],
+            **{key: None for key in SITE_INPUTS},
+            **self._detached(),
+        )
+        fo._build_model()
+
+        proto = linear_solver_pb2.MPModelProto()
+        fo.model.ExportModelToProto(proto)
+        charge = self._index(fo.fleet_power[battery.id]["charge"])
+        discharge = self._index(fo.fleet_power[battery.id]["discharge"])
+
+        x_index = np.arange(len(proto.variable), len(proto.variable) + parent.n_t)
+        for t in range(parent.n_t):
+            proto.variable.add(lower_bound=-np.inf, upper_bound=np.inf, name=f"x_{t}")
+            row = proto.constraint.add(lower_bound=0, upper_bound=0, name=f"x_{t}")
+            row.var_index.append(int(x_index[t]))
+            row.coefficient.append(1)
+            for k, coefficient in [
+                (charge[t], -1 / battery.efficiency_charge),
+                (discharge[t], battery.efficiency_discharge),
+            ]:
+                if k >= 0:
+                    row.var_index.append(int(k))
+                    row.coefficient.append(coefficient)
+
+        integer = any(v.is_integer for v in proto.variable)
+        return {
+            "battery": battery,
+            "model": proto.SerializeToString(),
+            "solver_type": SCIP if integer else PDLP,
+            "x_index": x_index,
+            "output": np.concatenate([charge, discharge, x_index]),
+            "precheck_failed": fo.precheck_failed,
+        }
+
+    def _grid_subproblem(self) -> FleetOptimizationOR:
+        """
+        Model of the site without batteries, with the power drawn by the fleet as variable z[t] in the balance
+        """
+        parent = self.optimizer
+        fo = parent.derive(batteries=[], relax_binaries=True, **self._detached())
+        fo._build_model()
+        if not fo.dropped_binaries["grid"]:
+            raise ValueError(
+                "ADMM needs export tariffs that never exceed the import tariffs, cf. _redundant_binaries"
+            )
+        self.fleet_draw = [
+            fo.model.NumVar(-fo.model.infinity(), fo.model.infinity(), f"z_{t}")
+            for t in range(parent.n_t)
+        ]
+        for z, row in zip(
+            self.fleet_draw, fo.constraints["overall_electricity_balance"]
+        ):
+            row.SetCoefficient(z, -1)
+
+        proto = linear_solver_pb2.MPModelProto()
+        fo.model.ExportModelToProto(proto)
+        self.grid_model = proto.SerializeToString()
+        return fo
+
+    @staticmethod
+    def _detached() -> Dict[str, Any]:
+        # Subproblems are neither cached, exported, stored as hints nor compressed
+        return {
+            "hint_store": None,
+            "model_cache": None,
+            "model_export": None,
+            "aggregate_batteries": False,
+            "compress_time": False,
+        }
+
+    def _solve_grid(self, rho: float, target: np.ndarray) -> np.ndarray:
+        """
+        z-update: grid costs plus rho / (2 N) * ||z - target||^2, with target the fleet power the batteries ask for
+        """
+        z_index = np.array([z.index() for z in self.fleet_draw])
+        status, _, values = solve_subproblem(
+            self.grid_model,
+            PDLP,
+            z_index,
+            rho / len(self.optimizer.batteries),
+            target,
+            z_index,
+        )
+        if status not in [
+            linear_solver_pb2.MPSOLVER_OPTIMAL,
+            linear_solver_pb2.MPSOLVER_FEASIBLE,
+        ]:
+            raise RuntimeError(f"Grid subproblem not solved, status {status}")
+        return values
+
+    def _solve_batteries(
+        self,
+        subproblems: List[Dict[str, Any]],
+        rho: float,
+        targets: np.ndarray,
+        executor: Optional[ProcessPoolExecutor],
+    ) -> List[Tuple[int, float, np.ndarray]]:
+        """
+        x-update: every battery subproblem with its own target, in parallel if there is a pool
+        """
+        tasks = [
+            (
+                sub["model"],
+                sub["solver_type"],
+                sub["x_index"],
+                rho,
+                target,
+                sub["output"],
+            )
+            for sub, target in zip(subproblems, targets)
+        ]
+        if executor is None:
+            solutions = _solve_chunk(tasks)
+        else:
+            chunks = np.array_split(np.arange(len(tasks)), self.processes * 4)
+            solutions = [
+                solution
+                for chunk in executor.map(
+                    _solve_chunk,
+                    [[tasks[i] for i in chunk] for chunk in chunks if len(chunk)],
+                )
+                for solution in chunk
+            ]
+
+        for sub, (status, _, _) in zip(subproblems, solutions):
+            if status not in [
+                linear_solver_pb2.MPSOLVER_OPTIMAL,
+                linear_solver_pb2.MPSOLVER_FEASIBLE,
+            ]:
+                raise RuntimeError(
+                    f"Subproblem of battery {sub['battery'].id} not solved, status {status}"
+                )
+        return solutions
+
+    # ---------------------------------------------------
+    #  Optimize
+    # ---------------------------------------------------
+
+    def optimize(self) -> SiteResult:
+        """
+        Iterate until primal and dual residual are below the tolerance or max_iterations is reached
+
+        Returns
+        -------
+        SiteResult
+            Result of the battery schedules of the last iteration. The objective value is the sum of the battery
+            costs and the grid costs, the residuals of every iteration are in extra_info["admm"].
+        """
+        parent = self.optimizer
+        start_solving = pd.Timestamp.now()
+
+        parent._check_feasibility()
+        subproblems = [self._battery_subproblem(bat) for bat in parent.batteries]
+        if parent.precheck_failed or any(s["precheck_failed"] for s in subproblems):
+            logger.warning(
+                "Feasibility check failed, the fleet is optimized as a whole"
+            )
+            return parent.optimize()
+        grid = self._grid_subproblem()
+
+        n_b, n_t = len(subproblems), parent.n_t
+        rho = self.rho
+        x = np.zeros((n_b, n_t))
+        z_mean = np.zeros(n_t)
+        u = np.zeros(n_t)
+        self.iterations = []
+
+        executor = None
+        if self.processes > 1 and n_b > 1:
+            executor = ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=get_context("spawn")
+            )
+        try:
+            for _ in range(self.max_iterations):
+                targets = x - x.mean(axis=0) + z_mean - u
+                solutions = self._solve_batteries(subproblems, rho, targets, executor)
+                x = np.array([values[2 * n_t :] for _, _, values in solutions])
+
+                x_mean = x.mean(axis=0)
+                z_previous = z_mean
+                z_mean = self._solve_grid(rho, n_b * (u + x_mean)) / n_b
+                u = u + x_mean - z_mean
+
+                primal = n_b * np.linalg.norm(x_mean - z_mean)
+                dual = rho * np.sqrt(n_b) * np.linalg.norm(z_mean - z_previous)
+                # Absolute and relative thresholds, cf. Boyd et al. section 3.3.1
+                threshold_primal = self.tolerance * (
+                    np.sqrt(n_t)
+                    + n_b * max(np.linalg.norm(x_mean), np.linalg.norm(z_mean))
+                )
+                threshold_dual = self.tolerance * (
+                    np.sqrt(n_t) + rho * np.sqrt(n_b) * np.linalg.norm(u)
+                )
+                converged = primal <= threshold_primal and dual <= threshold_dual
+                self.iterations.append(
+                    {"primal_residual": primal, "dual_residual": dual, "rho": rho}
+                )
+                logger.debug(
+                    f"ADMM iteration {len(self.iterations)}: primal {primal:.4f}, dual {dual:.4f}, rho {rho}"
+                )
+                if converged:
+                    break
+
+                # Residual balancing, the scaled duals follow rho. Only at the start so that the iteration settles
+                if len(self.iterations) > ADAPTIVE_ITERATIONS:
+                    continue
+                if primal > 10 * dual:
+                    rho, u = 2 * rho, u / 2
+                elif dual > 10 * primal:
+                    rho, u = rho / 2, 2 * u
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if not converged:
+            logger.warning(
+                f"ADMM stopped after {self.max_iterations} iterations | primal {primal:.4f}, dual {dual:.4f}"
+            )
+
+        # Grid power and costs for the fleet power of the schedules
+        for z, value in zip(self.fleet_draw, x.sum(axis=0)):
+            z.SetBounds(value, value)
+        grid.status = grid.model.Solve()
+        if grid.status != pywraplp.Solver.OPTIMAL:
+            raise RuntimeError(
+                f"Grid not solvable for the fleet power of the schedules, status {grid.status}"
+            )
+        battery_objective = sum(objective for _, objective, _ in solutions)
+        solver_mode = (
+            "MIP" if any(sub["solver_type"] == SCIP for sub in subproblems) else "LP"
+        )
+
+        return self._result(
+            grid, solutions, battery_objective, solver_mode, start_solving, converged
+        )
+
+    def _result(
+        self,
+        grid: FleetOptimizationOR,
+        solutions: List[Tuple[int, float, np.ndarray]],
+        battery_objective: float,
+        solver_mode: str,
+        start_solving: pd.Timestamp,
+        converged: bool,
+    ) -> SiteResult:
+        """
+        SiteResult of the battery schedules and the solved grid subproblem
+        """
+        parent = self.optimizer
+        n_t = parent.n_t
+        fleet_power = {}
+        for battery, (_, _, values) in zip(parent.batteries, solutions):
+            fleet_power[battery.id] = {
+                "charge": dict(enumerate(values[:n_t].tolist())),
+                "discharge": dict(enumerate(values[n_t : 2 * n_t].tolist())),
+            }
+        sum_power_fleet = {
+            key: {
+                t: sum(fleet_power[bat.id][key][t] for bat in parent.batteries)
+                for t in range(n_t)
+            }
+            for key in ["charge", "discharge"]
+        }
+
+        results = {
+            **grid.__dict__,
+            "batteries": parent.batteries,
+            "fleet_power": fleet_power,
+            "sum_power_fleet": sum_power_fleet,
+            "fleet_bool": {},
+            "objective_value": battery_objective + grid.model.Objective().Value(),
+            "status": 0,
+            "has_solution": True,
+            "solver_mode": solver_mode,
+            "best_bound": np.nan,
+            "mip_gap": np.nan,
+            "limit_reached": not converged,
+            "solve_time": pd.Timedelta(
+                pd.Timestamp.now() - start_solving
+            ).total_seconds(),
+            "feasibility_check": parent.feasibility_check,
+        }
+        result = SiteResult.create(
+            results, optimizer="or", default_strategy=parent.default_strategy
+        )
+        result.extra_info["admm"] = {
+            "iterations": len(self.iterations),
+            "converged": converged,
+            "residuals": self.iterations,
+        }
+        logger.info(
+            f"ADMM: {len(parent.batteries)} batteries, {len(self.iterations)} iterations in "
+            f"{result.time_elapsed:.2f}s"
+        )
+        return result
@@ -0,0 +1,189 @@
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from ortools.linear_solver import pywraplp
+
+
+class HintStore:
+    """
+    Solutions of previous optimizations, kept per site and battery so that the next request for the same site can
+    start from them (warm start).
+
+    The values of the grid power, the battery power and energy and the booleans are stored for every time step.
+    Before the next solve they are shifted by the elapsed time steps and handed to the solver as hint, cf.
+    FleetOptimizationOR.add_hint_store. Batteries unknown to the store and time steps beyond the previous horizon
+    get no hint.
+
+    Hints are used by SCIP (and CP-SAT). Note that the CBC interface of ortools ignores them and GLOP solves without.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+
+        Parameters
+        ----------
+        path: str
+            Directory to persist the hints in, one json file per site. If None, hints are only kept in memory.
+        """
+        self.path = path
+        self.hints = {}
+
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok=True)
+
+    def _filename(self, site_id) -> str:
+        return os.path.join(self.path, f"hints_site_{site_id}.json")
+
+    def get(self, site_id) -> Optional[Dict]:
+        """
+        The stored solution of a site, None if there is none
+
+        Parameters
+        ----------
+        site_id
+            ID of the optimizer, cf. FleetOptimizationBaseclass
+
+        Returns
+        -------
+        Dict
+        """
+        key = str(site_id)
+        if key not in self.hints and self.path is not None:
+            filename = self._filename(key)
+            if os.path.exists(filename):
+                with open(filename) as f:
+                    self.hints[key] = json.load(f)
+        return self.hints.get(key)
+
+    @staticmethod
+    def _values(shell: Dict) -> List[float]:
+        """
+        Solution values of a dictionary {t: variable, expression or constant}
+        """
+        return [
+            value.solution_value() if hasattr(value, "solution_value") else float(value)
+            for _, value in sorted(shell.items())
+        ]
+
+    def save(self, optimizer) -> int:
+        """
+        Store the solution of a solved optimizer under its id
+
+        Parameters
+        ----------
+        optimizer: FleetOptimizationOR
+
+        Returns
+        -------
+
+        """
+        batteries = {}
+        for battery in optimizer.model_batteries:
+            i = battery.id
+            values = {
+                key: self._values(optimizer.fleet_power[i][key])
+                for key in ["charge", "discharge"]
+            }
+            values["energy"] = self._values(optimizer.fleet_energy[i])
+            for key, shell in optimizer.fleet_bool.get(i, {}).items():
+                values[f"bool_{key}"] = self._values(shell)
+            batteries[str(i)] = values
+
+        grid = {
+            key: self._values(shell)
+            for key, shell in optimizer.grid_power.items()
+            if shell
+        }
+        for key, shell in optimizer.grid_bool.items():
+            if shell:
+                grid[f"bool_{key}"] = self._values(shell)
+
+        record = {
+            "start": None
+            if optimizer.date_range is None
+            else pd.Timestamp(optimizer.date_range[0]).isoformat(),
+            "dt": np.asarray(optimizer.dt).tolist(),
+            "grid": grid,
+            "batteries": batteries,
+        }
+
+        key = str(optimizer.id)
+        self.hints[key] = record
+        if self.path is not None:
+            with open(self._filename(key), "w") as f:
+                json.dump(record, f)
+
+        return 0
+
+    @staticmethod
+    def elapsed_steps(record: Dict, optimizer) -> int:
+        """
+        Number of time steps between the stored solution and the optimizer. Requires the date range of both, 0
+        otherwise. With one duration per time step, the duration of the first step is used.
+        """
+        if record["start"] is None or optimizer.date_range is None:
+            return 0
+        elapsed = pd.Timestamp(optimizer.date_range[0]) - pd.Timestamp(record["start"])
+        dt = optimizer.step_durations()[0]
+        return int(round(elapsed.total_seconds() / (3600 * dt)))
+
+    def hint(
+        self, optimizer, elapsed_steps: Optional[int] = None
+    ) -> Tuple[List[pywraplp.Variable], List[float]]:
+        """
+        Variables of a built optimizer and their values from the stored solution of the same site, shifted by the
+        elapsed time steps: the hint of step t is the stored value of step t + elapsed_steps.
+
+        Parameters
+        ----------
+        optimizer: FleetOptimizationOR
+        elapsed_steps: int
+            If None, it is derived from the date ranges, cf. elapsed_steps
+
+        Returns
+        -------
+        Tuple[List[pywraplp.Variable], List[float]]
+        """
+        record = self.get(optimizer.id)
+        if record is None:
+            return [], []
+        if elapsed_steps is None:
+            elapsed_steps = self.elapsed_steps(record, optimizer)
+        if elapsed_steps < 0:
+            return [], []
+
+        variables, values = [], []
+
+        def add(shell: Dict, stored: List[float]):
+            stored = np.asarray(stored, dtype=float)[elapsed_steps:]
+            for t, var in shell.items():
+                if t < len(stored) and isinstance(var, pywraplp.Variable):
+                    variables.append(var)
+                    values.append(float(stored[t]))
+
+        for key, stored in record["grid"].items():
+            if key.startswith("bool_"):
+                add(optimizer.grid_bool[key[len("bool_") :]], stored)
+            else:
+                add(optimizer.grid_power[key], stored)
+
+        for battery in optimizer.model_batteries:
+            stored = record["batteries"].get(str(battery.id))
+            if stored is None:
+                continue
+            i = battery.id
+            for key, shell in optimizer.fleet_power[i].items():
+                add(shell, stored[key])
+            add(optimizer.fleet_energy[i], stored["energy"])
+            for key, shell in optimizer.fleet_bool.get(i, {}).items():
+                if f"bool_{key}" in stored:
+                    add(shell, stored[f"bool_{key}"])
+
+        logger.debug(
+            f"Hint for site {optimizer.id}: {len(variables)} variables, shifted by {elapsed_steps} steps"
+        )
+        return variables, values
@@ -0,0 +1,153 @@
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# Attributes of FleetOptimizationOR that make up a built model, cf. FleetOptimizationOR._build_model
+MODEL_ATTRIBUTES = [
+    "model",
+    "grid_power",
+    "grid_peak",
+    "fleet_power",
+    "fleet_energy",
+    "grid_bool",
+    "fleet_bool",
+    "sum_power_fleet",
+    "sum_power_fleet_diff",
+    "site_constraint",
+    "flex_pos",
+    "flex_neg",
+    "flex_pos_total",
+    "flex_neg_total",
+    "cost",
+    "constraints",
+    "marketed_volumes_diff",
+    "battery_constraints",
+    "battery_bounds",
+    "battery_costs",
+    "dropped_binaries",
+    "solver_mode",
+    "_built_structure",
+    "_model_owner",
+]
+
+
+def _json_default(value: Any):
+    if isinstance(value, (np.ndarray, pd.Series, pd.Index)):
+        return np.asarray(value).tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return repr(value)
+
+
+def hash_inputs(inputs: Dict[str, Any]) -> str:
+    """
+    Stable hash of a dictionary of inputs: arrays, numpy scalars and timestamps are converted to plain values, the
+    keys are sorted.
+
+    Parameters
+    ----------
+    inputs: Dict[str, Any]
+
+    Returns
+    -------
+    str
+        Hex digest (sha256)
+    """
+    payload = json.dumps(inputs, sort_keys=True, default=_json_default)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ModelCache:
+    """
+    Bounded cache of built models, keyed by the fingerprint of their structural inputs (cf.
+    FleetOptimizationOR.fingerprint). If the cache is full, the least recently used model is dropped.
+
+    A cached model is shared: the optimizer that takes it from the cache patches prices and site load in place and
+    solves it. Another optimizer sharing it patches its own values back before it updates or solves again (cf.
+    FleetOptimizationOR.resolve), so optimizers using the same cache should solve one after another, not
+    concurrently.
+    """
+
+    def __init__(self, maxsize: int = 8):
+        """
+
+        Parameters
+        ----------
+        maxsize: int
+            Maximum number of models kept
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.models = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.models)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.models
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        The model attributes stored under key, None if there are none
+
+        Parameters
+        ----------
+        key: str
+            Fingerprint
+
+        Returns
+        -------
+        Dict[str, Any]
+        """
+        if key not in self.models:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.models.move_to_end(key)
+        return self.models[key]
+
+    def put(self, key: str, state: Dict[str, Any]) -> int:
+        """
+        Store the attributes of a built model under key
+
+        Parameters
+        ----------
+        key: str
+            Fingerprint
+        state: Dict[str, Any]
+            Attributes of the optimizer, cf. MODEL_ATTRIBUTES
+
+        Returns
+        -------
+
+        """
+        self.models[key] = state
+        self.models.move_to_end(key)
+        while len(self.models) > self.maxsize:
+            self.models.popitem(last=False)
+        return 0
+
+    def discard(self, key: str) -> int:
+        """
+        Drop the model stored under key, e.g. because it was changed in place
+
+        Parameters
+        ----------
+        key: str
+            Fingerprint
+
+        Returns
+        -------
+
+        """
+        self.models.pop(key, None)
+        return 0
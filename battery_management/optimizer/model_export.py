@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+from typing import Any, Dict, Optional
+
+import pandas as pd
+from loguru import logger
+from ortools.linear_solver import linear_solver_pb2, pywraplp
+from ortools.linear_solver.python import model_builder
+
+from battery_management.optimizer.solver_settings import SolverSettings
+
+# File formats and the extension of the model file
+FILE_FORMATS = {"mps": ".mps", "proto": ".pb"}
+
+
+def _metadata_filename(filename: str) -> str:
+    return os.path.splitext(filename)[0] + ".json"
+
+
+def export_model(
+    model: pywraplp.Solver,
+    filename: str,
+    file_format: str = "mps",
+    metadata: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Write a built model to disk, together with a json file of the same name holding the metadata (e.g. the
+    fingerprint of the inputs, cf. FleetOptimizationOR.fingerprint).
+
+    Parameters
+    ----------
+    model: pywraplp.Solver
+    filename: str
+        Path of the model file without extension
+    file_format: str
+        "mps" (free MPS, human readable) or "proto" (serialized MPModelProto, exact)
+    metadata: Dict[str, Any]
+
+    Returns
+    -------
+    str
+        Path of the model file
+    """
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f"file_format must be one of {list(FILE_FORMATS)}")
+
+    filename = filename + FILE_FORMATS[file_format]
+    if file_format == "mps":
+        with open(filename, "w") as f:
+            f.write(model.ExportModelAsMpsFormat(False, False))
+    else:
+        proto = linear_solver_pb2.MPModelProto()
+        model.ExportModelToProto(proto)
+        with open(filename, "wb") as f:
+            f.write(proto.SerializeToString())
+
+    with open(_metadata_filename(filename), "w") as f:
+        json.dump({"file_format": file_format, **(metadata or {})}, f, default=str)
+
+    logger.debug(f"Model exported to {filename}")
+    return filename
+
+
+def read_metadata(filename: str) -> Dict[str, Any]:
+    """
+    Metadata written next to a model file, empty if there is none
+
+    Parameters
+    ----------
+    filename: str
+        Path of the model file
+
+    Returns
+    -------
+    Dict[str, Any]
+    """
+    metadata_filename = _metadata_filename(filename)
+    if not os.path.exists(metadata_filename):
+        return {}
+    with open(metadata_filename) as f:
+        return json.load(f)
+
+
+def load_model(
+    filename: str,
+    solver_settings: Optional[SolverSettings] = None,
+    solver_mode: Optional[str] = None,
+) -> pywraplp.Solver:
+    """
+    Load an exported model into a new solver
+
+    Parameters
+    ----------
+    filename: str
+        Path of the model file, .mps or .pb
+    solver_settings: SolverSettings
+        Backend and limits of the solver, defaults of SolverSettings if None
+    solver_mode: str
+        "MIP" or "LP". If None, the mode of the export is used, "MIP" if the model has integer variables otherwise
+
+    Returns
+    -------
+    pywraplp.Solver
+    """
+    if filename.endswith(FILE_FORMATS["mps"]):
+        builder = model_builder.Model()
+        if not builder.import_from_mps_file(filename):
+            raise ValueError(f"Could not read MPS file {filename}")
+        proto = builder.export_to_proto()
+    elif filename.endswith(FILE_FORMATS["proto"]):
+        proto = linear_solver_pb2.MPModelProto()
+        with open(filename, "rb") as f:
+            proto.ParseFromString(f.read())
+    else:
+        raise ValueError(f"Unknown file format of {filename}, use .mps or .pb")
+
+    if solver_mode is None:
+        solver_mode = read_metadata(filename).get("solver_mode")
+    if solver_mode is None:
+        solver_mode = "MIP" if any(var.is_integer for var in proto.variable) else "LP"
+
+    settings = SolverSettings() if solver_settings is None else solver_settings
+    model = settings.create_solver(solver_mode)
+    error = model.LoadModelFromProto(proto)
+    if error:
+        raise ValueError(f"Could not load {filename}: {error}")
+
+    return model
+
+
+def replay(
+    filename: str,
+    solver_settings: Optional[SolverSettings] = None,
+    solver_mode: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Solve an exported model directly, without the request pipeline, e.g. to compare backends and parameters on
+    the instance
+
+    Parameters
+    ----------
+    filename: str
+        Path of the model file, .mps or .pb
+    solver_settings: SolverSettings
+        Backend and limits of the solver, defaults of SolverSettings if None
+    solver_mode: str
+        "MIP" or "LP", cf. load_model
+
+    Returns
+    -------
+    Dict[str, Any]
+        Fingerprint of the export, status, objective value, best bound, solve time in seconds, iterations and
+        model size
+    """
+    settings = SolverSettings() if solver_settings is None else solver_settings
+    model = load_model(filename, settings, solver_mode)
+
+    start_solving = pd.Timestamp.now()
+    status = model.Solve(settings.parameters())
+    solve_time = pd.Timedelta(pd.Timestamp.now() - start_solving).total_seconds()
+
+    solved = status in [pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE]
+    result = {
+        "fingerprint": read_metadata(filename).get("fingerprint"),
+        "backend": model.SolverVersion(),
+        "status": status,
+        "objective_value": model.Objective().Value() if solved else None,
+        "best_bound": model.Objective().BestBound() if solved else None,
+        "solve_time": solve_time,
+        "iterations": model.iterations(),
+        "variables": model.NumVariables(),
+        "constraints": model.NumConstraints(),
+    }
+    logger.info(f"Replay of {filename}: {result}")
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve an exported model")
+    parser.add_argument("filename", help="Model file, .mps or .pb")
+    parser.add_argument("--solver-mode", choices=["MIP", "LP"], default=None)
+    parser.add_argument("--mip-backend", default="CBC")
+    parser.add_argument("--lp-backend", default="GLOP")
+    parser.add_argument("--num-threads", type=int, default=None)
+    parser.add_argument("--time-limit", type=float, default=None)
+    parser.add_argument("--relative-gap", type=float, default=None)
+    args = parser.parse_args()
+
+    settings = SolverSettings(
+        mip_backend=args.mip_backend,
+        lp_backend=args.lp_backend,
+        num_threads=args.num_threads,
+        time_limit=args.time_limit,
+        relative_gap=args.relative_gap,
+    )
+    print(json.dumps(replay(args.filename, settings, args.solver_mode), indent=2))
+
+
+if __name__ == "__main__":
+    main()
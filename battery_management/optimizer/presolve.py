@@ -0,0 +1,167 @@
+from dataclasses import replace
+from typing import Dict, List, Union
+
+import numpy as np
+
+from battery_management.assets.battery import Battery
+
+
+def energy_envelopes(
+    batteries: List[Battery],
+    n_t: int,
+    dt: Union[float, np.ndarray],
+    targets: np.ndarray,
+    tol: float = 1e-9,
+) -> Dict[str, np.ndarray]:
+    """
+    Reachability based bounds for the whole fleet at once, arrays of shape (batteries, time steps).
+
+    Starting from energy_start, the energy at t can at most grow by the maximum charging power and at most shrink
+    by the maximum discharging power of the connected steps up to t (forward envelope). Batteries with a charging
+    target must moreover hold at least energy_end minus what can still be charged after t (backward envelope).
+    Both are clipped to [energy_min, energy_max]. As the energy changes by dt * (charge - discharge), the envelope
+    of two consecutive steps gives a lower bound for the charging power (steps in which the battery has to charge
+    to still meet its target).
+
+    Where lower and upper bound meet, the variable has no slack and is fixed. A battery whose envelope is empty
+    cannot reach its target; it keeps its static bounds so that the solver reports the infeasibility.
+
+    Parameters
+    ----------
+    batteries: List[Battery]
+    n_t: int
+        Number of time steps
+    dt: float or np.ndarray
+        Time discretization, one value for all or one per time step
+    targets: np.ndarray
+        One flag per battery, True if energy_end is a hard constraint on the last time step
+    tol: float
+        Tolerance below which lower and upper bound are considered equal
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        "energy_min", "energy_max", "charge_min"
+    """
+
+    def attr(name):
+        return np.array([getattr(bat, name) for bat in batteries], dtype=float)[:, None]
+
+    energy_min, energy_max = attr("energy_min"), attr("energy_max")
+    energy_start, energy_end = attr("energy_start"), attr("energy_end")
+    connected = np.array(
+        [np.asarray(bat.connected, dtype=bool) for bat in batteries]
+    ).reshape(len(batteries), n_t)
+
+    charge_step = attr("power_charge_max") * connected * dt
+    discharge_step = attr("power_discharge_max") * connected * dt
+
+    # Forward: the increments are non-negative, so clipping only saturates the cumulative sums
+    upper = np.minimum(energy_start + np.cumsum(charge_step, axis=1), energy_max)
+    lower = np.maximum(energy_start - np.cumsum(discharge_step, axis=1), energy_min)
+
+    # Backward: energy_end minus the charging still possible after t
+    still_chargeable = np.cumsum(charge_step[:, ::-1], axis=1)[:, ::-1] - charge_step
+    needed = np.where(
+        np.asarray(targets)[:, None], energy_end - still_chargeable, -np.inf
+    )
+    lower = np.maximum(lower, needed)
+
+    # Rounding may push lower slightly above upper
+    lower = np.where((lower > upper) & (lower <= upper + tol), upper, lower)
+    feasible = np.all(lower <= upper, axis=1)
+    lower = np.where(feasible[:, None], lower, energy_min)
+    upper = np.where(feasible[:, None], upper, energy_max)
+
+    # Charging bound from consecutive envelopes: dt * (charge - discharge) = E[t] - E[t-1] with discharge >= 0
+    upper_previous = np.concatenate([energy_start, upper[:, :-1]], axis=1)
+    charge_min = np.clip((lower - upper_previous) / dt, 0, charge_step / dt)
+    charge_min[charge_min < tol] = 0
+
+    return {"energy_min": lower, "energy_max": upper, "charge_min": charge_min}
+
+
+def feasibility_check(
+    batteries: List[Battery],
+    n_t: int,
+    dt: Union[float, np.ndarray],
+    targets: np.ndarray,
+    site_load: np.ndarray = None,
+    purchase_limit: float = None,
+    purchase_efficiency: float = 1,
+    tol: float = 1e-6,
+) -> Dict[str, np.ndarray]:
+    """
+    Cheap necessary conditions for the feasibility of the fleet, vectorized over all batteries.
+
+    - Targets: energy_end of a battery with a charging target must not exceed the energy reachable at the last
+      time step, energy_start plus the maximum charging in its connected steps, capped at energy_max.
+    - Site: with a hard purchase limit, the site load of every step must be covered by the limit plus the maximum
+      discharging of the fleet, and over the whole horizon the limit must cover the site load plus the least energy
+      the batteries need to meet their targets (grid side, i.e. divided by the charging efficiency).
+
+    Parameters
+    ----------
+    batteries: List[Battery]
+    n_t: int
+        Number of time steps
+    dt: float or np.ndarray
+        Time discretization, one value for all or one per time step
+    targets: np.ndarray
+        One flag per battery, True if energy_end is a hard constraint on the last time step
+    site_load: np.ndarray
+        Site load per time step, None for no site load
+    purchase_limit: float
+        Hard limit of the grid purchase, None for no limit
+    purchase_efficiency: float
+    tol: float
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        "reachable": energy reachable at the last time step per battery, "unreachable": flag per battery,
+        "site_limit": True if the purchase limit cannot cover the demand
+    """
+    targets = np.asarray(targets, dtype=bool)
+    energy_end = np.array([bat.energy_end for bat in batteries], dtype=float)
+
+    reachable = energy_envelopes(batteries, n_t, dt, np.zeros(len(batteries), bool))[
+        "energy_max"
+    ][:, -1]
+    unreachable = targets & (energy_end > reachable + tol)
+
+    site_limit = False
+    if purchase_limit is not None:
+        site_load = np.zeros(n_t) if site_load is None else np.asarray(site_load)
+        connected = np.array(
+            [np.asarray(bat.connected, dtype=bool) for bat in batteries]
+        ).reshape(len(batteries), n_t)
+        efficiency_charge = np.array([bat.efficiency_charge for bat in batteries])
+        efficiency_discharge = np.array([bat.efficiency_discharge for bat in batteries])
+        discharge = np.array([bat.power_discharge_max for bat in batteries])
+        supply = purchase_limit * purchase_efficiency + (
+            (discharge * efficiency_discharge) @ connected
+        )
+        site_limit = bool(np.any(site_load > supply + tol))
+
+        # Least change of energy per battery, targets capped at what is reachable
+        capped = [
+            replace(bat, energy_end=min(bat.energy_end, cap)) if flag else bat
+            for bat, flag, cap in zip(batteries, targets, reachable)
+        ]
+        energy_start = np.array([bat.energy_start for bat in batteries], dtype=float)
+        delta = energy_envelopes(capped, n_t, dt, targets)["energy_min"][:, -1]
+        delta = delta - energy_start
+        # Grid side: charging costs 1 / efficiency_charge, discharging yields efficiency_discharge per kWh
+        need = np.where(
+            delta > 0, delta / efficiency_charge, delta * efficiency_discharge
+        )
+        if np.all(efficiency_charge * efficiency_discharge <= 1):
+            available = np.sum((purchase_limit * purchase_efficiency - site_load) * dt)
+            site_limit = site_limit or bool(np.sum(need) > available + tol)
+
+    return {
+        "reachable": reachable,
+        "unreachable": unreachable,
+        "site_limit": site_limit,
+    }
@@ -0,0 +1,236 @@
+import copy
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from battery_management.optimizer.battery_optimization_or import FleetOptimizationOR
+from battery_management.results_handler.site_result import SiteResult
+
+# Attributes of the optimizer with one value per time step, cut to the window
+TIME_SERIES = [
+    "dt",
+    "date_range",
+    "tariffs_import",
+    "tariffs_export",
+    "triad_tariffs_import",
+    "triad_tariffs_export",
+    "marketed_volumes",
+    "mask_marketed",
+    "prices_flex_pos",
+    "prices_flex_neg",
+    "marketed_flex_pos",
+    "marketed_flex_neg",
+    "mask_flex_pos",
+    "mask_flex_neg",
+    "site_load",
+]
+
+
+class RollingHorizonOptimizer:
+    """
+    Optimizes a long period as a sequence of overlapping windows instead of one model over the whole horizon.
+
+    Every window of `window` time steps is optimized on its own, but only its first `commit` steps are kept. The
+    next window starts at the end of the committed steps, with the energy content each battery reached there as
+    energy_start. Charging targets are handed down the windows: at the end of a window a battery must hold at least
+    energy_end minus what it can still charge after the window. The purchase and feed-in peaks of the committed steps
+    are carried over as lower bounds of the peaks of the next window, so that capacity tariffs are only paid for new
+    peaks.
+
+    Model size is bounded by the window, and runtime grows linearly with the length of the horizon. The schedule is
+    not guaranteed to be optimal for the whole horizon: the longer the look-ahead (window - commit), the closer it
+    gets.
+    """
+
+    def __init__(self, optimizer: FleetOptimizationOR, window: int, commit: int):
+        """
+
+        Parameters
+        ----------
+        optimizer: FleetOptimizationOR
+            Fully configured optimizer for the whole horizon: batteries, prices, site load, flags. It is not
+            optimized itself, only copied window by window. Charging points are not supported.
+        window: int
+            Number of time steps of each window
+        commit: int
+            Number of time steps kept of each window, at most window
+        """
+        if commit < 1 or window < commit:
+            raise ValueError("window and commit must satisfy 1 <= commit <= window")
+        if optimizer.charging_points:
+            raise ValueError("Rolling horizon does not support charging points")
+
+        self.optimizer = optimizer
+        self.window = window
+        self.commit = commit
+
+    def windows(self) -> List[tuple]:
+        """
+        Start, end and number of committed steps of every window
+
+        Returns
+        -------
+        List[tuple]
+        """
+        n_t = self.optimizer.n_t
+        windows = []
+        start = 0
+        while start < n_t:
+            end = min(start + self.window, n_t)
+            committed = end - start if end == n_t else self.commit
+            windows.append((start, end, committed))
+            start += committed
+        return windows
+
+    @staticmethod
+    def _slice(value: Any, start: int, end: int) -> Any:
+        if value is None or np.ndim(value) == 0:
+            return value
+        return value[start:end]
+
+    def _window_optimizer(
+        self, start: int, end: int, energy: Dict[int, float]
+    ) -> FleetOptimizationOR:
+        """
+        Copy of the optimizer cut to the steps [start, end) with the carried energy as energy_start
+        """
+        parent = self.optimizer
+        changes = {
+            key: self._slice(getattr(parent, key), start, end) for key in TIME_SERIES
+        }
+        if changes["date_range"] is None:
+            changes["date_range"] = pd.RangeIndex(start, end)
+
+        batteries = []
+        for battery in parent.batteries:
+            connected = np.asarray(battery.connected, dtype=bool)
+            window_battery = copy.copy(battery)
+            window_battery.connected = connected[start:end].tolist()
+            window_battery.energy_start = energy[battery.id]
+            if end < parent.n_t and not battery.stationary:
+                # What has to be there at the end of the window to still reach the target
+                still_chargeable = battery.power_charge_max * np.sum(
+                    connected[end:] * parent.step_durations()[end:]
+                )
+                window_battery.energy_end = float(
+                    np.clip(
+                        battery.energy_end - still_chargeable,
+                        battery.energy_min,
+                        battery.energy_max,
+                    )
+                )
+            batteries.append(window_battery)
+
+        fo = parent.derive(
+            n_t=end - start,
+            batteries=batteries,
+            calculate_savings=False,
+            save_file=None,
+            **changes,
+        )
+        if start > 0 and parent.hint_store is not None:
+            fo.hint_elapsed_steps = self.commit
+
+        return fo
+
+    @staticmethod
+    def _set_peaks(fo: FleetOptimizationOR, peaks: Dict[str, float]):
+        """
+        Lower bounds of the peak variables of a built window
+        """
+        for key, peak in peaks.items():
+            if fo.grid_peak.get(key) is not None:
+                fo.grid_peak[key].SetLb(peak)
+
+    def optimize(self) -> SiteResult:
+        """
+        Optimize window by window and stitch the committed steps together
+
+        Returns
+        -------
+        SiteResult
+            One result for the whole horizon. The objective value is the energy cost of the committed steps (sum
+            of SpotCost, NaN without energy tariffs), the details of every window are in
+            extra_info["rolling_horizon"].
+        """
+        parent = self.optimizer
+        energy = {battery.id: battery.energy_start for battery in parent.batteries}
+        peaks = {"purchase": 0.0, "feed": 0.0}
+
+        battery_results, site_results, grid_results, windows = [], [], [], []
+        for start, end, committed in self.windows():
+            logger.debug(f"Rolling horizon: window [{start}, {end}), keep {committed}")
+            fo = self._window_optimizer(start, end, energy)
+            fo._build_model()
+            self._set_peaks(fo, peaks)
+            result = fo._solve()
+            # A cached model must not keep the bounds of this window
+            self._set_peaks(fo, {key: 0.0 for key in peaks})
+
+            times = result.date_range[:committed]
+            battery_result = result.battery_results[
+                result.battery_results.index.get_level_values("time").isin(times)
+            ]
+            battery_results.append(battery_result)
+            site_results.append(result.site_results.iloc[:committed])
+            grid_results.append(result.grid_results.iloc[:committed])
+
+            last = battery_result.xs(times[-1], level="time")["energy_content_kwh"]
+            for battery in parent.batteries:
+                energy[battery.id] = float(
+                    np.clip(last[battery.id], battery.energy_min, battery.energy_max)
+                )
+            grid_power = result.grid_results["power_kw"].iloc[:committed]
+            peaks["purchase"] = max(peaks["purchase"], float(grid_power.max()), 0.0)
+            peaks["feed"] = max(peaks["feed"], float(-grid_power.min()), 0.0)
+
+            windows.append(
+                {
+                    "start": start,
+                    "end": end,
+                    "committed": committed,
+                    "status": result.success,
+                    "has_solution": result.has_solution,
+                    "objective_value": result.objective_value,
+                    "solve_time": result.time_elapsed,
+                    "solver_mode": result.solver_mode,
+                    "limit_reached": result.limit_reached,
+                }
+            )
+
+        site_results = pd.concat(site_results)
+        statuses = [window["status"] for window in windows]
+        results = {
+            "id": parent.id,
+            "type": parent.type,
+            "objective_value": float(site_results["SpotCost"].sum())
+            if "SpotCost" in site_results.columns
+            else np.nan,
+            "solve_time": sum(window["solve_time"] for window in windows),
+            "status": next((status for status in statuses if status != 0), 0),
+            "solver_mode": "MIP"
+            if any(window["solver_mode"] == "MIP" for window in windows)
+            else "LP",
+            "has_solution": all(window["has_solution"] for window in windows),
+            "limit_reached": any(window["limit_reached"] for window in windows),
+            "dt": parent.dt,
+            "n_t": parent.n_t,
+            "date_range": pd.RangeIndex(0, parent.n_t)
+            if parent.date_range is None
+            else parent.date_range,
+            "batteries": parent.batteries,
+            "battery_results": pd.concat(battery_results).sort_index(),
+            "site_results": site_results,
+            "grid_results": pd.concat(grid_results),
+            "extra_info": {"rolling_horizon": windows},
+            "calculate_savings": parent.calculate_savings,
+            "tariffs_import": parent.tariffs_import,
+            "save_file": parent.save_file,
+        }
+        logger.info(
+            f"Rolling horizon: {len(windows)} windows solved in {results['solve_time']:.2f}s"
+        )
+
+        return SiteResult(results)
@@ -0,0 +1,113 @@
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+from loguru import logger
+from ortools.linear_solver import pywraplp
+
+# Backend names and the corresponding ortools solver ids
+MIP_BACKENDS = {"CBC": "CBC", "SCIP": "SCIP", "CP-SAT": "CP-SAT", "HiGHS": "HIGHS"}
+LP_BACKENDS = {"GLOP": "GLOP", "PDLP": "PDLP", "HiGHS": "HIGHS", "CLP": "CLP"}
+
+
+@dataclass
+class SolverSettings:
+    """
+    Solver backend and limits of the OR optimizer.
+
+    Attributes
+    ----------
+    mip_backend : str
+        Solver for models with binaries: "CBC", "SCIP", "CP-SAT" or "HiGHS".
+    lp_backend : str
+        Solver for pure LPs, cf. FleetOptimizationOR.relax_binaries: "GLOP", "PDLP", "HiGHS" or "CLP".
+    num_threads : int, optional
+        Number of threads the solver may use. None keeps the default of the backend.
+    time_limit : float, optional
+        Wall-clock limit of a solve in seconds. None for no limit.
+    relative_gap : float, optional
+        Relative MIP gap at which the search stops. None keeps the default of the backend.
+    anytime : bool
+        If True, a solve stopped at the time limit returns the best feasible solution found (status FEASIBLE)
+        instead of falling back to the default strategy. The default strategy is then only used if no feasible
+        solution was found.
+    """
+
+    mip_backend: str = "CBC"
+    lp_backend: str = "GLOP"
+    num_threads: Optional[int] = None
+    time_limit: Optional[float] = None
+    relative_gap: Optional[float] = None
+    anytime: bool = False
+
+    def __post_init__(self):
+        if self.mip_backend not in MIP_BACKENDS:
+            raise ValueError(f"mip_backend must be one of {list(MIP_BACKENDS)}")
+        if self.lp_backend not in LP_BACKENDS:
+            raise ValueError(f"lp_backend must be one of {list(LP_BACKENDS)}")
+        if self.num_threads is not None and self.num_threads < 1:
+            raise ValueError("num_threads must be positive")
+        if self.time_limit is not None and self.time_limit <= 0:
+            raise ValueError("time_limit must be positive")
+        if self.relative_gap is not None and self.relative_gap < 0:
+            raise ValueError("relative_gap must be non-negative")
+
+    def create_solver(self, solver_mode: str = "MIP") -> pywraplp.Solver:
+        """
+        Create a solver for the given mode with threads and time limit set.
+
+        Parameters
+        ----------
+        solver_mode : str
+            "MIP" or "LP"
+
+        Returns
+        -------
+        pywraplp.Solver
+
+        Raises
+        ------
+        ValueError
+            If the backend is not available in the installed ortools.
+        """
+        backend = self.mip_backend if solver_mode == "MIP" else self.lp_backend
+        solver_id = (MIP_BACKENDS if solver_mode == "MIP" else LP_BACKENDS)[backend]
+
+        model = pywraplp.Solver.CreateSolver(solver_id)
+        # Unknown ids may silently fall back to another backend
+        if model is None or backend.lower() not in model.SolverVersion().lower():
+            raise ValueError(
+                f"Backend {backend} is not available in this ortools build."
+            )
+
+        if self.num_threads is not None and not model.SetNumThreads(self.num_threads):
+            logger.warning(f"Backend {backend} does not support num_threads.")
+        if self.time_limit is not None:
+            model.SetTimeLimit(int(self.time_limit * 1000))
+
+        return model
+
+    def parameters(self) -> pywraplp.MPSolverParameters:
+        """
+        Parameters to pass to Solve()
+
+        Returns
+        -------
+        pywraplp.MPSolverParameters
+        """
+        parameters = pywraplp.MPSolverParameters()
+        if self.relative_gap is not None:
+            parameters.SetDoubleParam(
+                pywraplp.MPSolverParameters.RELATIVE_MIP_GAP, self.relative_gap
+            )
+        return parameters
+
+    def dict(self) -> Dict[str, Any]:
+        """
+        Returns a dictionary representation of the SolverSettings object.
+
+        Returns
+        -------
+        Dict[str, Any]
+            A dictionary containing the SolverSettings object's attributes.
+        """
+        return asdict(self)
@@ -0,0 +1,212 @@
+import copy
+from typing import Any, List, Tuple
+
+import numpy as np
+
+from battery_management.optimizer.battery_optimization_or import FleetOptimizationOR
+
+# How each time series of the optimizer is put onto a coarser grid, cf. aggregate
+AGGREGATIONS = {
+    # Prices and powers: average over the merged steps, weighted by their duration
+    "tariffs_import": "mean",
+    "tariffs_export": "mean",
+    "triad_tariffs_import": "mean",
+    "triad_tariffs_export": "mean",
+    "site_load": "mean",
+    # Energy per step
+    "marketed_volumes": "sum",
+    "mask_marketed": "any",
+    # Flex is paid per step and has to cover what was marketed in every merged step
+    "prices_flex_pos": "sum",
+    "prices_flex_neg": "sum",
+    "marketed_flex_pos": "max",
+    "marketed_flex_neg": "max",
+    "mask_flex_pos": "any",
+    "mask_flex_neg": "any",
+}
+
+
+def time_grid(n_t: int, segments: List[Tuple[int, int]]) -> np.ndarray:
+    """
+    Coarse time step of every fine time step for a grid that gets coarser towards the end of the horizon.
+
+    Parameters
+    ----------
+    n_t: int
+        Number of fine time steps
+    segments: List[Tuple[int, int]]
+        (number of fine steps, fine steps per coarse step) from the start of the horizon on, e.g. [(16, 1), (32, 4)]
+        with 15min steps keeps the next 4 hours and merges the following 8 hours to hourly steps. Steps after the
+        last segment are merged like the last segment. A block cut off by the end of a segment is shorter.
+
+    Returns
+    -------
+    np.ndarray
+        Index of the coarse step, one per fine step
+    """
+    if not segments:
+        raise ValueError("At least one segment is needed")
+    if any(steps < 0 or factor < 1 for steps, factor in segments):
+        raise ValueError("Segments need non-negative lengths and positive factors")
+
+    sizes = []
+    covered = 0
+    for i, (steps, factor) in enumerate(segments):
+        if i == len(segments) - 1:
+            steps = max(n_t - covered, 0)
+        steps = min(steps, n_t - covered)
+        sizes += [factor] * (steps // factor) + (
+            [steps % factor] if steps % factor else []
+        )
+        covered += steps
+
+    return np.repeat(np.arange(len(sizes)), sizes)
+
+
+def _block_starts(groups: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.diff(groups, prepend=-1))
+
+
+def aggregate(values: Any, groups: np.ndarray, how: str = "mean", dt: Any = 1.0) -> Any:
+    """
+    Put a time series onto the coarse grid
+
+    Parameters
+    ----------
+    values: Any
+        One value per fine time step. None and single numbers are returned as they are
+    groups: np.ndarray
+        Coarse step of every fine step, cf. time_grid
+    how: str
+        - "mean": average weighted by the duration of the fine steps (prices, powers)
+        - "sum": sum, NaN where all values are NaN (energies, e.g. marketed volumes)
+        - "min", "max"
+        - "all", "any": for masks, e.g. connected
+    dt: float or np.ndarray
+        Duration of the fine steps
+
+    Returns
+    -------
+    Any
+        One value per coarse time step
+    """
+    if values is None or np.ndim(values) == 0:
+        return values
+
+    starts = _block_starts(groups)
+    if how in ["all", "any"]:
+        values = np.asarray(values)
+        reduce = np.logical_and if how == "all" else np.logical_or
+        return reduce.reduceat(values.astype(bool), starts).astype(values.dtype)
+
+    values = np.asarray(values, dtype=float)
+    if how == "mean":
+        dt = np.broadcast_to(np.asarray(dt, dtype=float), values.shape)
+        return np.add.reduceat(values * dt, starts) / np.add.reduceat(dt, starts)
+    if how == "sum":
+        finite = np.isfinite(values)
+        total = np.add.reduceat(np.where(finite, values, 0), starts)
+        return np.where(np.logical_or.reduceat(finite, starts), total, np.nan)
+    if how == "min":
+        return np.minimum.reduceat(values, starts)
+    if how == "max":
+        return np.maximum.reduceat(values, starts)
+    raise ValueError(f"Unknown aggregation {how}")
+
+
+def expand(values: Any, groups: np.ndarray) -> Any:
+    """
+    Bring a time series of the coarse grid back to the fine grid, every fine step gets the value of its coarse
+    step (e.g. power)
+
+    Parameters
+    ----------
+    values: Any
+        One value per coarse time step
+    groups: np.ndarray
+        Coarse step of every fine step, cf. time_grid
+
+    Returns
+    -------
+    Any
+    """
+    if values is None or np.ndim(values) == 0:
+        return values
+    return np.asarray(values)[groups]
+
+
+def coarsen(optimizer: FleetOptimizationOR, groups: np.ndarray) -> FleetOptimizationOR:
+    """
+    Copy of a configured optimizer on the coarse grid: dt becomes the duration of each coarse step, tariffs, site
+    load, marketed volumes and flex are aggregated as in AGGREGATIONS, and a battery counts as connected in a coarse
+    step if it is connected in all of its fine steps.
+
+    Parameters
+    ----------
+    optimizer: FleetOptimizationOR
+    groups: np.ndarray
+        Coarse step of every fine step, cf. time_grid
+
+    Returns
+    -------
+    FleetOptimizationOR
+    """
+    if len(groups) != optimizer.n_t:
+        raise ValueError("The grid needs one entry per time step of the optimizer")
+
+    dt = optimizer.step_durations()
+    starts = _block_starts(groups)
+    changes = {
+        key: aggregate(getattr(optimizer, key), groups, how, dt)
+        for key, how in AGGREGATIONS.items()
+    }
+
+    batteries = []
+    for battery in optimizer.batteries:
+        coarse_battery = copy.copy(battery)
+        coarse_battery.connected = aggregate(
+            np.asarray(battery.connected, dtype=bool), groups, "all"
+        ).tolist()
+        batteries.append(coarse_battery)
+
+    return optimizer.derive(
+        n_t=len(starts),
+        dt=np.add.reduceat(dt, starts),
+        date_range=None
+        if optimizer.date_range is None
+        else optimizer.date_range[starts],
+        batteries=batteries,
+        **changes,
+    )
+
+
+def constant_blocks(optimizer: FleetOptimizationOR) -> np.ndarray:
+    """
+    Grid that merges consecutive time steps in which nothing changes: duration, tariffs, triad tariffs, site load,
+    marketed volumes, flex and their masks, and the connected state of every battery. Solving on this grid loses
+    nothing as long as the model is a pure LP, cf. FleetOptimizationOR.compress_time.
+
+    Parameters
+    ----------
+    optimizer: FleetOptimizationOR
+
+    Returns
+    -------
+    np.ndarray
+        Index of the merged step, one per time step
+    """
+    n_t = optimizer.n_t
+    series = [optimizer.step_durations()]
+    series += [
+        np.broadcast_to(np.asarray(getattr(optimizer, key), dtype=float), (n_t,))
+        for key in AGGREGATIONS
+        if getattr(optimizer, key) is not None
+    ]
+    series += [
+        np.asarray(battery.connected, dtype=float) for battery in optimizer.batteries
+    ]
+    values = np.column_stack(series)
+
+    same = (values[1:] == values[:-1]) | (np.isnan(values[1:]) & np.isnan(values[:-1]))
+    changed = np.concatenate([[True], ~np.all(same, axis=1)])
+    return np.cumsum(changed) - 1
@@ -1,4 +1,7 @@
-from typing import List, Optional
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, List, Optional
 
 import numpy as np
 import pandas as pd
@@ -7,6 +10,11 @@ from loguru import logger
 from battery_management.assets.battery import Battery
 from battery_management.optimizer.battery_optimization_or import FleetOptimizationOR
 from battery_management.results_handler.pool_result import PoolResult
+from battery_management.results_handler.site_result import SiteResult
+
+
+def _optimize(fleet_optimizer: FleetOptimizationOR) -> SiteResult:
+    return fleet_optimizer.optimize()
 
 
 class PoolOptimizer:
@@ -15,6 +23,9 @@ class PoolOptimizer:
         fleet_optimizer: List[FleetOptimizationOR],
         marketed_volumes: Optional[np.ndarray] = None,
         datetime_index: Optional[pd.DatetimeIndex] = None,
+        max_iterations: int = 20,
+        tolerance: float = 1e-3,
+        processes: Optional[int] = None,
     ):
         """
         Initialize the PoolOptimizer.
@@ -27,10 +38,26 @@ class PoolOptimizer:
             Marketed volumes to be matched.
         datetime_index : Optional[pd.DatetimeIndex], default=None
             Date-time index for the results.
+        max_iterations : int, default=20
+            Maximum number of iterations of the coordinated optimization, cf. _coordinated_dispatcher.
+        tolerance : float, default=1e-3
+            Pool volume gap in kWh per time step below which the coordinated optimization stops.
+        processes : Optional[int], default=None
+            Number of worker processes of the coordinated optimization, by default the number of CPUs. With 1 the
+            fleets are solved in the calling process.
         """
+        if max_iterations < 1 or tolerance <= 0:
+            raise ValueError("max_iterations and tolerance must be positive")
+
         self.fleet_optimizer = fleet_optimizer
         self.marketed_volumes = marketed_volumes
         self.datetime_index = datetime_index
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.processes = os.cpu_count() if processes is None else processes
+
+        # Pool volume gap and multipliers of every iteration of the coordinated optimization
+        self.iterations = []
 
     def optimize(self, type: str = "simple") -> PoolResult:
         """
@@ -39,7 +66,10 @@ class PoolOptimizer:
         Parameters
         ----------
         type : str, default="simple"
-            Type of optimization to use.
+            Type of optimization to use:
+            - "simple": marketed volumes are split by the number of batteries of each fleet, cf. _simple_dispatcher
+            - "coordinated": the split is iterated until the pool matches the marketed volumes, cf.
+              _coordinated_dispatcher
 
         Returns
         -------
@@ -55,8 +85,13 @@ class PoolOptimizer:
                 f"{len(self.datetime_index)} steps"
             )
 
+        if type not in ["simple", "coordinated"]:
+            raise ValueError(f"Unknown type of pool optimization {type}")
+
         if (self.marketed_volumes is None) or (len(self.fleet_optimizer) < 2):
             result = self._disconnected()
+        elif type == "coordinated":
+            result = self._coordinated_dispatcher()
         else:
             result = self._simple_dispatcher()
 
@@ -80,8 +115,7 @@ class PoolOptimizer:
         logger.info("Starting Simple Dispatcher Optimization")
 
         if fractions is None:
-            fractions = np.array([len(fo.batteries) for fo in self.fleet_optimizer])
-            fractions = fractions / np.sum(fractions)
+            fractions = self._battery_fractions()
 
         result = {}
         for fraction, fo in zip(fractions, self.fleet_optimizer):
@@ -94,6 +128,123 @@ class PoolOptimizer:
 
         return PoolResult(result)
 
+    def _battery_fractions(self) -> np.ndarray:
+        fractions = np.array([len(fo.batteries) for fo in self.fleet_optimizer])
+        return fractions / np.sum(fractions)
+
+    def _solve_fleets(
+        self, targets: np.ndarray, executor: Optional[ProcessPoolExecutor]
+    ) -> Dict[int, SiteResult]:
+        """
+        Optimize every fleet with its share of the marketed volumes, in parallel if there is a pool
+        """
+        if executor is None:
+            results = []
+            for target, fo in zip(targets, self.fleet_optimizer):
+                # Built models are patched in place, cf. FleetOptimizationOR.update_prices
+                fo.update_prices(marketed_volumes=target)
+                results.append(fo.resolve())
+        else:
+            results = list(
+                executor.map(
+                    _optimize,
+                    [
+                        fo.derive(
+                            marketed_volumes=target,
+                            mask_marketed=np.isfinite(target),
+                            # The solver objects of these cannot be sent to the workers
+                            hint_store=None,
+                            model_cache=None,
+                            model_export=None,
+                        )
+                        for target, fo in zip(targets, self.fleet_optimizer)
+                    ],
+                )
+            )
+        return {fo.id: result for fo, result in zip(self.fleet_optimizer, results)}
+
+    def _coordinated_dispatcher(self) -> PoolResult:
+        """
+        Split the marketed volumes so that the pool matches them as a whole, even if a fleet cannot deliver its
+        share by battery count.
+
+        The fleets are coupled by the pool volume matching constraint sum_f delivered_f[t] == marketed[t]. Each fleet
+        matches its share with the usual penalty on the absolute difference (cf.
+        FleetOptimizationOR._calc_cost_marketed_volumes). Every iteration solves all fleets in parallel, then updates
+        the multiplier of each time step with the pool volume gap, and sets the shares to what each fleet delivered
+        plus its fraction of gap and multiplier (scaled duals of the sharing problem, cf. decomposition.ADMMOptimizer).
+        Fleets with spare capacity pick up what others miss, until the gap is below the tolerance or does not
+        change any more because the pool as a whole cannot deliver more. The fleet results of the iteration with the
+        smallest gap are returned.
+
+        Returns
+        -------
+        PoolResult
+            Result of the coordinated optimization. The gap and multipliers of every iteration are in iterations.
+        """
+        start_optimization = pd.Timestamp.now()
+        logger.info("Starting Coordinated Dispatcher Optimization")
+
+        marketed = np.asarray(self.marketed_volumes, dtype=float)
+        mask = np.isfinite(marketed)
+        fractions = self._battery_fractions()[:, None]
+        targets = np.where(mask, marketed * fractions, np.nan)
+        multiplier = np.zeros(len(marketed))
+        self.iterations = []
+
+        executor = None
+        if self.processes > 1:
+            executor = ProcessPoolExecutor(
+                max_workers=min(self.processes, len(self.fleet_optimizer)),
+                mp_context=get_context("spawn"),
+            )
+        best, best_gap, gap = None, np.inf, None
+        try:
+            for _ in range(self.max_iterations):
+                result = self._solve_fleets(targets, executor)
+                delivered = np.array(
+                    [
+                        result[fo.id].site_results["power_kw"].values
+                        * fo.step_durations()
+                        for fo in self.fleet_optimizer
+                    ]
+                )
+                gap_previous = gap
+                gap = np.where(mask, marketed - delivered.sum(axis=0), 0)
+                multiplier = multiplier + gap
+
+                total_gap = np.abs(gap).sum()
+                self.iterations.append(
+                    {"gap": total_gap, "multiplier": multiplier.copy()}
+                )
+                logger.debug(
+                    f"Coordination iteration {len(self.iterations)}: pool volume gap {total_gap:.4f} kWh"
+                )
+                if total_gap < best_gap:
+                    best, best_gap = result, total_gap
+                if np.abs(gap).max() <= self.tolerance or (
+                    gap_previous is not None
+                    and np.abs(gap - gap_previous).max() <= self.tolerance
+                ):
+                    break
+
+                targets = np.where(
+                    mask, delivered + fractions * (gap + multiplier), np.nan
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if np.abs(gap).max() > self.tolerance:
+            logger.warning(
+                f"Pool volume gap of {best_gap:.4f} kWh after {len(self.iterations)} iterations"
+            )
+
+        time_elapsed = (pd.Timestamp.now() - start_optimization).total_seconds()
+        logger.info(f"Time elapsed for Pool Optimization: {time_elapsed}s")
+
+        return PoolResult(best)
+
     def _disconnected(self) -> PoolResult:
         """
         Perform disconnected optimization.
@@ -117,6 +268,10 @@ class PoolOptimizer:
             )
             if fleet_result.success == 0:
                 logger.debug("Optimization successful")
+            elif fleet_result.has_solution:
+                logger.warning(
+                    f"Fleet optimization {fo.id} stopped at the limit, gap {fleet_result.mip_gap:.2%}"
+                )
             else:
                 logger.warning(f"Fleet optimization {fo.id} failed!")
             result[fo.id] = fleet_result
@@ -0,0 +1,94 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from battery_management.assets.battery import Battery
+
+BASELINE_METHODS = ["inactive", "early", "continuous", "late"]
+
+
+def _fill(available: np.ndarray, need: np.ndarray) -> np.ndarray:
+    """
+    Energy per step when charging as much as available from the first step on until need is reached
+    """
+    return np.diff(
+        np.minimum(np.cumsum(available, axis=1), need[:, None]), axis=1, prepend=0
+    )
+
+
+def baseline_schedules(
+    batteries: List[Battery],
+    dt: Any,
+    methods: Sequence[str] = ("early", "continuous", "late"),
+    late_charging: Optional[int] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Non-optimized charging schedules of all batteries at once, e.g. as reference for the savings or as fallback
+    without solution. Every battery charges from energy_start to energy_end (never discharges), only in the time
+    steps it is connected and with at most power_charge_max:
+
+    - "inactive": no charging
+    - "early": full power from the start of the connection until the target is reached
+    - "continuous": constant power over all connected time steps, limited by power_charge_max
+    - "late": full power at the end of the connection, so that the target is reached just in time. With
+      late_charging, full power from that time step on instead.
+
+    Parameters
+    ----------
+    batteries: List[Battery]
+    dt: np.ndarray
+        Duration of every time step, cf. FleetOptimizationBaseclass.step_durations
+    methods: Sequence[str]
+        Strategies to compute, cf. BASELINE_METHODS
+    late_charging: int, optional
+        Time step (counted from 1) at which "late" starts charging, cf. SiteResult.default_charging
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        Charging power in kW of shape (battery, time step) per method. The energy content follows as
+        energy_start + cumsum(power * dt).
+    """
+    unknown = set(methods) - set(BASELINE_METHODS)
+    if unknown:
+        raise ValueError(
+            f"Unknown methods {sorted(unknown)}, possible values: {BASELINE_METHODS}"
+        )
+
+    dt = np.asarray(dt, dtype=float)
+    n_b, n_t = len(batteries), len(dt)
+    # A single entry holds for all time steps, e.g. stationary batteries
+    connected = np.array(
+        [
+            np.broadcast_to(np.asarray(battery.connected, dtype=bool), (n_t,))
+            for battery in batteries
+        ]
+    ).reshape(n_b, n_t)
+    power_max = np.array([battery.power_charge_max for battery in batteries], float)
+    need = np.array(
+        [max(battery.energy_end - battery.energy_start, 0) for battery in batteries],
+        dtype=float,
+    )
+    # Energy that can be charged in each step
+    available = np.where(connected, power_max[:, None] * dt, 0)
+
+    schedules = {}
+    for method in methods:
+        if method == "inactive":
+            energy = np.zeros((n_b, n_t))
+        elif method == "early":
+            energy = _fill(available, need)
+        elif method == "continuous":
+            duration = np.where(connected, dt, 0).sum(axis=1)
+            power = np.minimum(
+                np.divide(need, duration, out=np.zeros(n_b), where=duration > 0),
+                power_max,
+            )
+            energy = np.where(connected, power[:, None] * dt, 0)
+        elif late_charging is None:
+            energy = _fill(available[:, ::-1], need)[:, ::-1]
+        else:
+            start = np.arange(n_t) >= late_charging - 1
+            energy = _fill(np.where(start, available, 0), need)
+        schedules[method] = energy / dt
+    return schedules
@@ -0,0 +1,229 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class BatteryResultStore:
+    """
+    Columnar results per battery and time step: one float array of shape (battery, time step) per quantity, e.g.
+    power_kw, plus the battery ids, the time index and optional labels per battery (e.g. site_id in a pool).
+
+    The DataFrame with MultiIndex (battery_id, time) is only built on demand, cf. to_frame. Slices of batteries
+    (cf. take, battery) are views on the same arrays.
+
+    Parameters
+    ----------
+    battery_ids : Any
+        Id of every battery, one per row. Ids may repeat across the sites of a pool.
+    time : Any
+        Time index, one entry per column.
+    columns : Dict[str, np.ndarray]
+        Values of every quantity with shape (battery, time step).
+    labels : Dict[str, np.ndarray], optional
+        Values per battery that are repeated over time in the DataFrame, e.g. site_id.
+
+    Attributes
+    ----------
+    battery_ids : np.ndarray
+        Id of every battery.
+    time : pd.Index
+        Time index, named "time".
+    columns : Dict[str, np.ndarray]
+        Values of every quantity with shape (battery, time step).
+    labels : Dict[str, np.ndarray]
+        Values per battery.
+    """
+
+    def __init__(
+        self,
+        battery_ids: Any,
+        time: Any,
+        columns: Dict[str, np.ndarray],
+        labels: Optional[Dict[str, np.ndarray]] = None,
+    ):
+        self.battery_ids = np.asarray(battery_ids)
+        self.time = pd.Index(time).rename("time")
+
+        shape = (len(self.battery_ids), len(self.time))
+        self.columns = {}
+        for name, values in columns.items():
+            values = np.asarray(values, dtype=float)
+            if values.shape != shape:
+                raise ValueError(f"{name} has shape {values.shape}, expected {shape}")
+            self.columns[name] = values
+
+        self.labels = {}
+        for name, values in (labels or {}).items():
+            values = np.asarray(values)
+            if values.shape != shape[:1]:
+                raise ValueError(f"Label {name} needs one value per battery")
+            self.labels[name] = values
+
+        self._rows = None
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame) -> "BatteryResultStore":
+        """
+        Store of a DataFrame with MultiIndex (battery_id, time). Missing combinations of battery and time step are
+        NaN. Float columns become quantities, other columns labels with their first value per battery.
+
+        Parameters
+        ----------
+        frame : pd.DataFrame
+
+        Returns
+        -------
+        BatteryResultStore
+        """
+        battery_ids = frame.index.get_level_values("battery_id").unique()
+        time = frame.index.get_level_values("time").unique()
+        index = pd.MultiIndex.from_product(
+            [battery_ids, time], names=["battery_id", "time"]
+        )
+        if not frame.index.equals(index):
+            frame = frame.reindex(index)
+
+        shape = (len(battery_ids), len(time))
+        columns, labels = {}, {}
+        for name in frame.columns:
+            values = frame[name].to_numpy()
+            if pd.api.types.is_float_dtype(values.dtype):
+                columns[name] = values.reshape(shape)
+            else:
+                labels[name] = values.reshape(shape)[:, 0]
+        return cls(battery_ids, time, columns, labels)
+
+    @classmethod
+    def concat(
+        cls, stores: List["BatteryResultStore"], **labels: List[Any]
+    ) -> "BatteryResultStore":
+        """
+        Stack the batteries of stores with the same time index, e.g. the sites of a pool. Quantities missing in a
+        store are NaN.
+
+        Parameters
+        ----------
+        stores : List[BatteryResultStore]
+        labels : List[Any]
+            One value per store that becomes a label of each of its batteries, e.g. site_id=[1, 2].
+
+        Returns
+        -------
+        BatteryResultStore
+        """
+        if any(not store.time.equals(stores[0].time) for store in stores):
+            raise ValueError("Only stores with the same time index can be stacked")
+
+        names = list(dict.fromkeys(name for store in stores for name in store.columns))
+        columns = {
+            name: np.concatenate(
+                [
+                    store.columns[name]
+                    if name in store.columns
+                    else np.full(store.shape, np.nan)
+                    for store in stores
+                ]
+            )
+            for name in names
+        }
+        stacked_labels = {
+            name: np.concatenate(
+                [np.repeat(label, len(store)) for label, store in zip(values, stores)]
+            )
+            for name, values in labels.items()
+        }
+        return cls(
+            np.concatenate([store.battery_ids for store in stores]),
+            stores[0].time,
+            columns,
+            stacked_labels,
+        )
+
+    @property
+    def shape(self):
+        return len(self.battery_ids), len(self.time)
+
+    def __len__(self) -> int:
+        return len(self.battery_ids)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def __setitem__(self, name: str, values: np.ndarray):
+        self.columns[name] = np.broadcast_to(
+            np.asarray(values, dtype=float), self.shape
+        ).copy()
+
+    def row(self, battery_id: Any) -> int:
+        """
+        Row of a battery, the first one if the id repeats
+        """
+        if self._rows is None:
+            self._rows = {}
+            for k, i in enumerate(self.battery_ids.tolist()):
+                self._rows.setdefault(i, k)
+        return self._rows[battery_id]
+
+    def take(self, rows: slice) -> "BatteryResultStore":
+        """
+        Store of a range of rows, e.g. the batteries of one site in a pool, as views on the arrays
+
+        Parameters
+        ----------
+        rows : slice
+
+        Returns
+        -------
+        BatteryResultStore
+        """
+        return BatteryResultStore(
+            self.battery_ids[rows],
+            self.time,
+            {name: values[rows] for name, values in self.columns.items()},
+            {name: values[rows] for name, values in self.labels.items()},
+        )
+
+    def battery(self, battery_id: Any) -> "BatteryResultStore":
+        """
+        Store of a single battery, as views on the arrays
+        """
+        k = self.row(battery_id)
+        return self.take(slice(k, k + 1))
+
+    def schedule(self, battery_id: Any) -> pd.DataFrame:
+        """
+        Results of a single battery indexed by time, same as to_frame().xs(battery_id, level="battery_id")
+        """
+        k = self.row(battery_id)
+        return pd.DataFrame(
+            {name: values[k] for name, values in self.columns.items()},
+            index=self.time,
+        )
+
+    def total(self, name: str) -> np.ndarray:
+        """
+        Sum of a quantity over all batteries per time step, e.g. the power of the site
+        """
+        return self.columns[name].sum(axis=0)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        DataFrame with MultiIndex (battery_id, time), one column per quantity and label
+
+        Returns
+        -------
+        pd.DataFrame
+        """
+        index = pd.MultiIndex.from_product(
+            [self.battery_ids, self.time], names=["battery_id", "time"]
+        )
+        n_t = len(self.time)
+        data = {name: values.reshape(-1) for name, values in self.columns.items()}
+        data.update(
+            {name: np.repeat(values, n_t) for name, values in self.labels.items()}
+        )
+        return pd.DataFrame(data, index=index)
@@ -1,8 +1,12 @@
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 import pandas as pd
 from loguru import logger
 
+from battery_management.results_handler.battery_result_store import (
+    BatteryResultStore,
+)
+
 
 class PoolResult:
     """
@@ -20,7 +24,9 @@ class PoolResult:
     site_results : pd.DataFrame
         DataFrame containing aggregated site results.
     battery_results : pd.DataFrame
-        DataFrame containing aggregated battery results.
+        DataFrame containing aggregated battery results, built from battery_store on first access.
+    battery_store : Optional[BatteryResultStore]
+        Battery results of all sites with the site_id as label, None if the sites have different time indices.
     pool_results : pd.DataFrame
         DataFrame containing aggregated pool results.
     """
@@ -29,7 +35,6 @@ class PoolResult:
         logger.debug("Transform BOP result into VPP format")
         self.site_result_dictionary = results_dict
         self.site_results = pd.DataFrame()
-        self.battery_results = pd.DataFrame()
         self.pool_results = pd.DataFrame()
 
         for site_id, site_result in results_dict.items():
@@ -37,13 +42,53 @@ class PoolResult:
             df_site["site_id"] = site_id
             self.site_results = pd.concat([self.site_results, df_site])
 
-            next_battery = site_result.battery_results.copy()
-            next_battery["site_id"] = site_id
-            self.battery_results = pd.concat([self.battery_results, next_battery])
+        # Battery results are stacked as arrays, the rows of each site are a contiguous block
+        self.battery_store = None
+        self._battery_frame = None
+        self.site_rows = {}
+        stores = [result.battery_store for result in results_dict.values()]
+        if stores and all(store.time.equals(stores[0].time) for store in stores):
+            self.battery_store = BatteryResultStore.concat(
+                stores, site_id=list(results_dict)
+            )
+            start = 0
+            for site_id, store in zip(results_dict, stores):
+                self.site_rows[site_id] = slice(start, start + len(store))
+                start += len(store)
+        else:
+            self._battery_frame = pd.DataFrame()
+            for site_id, site_result in results_dict.items():
+                next_battery = site_result.battery_results.copy()
+                next_battery["site_id"] = site_id
+                self._battery_frame = pd.concat([self._battery_frame, next_battery])
 
         self.pool_results = self.site_results.groupby("time").sum()
         self.pool_results = self.pool_results.drop(columns="site_id", errors="ignore")
 
+    @property
+    def battery_results(self) -> pd.DataFrame:
+        if self._battery_frame is None:
+            self._battery_frame = self.battery_store.to_frame()
+        return self._battery_frame
+
+    def site_store(self, site_id: Any) -> Optional[BatteryResultStore]:
+        """
+        Battery results of a single site, as views on the arrays of the pool.
+
+        Parameters
+        ----------
+        site_id : Any
+            Id of the site.
+
+        Returns
+        -------
+        Optional[BatteryResultStore]
+            None if the pool has no battery_store.
+        """
+        if self.battery_store is None:
+            return None
+        return self.battery_store.take(self.site_rows[site_id])
+
     @staticmethod
     def concatenate_results_site(
         result1: Dict[str, Any] = None, result2: Dict[str, Any] = None
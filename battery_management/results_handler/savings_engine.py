@@ -0,0 +1,152 @@
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+TARIFF_COMPONENTS = [
+    "tariffs_import",
+    "tariffs_export",
+    "triad_tariffs_import",
+    "triad_tariffs_export",
+    "capacity_tariffs_import",
+    "capacity_tariffs_export",
+]
+
+
+def _stack(values: Any, n_k: int, n_t: Optional[int] = None) -> np.ndarray:
+    """
+    Tariff component as array (tariff set, time step), or (tariff set,) for n_t None. Missing components are zero,
+    a single series holds for all tariff sets.
+    """
+    shape = (n_k,) if n_t is None else (n_k, n_t)
+    if values is None:
+        return np.zeros(shape)
+    values = np.asarray(values, dtype=float)
+    try:
+        return np.broadcast_to(values, shape)
+    except ValueError:
+        raise ValueError(f"Tariffs of shape {values.shape}, expected {shape}")
+
+
+def counterfactual_costs(
+    schedules: Union[Dict[Any, Any], np.ndarray],
+    dt: Any,
+    tariffs_import: Any = None,
+    tariffs_export: Any = None,
+    triad_tariffs_import: Any = None,
+    triad_tariffs_export: Any = None,
+    capacity_tariffs_import: Any = None,
+    capacity_tariffs_export: Any = None,
+    site_load: Any = None,
+    tariff_names: Optional[List[Any]] = None,
+    reference: Any = None,
+) -> pd.DataFrame:
+    """
+    Costs of S power schedules of the batteries of a site under K tariff sets, all S x K combinations at once.
+
+    The grid power of a schedule is site_load + schedule. Its costs are taken relative to the site load alone, as in
+    the objective of the optimizer, so a schedule without charging costs nothing:
+
+    - "cost_energy": tariffs_import * purchase - tariffs_export * feed, integrated over time
+    - "cost_triad": the same with the triad tariffs
+    - "cost_capacity": capacity tariffs times the increase of the peak purchase and feed
+
+    Parameters
+    ----------
+    schedules : Dict[Any, np.ndarray] or np.ndarray
+        Power in kW of the batteries of the site per schedule, e.g. {"optimized": ..., "early": ...}, or an array
+        (schedule, time step) with the schedules named by their position.
+    dt : float or np.ndarray
+        Time step duration, one value for all or one per time step.
+    tariffs_import, tariffs_export, triad_tariffs_import, triad_tariffs_export : np.ndarray, optional
+        Prices per time step, one row per tariff set (tariff set, time step) or one series for all, cf.
+        FleetOptimizationBaseclass.add_prices. Missing components are zero.
+    capacity_tariffs_import, capacity_tariffs_export : float or np.ndarray, optional
+        Prices of the peak purchase and feed, one per tariff set or one for all.
+    site_load : np.ndarray, optional
+        Load of the site without batteries per time step, positive for consumption.
+    tariff_names : List[Any], optional
+        Name of every tariff set, by default their position.
+    reference : Any, optional
+        Schedule the others are compared with, by default the first one.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per schedule and tariff set with the costs per component, "cost" and "saving", i.e. the cost of the
+        schedule minus the cost of the reference under the same tariffs.
+    """
+    if isinstance(schedules, dict):
+        schedule_names = list(schedules)
+        power = np.array([np.asarray(p, dtype=float) for p in schedules.values()])
+    else:
+        power = np.asarray(schedules, dtype=float)
+        schedule_names = list(range(len(power)))
+    if power.ndim != 2:
+        raise ValueError("Schedules need one power value per time step")
+    n_t = power.shape[1]
+    if reference is None:
+        reference = schedule_names[0]
+    if reference not in schedule_names:
+        raise ValueError(f"Reference {reference} is not one of the schedules")
+
+    given = {
+        "tariffs_import": tariffs_import,
+        "tariffs_export": tariffs_export,
+        "triad_tariffs_import": triad_tariffs_import,
+        "triad_tariffs_export": triad_tariffs_export,
+        "capacity_tariffs_import": capacity_tariffs_import,
+        "capacity_tariffs_export": capacity_tariffs_export,
+    }
+    if tariff_names is not None:
+        n_k = len(tariff_names)
+    else:
+        # Number of tariff sets from the leading axis of the stacked components
+        n_k = max(
+            [
+                len(np.asarray(values))
+                for name, values in given.items()
+                if values is not None
+                and np.ndim(values) == (1 if name.startswith("capacity") else 2)
+            ],
+            default=1,
+        )
+        tariff_names = list(range(n_k))
+    tariffs = {
+        name: _stack(values, n_k, None if name.startswith("capacity") else n_t)
+        for name, values in given.items()
+    }
+
+    dt = np.broadcast_to(np.asarray(dt, dtype=float), (n_t,))
+    site_load = np.zeros(n_t) if site_load is None else np.asarray(site_load, float)
+    # Purchase and feed (schedule, time step), relative to the site load alone
+    grid = site_load + power
+    purchase = np.maximum(grid, 0) - np.maximum(site_load, 0)
+    feed = np.maximum(-grid, 0) - np.maximum(-site_load, 0)
+    peak_purchase = np.maximum(grid, 0).max(axis=1) - max(site_load.max(), 0)
+    peak_feed = np.maximum(-grid, 0).max(axis=1) - max(-site_load.min(), 0)
+
+    # (schedule, time step) x (time step, tariff set) -> (schedule, tariff set)
+    components = {
+        "cost_energy": (purchase * dt) @ tariffs["tariffs_import"].T
+        - (feed * dt) @ tariffs["tariffs_export"].T,
+        "cost_triad": (purchase * dt) @ tariffs["triad_tariffs_import"].T
+        - (feed * dt) @ tariffs["triad_tariffs_export"].T,
+        "cost_capacity": peak_purchase[:, None] * tariffs["capacity_tariffs_import"]
+        + peak_feed[:, None] * tariffs["capacity_tariffs_export"],
+    }
+    cost = sum(components.values())
+    saving = cost - cost[schedule_names.index(reference)]
+
+    index = pd.MultiIndex.from_product(
+        [schedule_names, tariff_names], names=["schedule", "tariff"]
+    )
+    table = pd.DataFrame(
+        {
+            **{name: values.reshape(-1) for name, values in components.items()},
+            "cost": cost.reshape(-1),
+            "saving": saving.reshape(-1),
+        },
+        index=index,
+    )
+    return table.reset_index()
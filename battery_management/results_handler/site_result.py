@@ -1,11 +1,17 @@
-from math import floor
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Sequence
 
 import numpy as np
 import pandas as pd
-from loguru import logger
 
 from battery_management.assets.battery import Battery
+from battery_management.results_handler.baseline_schedules import baseline_schedules
+from battery_management.results_handler.battery_result_store import (
+    BatteryResultStore,
+)
+from battery_management.results_handler.savings_engine import (
+    TARIFF_COMPONENTS,
+    counterfactual_costs,
+)
 
 
 class SiteResult:
@@ -29,8 +35,18 @@ class SiteResult:
         Time taken for optimization.
     success : bool
         Whether the optimization was successful.
-    dt : float
-        Time step duration.
+    solver_mode : str
+        "LP" if the model was solved as pure linear program, "MIP" if binaries were needed.
+    has_solution : bool
+        Whether the results come from a solution of the solver: optimal, or the best incumbent in anytime mode.
+    best_bound : float
+        Best bound of the objective value found by the solver, NaN without solution.
+    mip_gap : float
+        Relative gap between the solution and the best bound of the solver, NaN without solution.
+    limit_reached : bool
+        Whether the solver stopped at the time limit.
+    dt : float or np.ndarray
+        Time step duration, one value for all or one per time step.
     n_t : int
         Number of time steps.
     date_range : pd.DatetimeIndex
@@ -38,47 +54,121 @@ class SiteResult:
     batteries : List[Battery]
         List of Battery objects.
     battery_results : pd.DataFrame
-        DataFrame containing battery results.
+        DataFrame containing battery results, built from battery_store on first access.
+    battery_store : BatteryResultStore
+        Battery results as one array (battery, time step) per quantity.
     site_results : pd.DataFrame
         DataFrame containing site results.
     grid_results : pd.DataFrame
         DataFrame containing grid results.
     extra_info : Dict[str, Any]
-        Additional information from the optimization.
+        Additional information from the optimization, computed on first access.
     savings : pd.DataFrame
-        DataFrame containing savings information.
+        DataFrame containing savings information, computed on first access.
     aggregated_results : pd.DataFrame
-        DataFrame containing aggregated results.
+        DataFrame containing aggregated results, computed on first access.
     """
 
+    # Columns of the site results per time step that are amounts rather than rates, cf. expand
+    extensive_columns = [
+        "MarketedVolumes",
+        "FlexPos",
+        "FlexNeg",
+        "CostTriadOptimized",
+        "penalty_charging",
+        "SpotCost",
+    ]
+
     def __init__(self, results: Dict[str, Any]):
         self.id = results.get("id")
         self.type = results.get("type")
         self.objective_value = results.get("objective_value")
         self.time_elapsed = results["solve_time"]
         self.success = results["status"]
+        self.solver_mode = results.get("solver_mode")
+        self.has_solution = results.get("has_solution", self.success == 0)
+        self.best_bound = results.get("best_bound", np.nan)
+        self.mip_gap = results.get("mip_gap", np.nan)
+        self.limit_reached = results.get("limit_reached", False)
         self.dt = results["dt"]
         self.n_t = results["n_t"]
         self.date_range = results["date_range"]
         self.batteries = results["batteries"]
 
+        # DataFrame or BatteryResultStore, the other one is built on demand
         self.battery_results = results["battery_results"]
         self.site_results = results["site_results"]
         self.grid_results = results["grid_results"]
 
+        # Dictionary or function that returns it
         self.extra_info = results.get("extra_info", {})
 
-        self.savings = pd.DataFrame()
-        if (
+        # Computed on first access, cf. the properties
+        self._with_savings = bool(
             results.get("calculate_savings")
             and results.get("tariffs_import") is not None
-        ):
-            self.savings = self.calculate_savings()
-
-        self.aggregated_results = self.aggregate_results()
+        )
+        self._savings = None
+        self._aggregated_results = None
         if results.get("save_file") is not None:
             self.save(results.get("save_file"))
 
+    @property
+    def extra_info(self) -> Dict[str, Any]:
+        if callable(self._extra_info):
+            self._extra_info = self._extra_info()
+        return self._extra_info
+
+    @extra_info.setter
+    def extra_info(self, extra_info: Any):
+        self._extra_info = extra_info
+
+    @property
+    def savings(self) -> pd.DataFrame:
+        if self._savings is None:
+            self._savings = (
+                self.calculate_savings() if self._with_savings else pd.DataFrame()
+            )
+        return self._savings
+
+    @savings.setter
+    def savings(self, savings: pd.DataFrame):
+        self._savings = savings
+
+    @property
+    def aggregated_results(self) -> pd.DataFrame:
+        if self._aggregated_results is None:
+            self._aggregated_results = self.aggregate_results()
+        return self._aggregated_results
+
+    @aggregated_results.setter
+    def aggregated_results(self, aggregated_results: pd.DataFrame):
+        self._aggregated_results = aggregated_results
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # A pending extra_info may refer to the solver
+        _ = self.extra_info
+        return self.__dict__
+
+    @property
+    def battery_results(self) -> pd.DataFrame:
+        if self._battery_frame is None:
+            self._battery_frame = self._battery_store.to_frame()
+        return self._battery_frame
+
+    @battery_results.setter
+    def battery_results(self, battery_results: Any):
+        if isinstance(battery_results, BatteryResultStore):
+            self._battery_store, self._battery_frame = battery_results, None
+        else:
+            self._battery_store, self._battery_frame = None, battery_results
+
+    @property
+    def battery_store(self) -> BatteryResultStore:
+        if self._battery_store is None:
+            self._battery_store = BatteryResultStore.from_frame(self._battery_frame)
+        return self._battery_store
+
     @classmethod
     def create(
         cls,
@@ -113,6 +203,114 @@ class SiteResult:
             results, default_strategy=default_strategy
         )
 
+    def expand(
+        self,
+        groups: np.ndarray,
+        dt: Any,
+        date_range: Optional[pd.Index] = None,
+        batteries: Optional[List[Battery]] = None,
+        **results,
+    ) -> "SiteResult":
+        """
+        Bring the result of a model solved on merged time steps back to the original time steps, cf.
+        time_grid.constant_blocks. Powers and prices are repeated in every original step of a merged step, costs
+        and marketed volumes are split by the duration of the original steps and the energy content is recomputed
+        from the power.
+
+        Parameters
+        ----------
+        groups : np.ndarray
+            Merged step of every original time step.
+        dt : float or np.ndarray
+            Duration of the original time steps.
+        date_range : pd.Index, optional
+            Original date range, a RangeIndex if None.
+        batteries : List[Battery], optional
+            Original batteries, by default the batteries of this result.
+        **results : dict
+            Further entries of the results of the new SiteResult, e.g. calculate_savings or save_file.
+
+        Returns
+        -------
+        SiteResult
+        """
+        n_t = len(groups)
+        batteries = self.batteries if batteries is None else batteries
+        index = pd.RangeIndex(n_t) if date_range is None else date_range
+        step_dt = np.broadcast_to(np.asarray(dt, dtype=float), (n_t,))
+        starts = np.flatnonzero(np.diff(groups, prepend=-1))
+        share = step_dt / np.add.reduceat(step_dt, starts)[groups]
+
+        def expand_frame(frame: pd.DataFrame) -> pd.DataFrame:
+            expanded = frame.iloc[groups].copy()
+            expanded.index = index.rename(frame.index.name)
+            for column in self.extensive_columns:
+                if column in expanded.columns:
+                    expanded[column] = expanded[column].values * share
+            return expanded
+
+        battery_results = []
+        for battery in batteries:
+            _results = expand_frame(
+                self.battery_results.xs(battery.id, level="battery_id")
+            )
+            _results["energy_content_kwh"] = (
+                _results["power_kw"] * step_dt
+            ).cumsum() + battery.energy_start
+            _results["soc_perc"] = _results["energy_content_kwh"] / battery.capacity
+            _results["battery_id"] = battery.id
+            battery_results.append(_results)
+        battery_results = (
+            pd.concat(battery_results)
+            .rename_axis("time")
+            .reset_index()
+            .set_index(["battery_id", "time"])
+        )
+        if not battery_results.index.is_unique:
+            raise ValueError("Battery ids must be unique")
+
+        site_results = expand_frame(self.site_results)
+        site_results["energy_content_kwh"] = (
+            battery_results["energy_content_kwh"].groupby(["time"]).sum().values
+        )
+
+        extra_info = dict(self.extra_info)
+        if "debug" in extra_info:
+            extra_info["debug"] = {
+                "disconnected": {
+                    battery_id: np.asarray(disconnected)[groups].tolist()
+                    for battery_id, disconnected in extra_info["debug"][
+                        "disconnected"
+                    ].items()
+                }
+            }
+        extra_info["time_compression"] = {"n_t": n_t, "compressed_n_t": self.n_t}
+
+        return SiteResult(
+            {
+                "id": self.id,
+                "type": self.type,
+                "objective_value": self.objective_value,
+                "solve_time": self.time_elapsed,
+                "status": self.success,
+                "solver_mode": self.solver_mode,
+                "has_solution": self.has_solution,
+                "best_bound": self.best_bound,
+                "mip_gap": self.mip_gap,
+                "limit_reached": self.limit_reached,
+                "dt": dt,
+                "n_t": n_t,
+                "date_range": index,
+                "batteries": batteries,
+                "battery_results": battery_results,
+                "site_results": site_results,
+                "grid_results": expand_frame(self.grid_results),
+                "extra_info": extra_info,
+                "tariffs_import": site_results.get("TariffsImport"),
+                **results,
+            }
+        )
+
     def save(self, filename: str) -> None:
         """
         Save aggregated results to a CSV file.
@@ -218,39 +416,108 @@ class SiteResult:
 
         return savings
 
+    def counterfactual_savings(
+        self,
+        tariffs: Optional[Dict[Any, Dict[str, Any]]] = None,
+        methods: Sequence[str] = ("early", "continuous", "late"),
+        late_charging: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """
+        Savings of the optimized schedule against non-optimized schedules of the batteries under several tariff sets,
+        cf. counterfactual_costs.
+
+        Parameters
+        ----------
+        tariffs : Dict[Any, Dict[str, Any]], optional
+            Components per tariff set by name, e.g. {"day_ahead": {"tariffs_import": ..., "capacity_tariffs_import":
+            3}}, cf. TARIFF_COMPONENTS. By default the energy and triad tariffs of the site results.
+        methods : Sequence[str]
+            Non-optimized schedules, cf. baseline_schedules.
+        late_charging : int, optional
+            Time step to start late charging, by default as late as possible.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per schedule ("optimized" and methods) and tariff set with the costs and the saving of the
+            optimized schedule, i.e. the cost of the schedule minus the cost of the optimized one.
+        """
+        if tariffs is None:
+            tariffs = {
+                "site": {
+                    name: self.site_results[column].to_numpy()
+                    for name, column in {
+                        "tariffs_import": "TariffsImport",
+                        "tariffs_export": "TariffsExport",
+                        "triad_tariffs_import": "TriadImport",
+                        "triad_tariffs_export": "TriadExport",
+                    }.items()
+                    if column in self.site_results.columns
+                }
+            }
+        for components in tariffs.values():
+            unknown = set(components) - set(TARIFF_COMPONENTS)
+            if unknown:
+                raise ValueError(
+                    f"Unknown tariff components {sorted(unknown)}, possible values: {TARIFF_COMPONENTS}"
+                )
+
+        dt = np.broadcast_to(np.asarray(self.dt, dtype=float), (self.n_t,))
+        schedules = {"optimized": self.battery_store.total("power_kw")}
+        for method, power in baseline_schedules(
+            self.batteries, dt, methods, late_charging=late_charging
+        ).items():
+            schedules[method] = power.sum(axis=0)
+
+        def stack(name):
+            rows = [components.get(name) for components in tariffs.values()]
+            if all(row is None for row in rows):
+                return None
+            size = () if name.startswith("capacity") else (self.n_t,)
+            return np.array(
+                [np.broadcast_to(0.0 if row is None else row, size) for row in rows],
+                dtype=float,
+            )
+
+        site_load = (
+            self.site_results["site_load_kw"].to_numpy()
+            if "site_load_kw" in self.site_results.columns
+            else None
+        )
+        return counterfactual_costs(
+            schedules,
+            dt,
+            **{name: stack(name) for name in TARIFF_COMPONENTS},
+            site_load=site_load,
+            tariff_names=list(tariffs),
+        )
+
     def _non_optimized_charging(
         self, battery: Battery, late_charging: Optional[int] = None
     ) -> pd.DataFrame:
         """
-        Calculate non-optimized charging schedules for comparison.
+        Calculate non-optimized charging schedules for comparison, cf. baseline_schedules.
 
         Parameters
         ----------
         battery : Battery
             Battery object.
         late_charging : int, optional
-            Time step to start late charging, by default None.
+            Time step to start late charging, by default as late as possible.
 
         Returns
         -------
         pd.DataFrame
             DataFrame containing non-optimized charging schedules.
         """
+        dt = np.broadcast_to(np.asarray(self.dt, dtype=float), (self.n_t,))
         df = pd.DataFrame(index=self.date_range)
-        methods = ["early", "continuous"]
-        if late_charging is not None:
-            methods.append("late")
-
-        for method in methods:
-            df[f"power_kw_{method}"] = self.default_charging(
-                battery,
-                n_t=self.n_t,
-                dt=self.dt,
-                method=method,
-                late_charging=late_charging,
-            )
+        for method, power in baseline_schedules(
+            [battery], dt, late_charging=late_charging
+        ).items():
+            df[f"power_kw_{method}"] = power[0]
             df[f"energy_content_kwh_{method}"] = (
-                df[f"power_kw_{method}"].cumsum() / self.dt + battery.energy_start
+                np.cumsum(power[0] * dt) + battery.energy_start
             )
         return df
 
@@ -259,7 +526,7 @@ class SiteResult:
         battery: Battery, n_t: int, dt: float, method: str = "continuous", **kwargs
     ) -> np.ndarray:
         """
-        Calculate default charging schedule for a battery.
+        Calculate default charging schedule for a battery, cf. baseline_schedules.
 
         Parameters
         ----------
@@ -267,57 +534,22 @@ class SiteResult:
             Battery object.
         n_t : int
             Number of time steps.
-        dt : float
-            Time step duration.
+        dt : float or np.ndarray
+            Time step duration, one value for all or one per time step.
         method : str, optional
             Charging method, by default "continuous".
         **kwargs : dict
-            Additional keyword arguments.
+            Additional keyword arguments, late_charging for method "late".
 
         Returns
         -------
         np.ndarray
-            Array containing the charging schedule.
+            Array containing the charging power in kW.
         """
-        delta_energy_max = battery.power_charge_max * dt
-        delta_energy = battery.energy_end - battery.energy_start
-        half_hours_needed = delta_energy / delta_energy_max
-        whole_half_hours_needed = floor(half_hours_needed)
-
-        if method == "inactive":
-            charging_schedule_kw = [0] * n_t
-        elif method == "continuous":
-            step = min(delta_energy / n_t, delta_energy_max)
-            charging_schedule_kw = [step] * n_t
-        elif method == "early":
-            energy_remainder = delta_energy - whole_half_hours_needed * delta_energy_max
-            charging_schedule_kw = [delta_energy_max] * whole_half_hours_needed + [
-                energy_remainder
-            ]
-
-            if len(charging_schedule_kw) > n_t:
-                charging_schedule_kw = [delta_energy_max] * n_t
-
-            charging_schedule_kw += [0] * (n_t - len(charging_schedule_kw))
-        elif method == "late":
-            if not kwargs.get("late_charging"):
-                logger.warning(
-                    "Trying to compute default charging schedule for method 'late' without providing parameter 'late_charging' might lead to unwanted behavior."
-                )
-            energy_remainder = delta_energy - whole_half_hours_needed * delta_energy_max
-            charging_schedule_kw = (
-                [0] * (kwargs.get("late_charging", 1) - 1)
-                + [delta_energy_max] * whole_half_hours_needed
-                + [energy_remainder]
-            )
-            charging_schedule_kw += [0] * n_t
-            charging_schedule_kw = charging_schedule_kw[:n_t]
-        else:
-            raise ValueError(
-                f"Unknown method '{method}' in default_charging. Possible values = inactive, continuous."
-            )
-
-        return np.array(charging_schedule_kw) * dt
+        dt = np.broadcast_to(np.asarray(dt, dtype=float), (n_t,))
+        return baseline_schedules(
+            [battery], dt, [method], late_charging=kwargs.get("late_charging")
+        )[method][0]
 
     def __str__(self) -> str:
         return f"Results:\n - Success: {self.success}\n - Time Elapsed: {self.time_elapsed}\n - Agg. Results: {self.aggregated_results}"
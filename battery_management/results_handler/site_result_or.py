@@ -1,8 +1,14 @@
-from typing import Any, Dict
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
+from ortools.linear_solver import linear_solver_pb2, pywraplp
 
+from battery_management.results_handler.baseline_schedules import baseline_schedules
+from battery_management.results_handler.battery_result_store import (
+    BatteryResultStore,
+)
 from battery_management.results_handler.site_result import SiteResult
 
 
@@ -23,12 +29,12 @@ class SiteResultOR(SiteResult):
         List of Battery objects.
     n_t : int
         Number of time steps.
-    dt : float
-        Time step duration.
+    dt : float or np.ndarray
+        Time step duration, one value for all or one per time step.
     date_range : pd.DatetimeIndex
         Date range of the optimization.
-    battery_results : pd.DataFrame
-        DataFrame containing battery results.
+    battery_store : BatteryResultStore
+        Battery results as one array (battery, time step) per quantity, cf. SiteResult.battery_results.
     site_results : pd.DataFrame
         DataFrame containing site results.
     grid_results : pd.DataFrame
@@ -42,18 +48,125 @@ class SiteResultOR(SiteResult):
         self.n_t = results["n_t"]
         self.dt = results["dt"]
         self.date_range = results["date_range"]
+        self._solution = self._solution_vector(results)
 
         self.battery_results = self.calculate_battery_results(results, default_strategy)
         self.site_results = self.calculate_site_results(results)
         self.grid_results = self.calculate_grid_results(results)
 
-        self.extra_info = self.get_extra_info(results)
+        # Extracted on first access, from the solution of this solve
+        self.extra_info = partial(self.get_extra_info, self._extra_info_inputs(results))
+        # Only needed for the extraction, not part of the result
+        del self._solution
         results.update(self.__dict__)
+        results["battery_results"] = self.battery_store
+        results["extra_info"] = self._extra_info
         super().__init__(results)
 
+    @staticmethod
+    def _solution_vector(results: Dict[str, Any]) -> Optional[np.ndarray]:
+        """
+        Values of all variables of the solved model, read from the solver at once.
+
+        Parameters
+        ----------
+        results : Dict[str, Any]
+            Optimization results.
+
+        Returns
+        -------
+        Optional[np.ndarray]
+            One value per variable index, None without model.
+        """
+        model = results.get("model")
+        if not isinstance(model, pywraplp.Solver):
+            return None
+        response = linear_solver_pb2.MPSolutionResponse()
+        model.FillSolutionResponseProto(response)
+        if len(response.variable_value) != model.NumVariables():
+            # Not solved, the solver reports zeros as well
+            return np.zeros(model.NumVariables())
+        return np.array(response.variable_value)
+
+    def _indices(self, entries: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Index of every solver variable in the solution vector, -1 for entries that are evaluated right away: numbers
+        (e.g. time steps dropped from a sparse model) and expressions, cf. _value.
+
+        Parameters
+        ----------
+        entries : List[Any]
+            Solver variables, expressions or numbers.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            Indices and the values of the entries that are not taken from the solution vector (NaN for the others),
+            cf. _take.
+        """
+        index = np.array(
+            [
+                x.index()
+                if isinstance(x, pywraplp.Variable) and self._solution is not None
+                else -1
+                for x in entries
+            ],
+            dtype=int,
+        )
+        values = np.array(
+            [np.nan if i >= 0 else self._value(x) for i, x in zip(index, entries)],
+            dtype=float,
+        )
+        return index, values
+
+    @staticmethod
+    def _take(
+        solution: Optional[np.ndarray], index: np.ndarray, values: np.ndarray
+    ) -> np.ndarray:
+        """
+        Values of entries collected by _indices, the variables taken from the solution vector
+        """
+        values = values.copy()
+        variables = index >= 0
+        if variables.any():
+            values[variables] = solution[index[variables]]
+        return values
+
+    def _values(self, entries: List[Any]) -> np.ndarray:
+        """
+        Solution values of solver variables, taken from the solution vector by their index, cf. _indices.
+
+        Parameters
+        ----------
+        entries : List[Any]
+            Solver variables, expressions or numbers.
+
+        Returns
+        -------
+        np.ndarray
+        """
+        return self._take(self._solution, *self._indices(entries))
+
+    def _series(self, shell: Any) -> np.ndarray:
+        """
+        Solution values of a time series of variables, e.g. grid_power["purchase"]
+        """
+        return self._values([shell[t] for t in range(self.n_t)])
+
+    def _matrix(self, shells: Dict[int, Any], key: Optional[str] = None) -> np.ndarray:
+        """
+        Solution values of one time series per battery as array (battery, time step), e.g. fleet_power and
+        "charge"
+        """
+        entries = []
+        for battery in self.batteries:
+            shell = shells[battery.id] if key is None else shells[battery.id][key]
+            entries += [shell[t] for t in range(self.n_t)]
+        return self._values(entries).reshape(len(self.batteries), self.n_t)
+
     def calculate_battery_results(
         self, results: Dict[str, Any], default_strategy: str
-    ) -> pd.DataFrame:
+    ) -> BatteryResultStore:
         """
         Calculate battery results from optimization results.
 
@@ -66,55 +179,51 @@ class SiteResultOR(SiteResult):
 
         Returns
         -------
-        pd.DataFrame
-            DataFrame containing battery results.
+        BatteryResultStore
+            Battery results as one array (battery, time step) per quantity.
         """
-        battery_results = []
-        for battery in results["batteries"]:
-            bat_id = battery.id
-            _results = pd.DataFrame(index=self.date_range)
-
-            if results["status"] == 0:
-                _results["power_kw"] = [
-                    results["fleet_power"][battery.id]["charge"][t].SolutionValue()
-                    - results["fleet_power"][battery.id]["discharge"][t].SolutionValue()
-                    for t in range(self.n_t)
-                ]
-            else:
-                _results["power_kw"] = self.default_charging(
-                    battery, method=default_strategy, n_t=self.n_t, dt=self.dt
-                )
-
-            _results["energy_content_kwh"] = (
-                _results["power_kw"].cumsum() * self.dt + battery.energy_start
+        batteries = results["batteries"]
+        n_b, n_t = len(batteries), self.n_t
+        dt = np.broadcast_to(np.asarray(self.dt, dtype=float), (n_t,))
+        if results.get("has_solution", results["status"] == 0):
+            power = self._matrix(results["fleet_power"], "charge") - self._matrix(
+                results["fleet_power"], "discharge"
             )
-            _results["soc_perc"] = _results["energy_content_kwh"] / battery.capacity
-            _results["battery_id"] = bat_id
+        else:
+            power = baseline_schedules(batteries, dt, [default_strategy])[
+                default_strategy
+            ]
 
-            if results.get("calculate_savings_non_optimized"):
-                _results = pd.concat(
-                    [_results, self._non_optimized_charging(battery)], axis=1
+        energy_start = np.array([battery.energy_start for battery in batteries])
+        capacity = np.array([battery.capacity for battery in batteries])
+        energy = np.cumsum(power * dt, axis=1) + energy_start[:, None]
+
+        columns = {
+            "power_kw": power,
+            "energy_content_kwh": energy,
+            "soc_perc": energy / capacity[:, None],
+        }
+        if results.get("calculate_savings_non_optimized"):
+            for method, baseline in baseline_schedules(
+                batteries, dt, late_charging=results.get("late_charging")
+            ).items():
+                columns[f"power_kw_{method}"] = baseline
+                columns[f"energy_content_kwh_{method}"] = (
+                    np.cumsum(baseline * dt, axis=1) + energy_start[:, None]
                 )
 
-            if results.get("flex_pos"):
-                _results["flex_pos"] = [
-                    results["flex_pos"][bat_id][t].SolutionValue()
-                    for t in range(self.n_t)
-                ]
-            if results.get("flex_neg"):
-                _results["flex_neg"] = [
-                    results["flex_neg"][bat_id][t].SolutionValue()
-                    for t in range(self.n_t)
-                ]
-            battery_results.append(_results)
-        battery_results_combined = pd.concat(battery_results)
-
-        battery_results_combined = (
-            battery_results_combined.reset_index()
-            .rename(columns={"index": "time"})
-            .set_index(["battery_id", "time"], verify_integrity=True)
+        for key in ["flex_pos", "flex_neg"]:
+            if results.get(key):
+                columns[key] = self._matrix(results[key])
+
+        battery_ids = [battery.id for battery in batteries]
+        if len(set(battery_ids)) != n_b:
+            raise ValueError("Battery ids must be unique")
+        return BatteryResultStore(
+            battery_ids,
+            range(n_t) if self.date_range is None else self.date_range,
+            columns,
         )
-        return battery_results_combined
 
     def calculate_site_results(self, results: Dict[str, Any]) -> pd.DataFrame:
         """
@@ -132,39 +241,21 @@ class SiteResultOR(SiteResult):
         """
         site_results = pd.DataFrame(index=self.date_range)
         site_results.index.name = "time"
-        site_power_kw_optimizer = [
-            results["sum_power_fleet"]["charge"][t].solution_value()
-            - results["sum_power_fleet"]["discharge"][t].solution_value()
-            for t in range(self.n_t)
-        ]
-
-        site_results["power_kw"] = (
-            self.battery_results["power_kw"].groupby(["time"]).sum()
-        )
-        site_results["energy_content_kwh"] = (
-            self.battery_results["energy_content_kwh"].groupby(["time"]).sum()
-        )
+        store = self.battery_store
+        for column in ["power_kw", "energy_content_kwh"]:
+            site_results[column] = store.total(column)
 
         if results.get("calculate_savings_non_optimized"):
             methods = [
                 col.split("_")[2]
-                for col in self.battery_results.columns
+                for col in store.columns
                 if "power_kw" in col and len(col.split("_")) == 3
             ]
             for m in methods:
-                site_results[f"power_kw_{m}"] = (
-                    self.battery_results[f"power_kw_{m}"].groupby(["time"]).sum()
+                site_results[f"power_kw_{m}"] = store.total(f"power_kw_{m}")
+                site_results[f"energy_content_kwh_{m}"] = store.total(
+                    f"energy_content_kwh_{m}"
                 )
-                site_results[f"energy_content_kwh_{m}"] = (
-                    self.battery_results[f"energy_content_kwh_{m}"]
-                    .groupby(["time"])
-                    .sum()
-                )
-
-        assert np.isclose(
-            np.sum(np.abs(site_power_kw_optimizer)),
-            np.sum(np.abs(site_results["power_kw"])),
-        )
 
         for source_name, target_name in {
             "tariffs_import": "TariffsImport",
@@ -193,9 +284,7 @@ class SiteResultOR(SiteResult):
         }
         for cost_name, var_name in cost2var_names.items():
             if cost_name in opt_costs:
-                site_results[cost_name] = [
-                    results[var_name][t].SolutionValue() for t in range(self.n_t)
-                ]
+                site_results[cost_name] = self._series(results[var_name])
 
         for source_name, target_name in {
             "Triad": "CostTriadOptimized",
@@ -203,9 +292,7 @@ class SiteResultOR(SiteResult):
             "Spot": "SpotCost",
         }.items():
             if source_name in opt_costs:
-                site_results[target_name] = [
-                    opt_costs[source_name][t].SolutionValue() for t in range(self.n_t)
-                ]
+                site_results[target_name] = self._series(opt_costs[source_name])
 
         return site_results
 
@@ -224,25 +311,64 @@ class SiteResultOR(SiteResult):
             DataFrame containing grid results.
         """
         grid_results = pd.DataFrame(index=self.date_range)
-        grid_results["power_kw"] = [
-            results["grid_power"]["purchase"][t].SolutionValue()
-            - results["grid_power"]["feed"][t].SolutionValue()
-            for t in range(self.n_t)
-        ]
-        grid_results["curtailed_power_kw"] = [
-            results["grid_power"]["curtail"][t].SolutionValue() for t in range(self.n_t)
-        ]
+        grid_power = results["grid_power"]
+        grid_results["power_kw"] = self._series(grid_power["purchase"]) - self._series(
+            grid_power["feed"]
+        )
+        grid_results["curtailed_power_kw"] = self._series(grid_power["curtail"])
         return grid_results
 
     @staticmethod
-    def get_extra_info(results: Dict[str, Any]) -> Dict[str, Any]:
+    def _value(x: Any) -> float:
+        """
+        Solution value of a solver variable, or the value itself for entries the optimizer fixed to a constant
+        (e.g. time steps dropped from a sparse model).
+
+        Parameters
+        ----------
+        x : Any
+            Solver variable or number.
+
+        Returns
+        -------
+        float
+        """
+        if hasattr(x, "solution_value"):
+            return x.solution_value()
+        return float(x)
+
+    def _extra_info_inputs(self, results: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Entries of the results needed by get_extra_info, independent of later changes to the optimizer and without
+        references to the solver: the solution vector with the indices of the disconnected booleans in it, and the
+        value of the purchase limit.
+        """
+        fleet_bool = results["fleet_bool"]
+        site_constraint = results.get("site_constraint", {})
+        return {
+            "solution": self._solution,
+            "disconnected": {
+                bat.id: self._indices(
+                    [fleet_bool[bat.id]["disconnected"][t] for t in range(self.n_t)]
+                )
+                for bat in results["batteries"]
+                # No booleans if they were dropped for the pure LP
+                if bat.id in fleet_bool
+            },
+            "feasibility_check": results.get("feasibility_check"),
+            "site_constraint_purchase": None
+            if site_constraint.get("purchase") is None
+            else self._value(site_constraint["purchase"]),
+        }
+
+    def get_extra_info(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
         """
         Extract additional information from optimization results.
 
         Parameters
         ----------
-        results : Dict[str, Any]
-            Optimization results.
+        inputs : Dict[str, Any]
+            Entries of the optimization results, cf. _extra_info_inputs.
 
         Returns
         -------
@@ -252,19 +378,17 @@ class SiteResultOR(SiteResult):
         extra_info = {
             "debug": {
                 "disconnected": {
-                    bat.id: [
-                        results["fleet_bool"][bat.id]["disconnected"][t].SolutionValue()
-                        for t in range(results["n_t"])
-                    ]
-                    for bat in results["batteries"]
+                    battery_id: self._take(inputs["solution"], *entries).tolist()
+                    for battery_id, entries in inputs["disconnected"].items()
                 }
             }
         }
 
-        if results.get("site_constraint", {}).get("purchase") is not None:
-            extra_info["site_constraint_purchase"] = results["site_constraint"][
-                "purchase"
-            ].SolutionValue()
+        if inputs.get("feasibility_check"):
+            extra_info["feasibility_check"] = inputs["feasibility_check"]
+
+        if inputs.get("site_constraint_purchase") is not None:
+            extra_info["site_constraint_purchase"] = inputs["site_constraint_purchase"]
 
         return extra_info
 
@@ -277,4 +401,15 @@ class SiteResultOR(SiteResult):
         Dict[str, Any]
             Dictionary representation of the object.
         """
-        return self.__dict__
+        return {
+            # Without the private caches behind the properties
+            **{
+                key: value
+                for key, value in self.__dict__.items()
+                if not key.startswith("_")
+            },
+            "battery_results": self.battery_results,
+            "extra_info": self.extra_info,
+            "savings": self.savings,
+            "aggregated_results": self.aggregated_results,
+        }
@@ -1 +1,4 @@
-pytest_plugins = ["tests.fixtures.assets_fixture"]
+pytest_plugins = [
+    "tests.fixtures.assets_fixture",
+    "tests.fixtures.optimizer_fixture",
+]
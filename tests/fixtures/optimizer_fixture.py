@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from battery_management.assets.battery import Battery
+from battery_management.assets.stationary_battery import StationaryBattery
+from battery_management.optimizer.battery_optimization_or import FleetOptimizationOR
+
+
+@pytest.fixture
+def sample_prices():
+    x = np.linspace(0, 2 * np.pi, 30)
+    return np.sin(x) + 2
+
+
+@pytest.fixture
+def sample_fleet():
+    def _fleet():
+        return [
+            Battery(
+                id=42,
+                capacity=40,
+                energy_start=10,
+                energy_end=40,
+                energy_min=5,
+                energy_max=40,
+                power_charge_max=5,
+                power_discharge_max=5,
+                connected=[False] * 7 + [True] * 18 + [False] * 5,
+            ),
+            Battery(
+                id=23,
+                capacity=40,
+                energy_start=12,
+                energy_end=35,
+                energy_min=5,
+                energy_max=40,
+                power_charge_max=5,
+                power_discharge_max=0,
+                power_charge_min=1.3,
+                connected=[False] * 5 + [True] * 20 + [False] * 5,
+            ),
+            StationaryBattery(
+                id=7,
+                capacity=100,
+                energy_min=10,
+                energy_max=90,
+                energy_start=50,
+                power_charge_max=20,
+                power_discharge_max=20,
+                connected=[True] * 30,
+            ),
+        ]
+
+    return _fleet
+
+
+@pytest.fixture
+def sample_fleet_optimizer(sample_fleet, sample_prices):
+    def _optimizer(**kwargs):
+        fo = FleetOptimizationOR(id=1, dt=0.5, **kwargs)
+        for battery in sample_fleet():
+            fo.add_battery(battery)
+        fo.add_prices(
+            tariffs_import=sample_prices,
+            tariffs_export=sample_prices * 0.8,
+            capacity_tariffs_import=3,
+        )
+        fo.add_site_load(np.cos(np.linspace(0, 2 * np.pi, 30)) * 17)
+        return fo
+
+    return _optimizer
@@ -0,0 +1,218 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from battery_management.assets.battery import Battery
+from battery_management.assets.stationary_battery import StationaryBattery
+from battery_management.optimizer.battery_optimization_or import FleetOptimizationOR
+from battery_management.optimizer.hint_store import HintStore
+
+
+def test_unknown_energy_formulation():
+    with pytest.raises(ValueError):
+        FleetOptimizationOR(id=1, energy_formulation="foo")
+
+
+def test_state_energy_formulation(sample_fleet_optimizer):
+    cumulative = sample_fleet_optimizer(energy_formulation="cumulative")
+    state = sample_fleet_optimizer(energy_formulation="state")
+    result_cumulative = cumulative.optimize()
+    result_state = state.optimize()
+
+    assert result_state.success == 0
+    assert np.isclose(result_cumulative.objective_value, result_state.objective_value)
+    # One balance equality per battery and time step instead of min/max constraints on growing expressions
+    assert state.model.NumConstraints() < cumulative.model.NumConstraints()
+
+
+@pytest.mark.parametrize("builder", ["expression", "matrix"])
+def test_sparse_time(sample_fleet_optimizer, builder):
+    dense = sample_fleet_optimizer(builder=builder)
+    sparse = sample_fleet_optimizer(builder=builder, sparse_time=True)
+    result_dense = dense.optimize()
+    result_sparse = sparse.optimize()
+
+    assert result_sparse.success == 0
+    assert np.isclose(result_dense.objective_value, result_sparse.objective_value)
+    assert sparse.model.NumVariables() < dense.model.NumVariables()
+    # No power outside the connected windows
+    power = result_sparse.battery_results.loc[42, "power_kw"].to_numpy()
+    assert np.all(power[:7] == 0) and np.all(power[25:] == 0)
+
+
+@pytest.mark.parametrize("builder", ["expression", "matrix"])
+def test_relax_binaries(sample_fleet_optimizer, builder):
+    results = {}
+    for relax_binaries in [False, True]:
+        fo = sample_fleet_optimizer(builder=builder, relax_binaries=relax_binaries)
+        for battery in fo.batteries:
+            battery.power_charge_min = 0
+        results[relax_binaries] = fo.optimize()
+
+    assert results[False].solver_mode == "MIP"
+    assert results[True].solver_mode == "LP"
+    assert results[True].success == 0
+    assert np.isclose(results[False].objective_value, results[True].objective_value)
+
+
+def test_relax_binaries_needed(sample_fleet_optimizer):
+    # A minimum charging power can only be modelled with binaries
+    fo = sample_fleet_optimizer()
+    result = fo.optimize()
+    assert result.solver_mode == "MIP"
+    assert fo.dropped_binaries == {"fleet": False, "grid": True}
+
+
+def test_relax_binaries_feed_limit():
+    # A full battery could only stay below the feed limit by charging and discharging at the same time
+    fo = FleetOptimizationOR(id=1, dt=0.5)
+    fo.add_battery(
+        StationaryBattery(
+            id=1,
+            capacity=100,
+            energy_min=10,
+            energy_max=90,
+            energy_start=90,
+            power_charge_max=20,
+            power_discharge_max=20,
+            connected=[True] * 10,
+        )
+    )
+    fo.add_prices(tariffs_import=np.full(10, 0.3), tariffs_export=np.full(10, 0.1))
+    fo.add_site_load(np.full(10, -6.0))
+    fo.add_grid(feed_power_limit=5)
+    result = fo.optimize()
+
+    assert not fo.dropped_binaries["fleet"]
+    assert result.success != 0
+
+
+def test_optimize_twice(sample_fleet_optimizer):
+    fo = sample_fleet_optimizer()
+    first = fo.optimize()
+    n_cost = {key: len(value) for key, value in fo.cost.items()}
+    second = fo.optimize()
+
+    assert np.isclose(first.objective_value, second.objective_value)
+    assert {key: len(value) for key, value in fo.cost.items()} == n_cost
+
+
+@pytest.mark.parametrize("builder", ["expression", "matrix"])
+def test_aggregate_batteries(sample_fleet_optimizer, builder):
+    results, optimizers = [], []
+    for aggregate_batteries in [False, True]:
+        fo = sample_fleet_optimizer(
+            builder=builder, aggregate_batteries=aggregate_batteries
+        )
+        for battery in fo.batteries:
+            battery.power_charge_min = 0
+        for i in range(3):
+            fo.add_battery(replace(fo.batteries[0], id=100 + i))
+        results.append(fo.optimize())
+        optimizers.append(fo)
+
+    groups = optimizers[1].battery_groups
+    assert {i: [bat.id for bat in group] for i, group in groups.items()} == {
+        42: [42, 100, 101, 102]
+    }
+    assert optimizers[1].model.NumVariables() < optimizers[0].model.NumVariables()
+    assert np.isclose(results[0].objective_value, results[1].objective_value)
+    # The schedule of the virtual battery is split equally among its group
+    power = results[1].battery_results["power_kw"].unstack(0)
+    assert sorted(power.columns) == [7, 23, 42, 100, 101, 102]
+    assert np.allclose(power[42], power[102])
+
+
+def test_aggregate_batteries_needs_lp(sample_fleet_optimizer):
+    fo = sample_fleet_optimizer(aggregate_batteries=True)
+    fo.add_battery(replace(fo.batteries[0], id=100))
+    fo.optimize()
+    assert fo.battery_groups == {}
+    assert fo.model_batteries is fo.batteries
+
+
+@pytest.mark.parametrize("builder", ["expression", "matrix"])
+def test_hint_store(sample_fleet_optimizer, tmp_path, builder):
+    fo = sample_fleet_optimizer(builder=builder, energy_formulation="state")
+    fo.add_hint_store(HintStore(path=str(tmp_path)))
+    fo.optimize()
+    charge = [fo.fleet_power[42]["charge"][t].solution_value() for t in range(30)]
+
+    # A new store reads the solution back from disk, shifted by the elapsed steps
+    follow_up = sample_fleet_optimizer(builder=builder, energy_formulation="state")
+    follow_up._build_model()
+    variables, values = HintStore(path=str(tmp_path)).hint(follow_up, 4)
+    hint = dict(zip([var.name() for var in variables], values))
+    name = follow_up.fleet_power[42]["charge"][10].name()
+    assert np.isclose(hint[name], charge[14])
+    assert follow_up.fleet_power[42]["charge"][26].name() not in hint
+
+    follow_up.add_hint_store(HintStore(path=str(tmp_path)), elapsed_steps=4)
+    assert follow_up.resolve().success == 0
+
+
+@pytest.mark.parametrize("builder", ["expression", "matrix"])
+def test_update_prices_resolve(sample_fleet_optimizer, sample_prices, builder):
+    marketed_volumes = np.array([2.0] * 4 + [np.nan] * 26)
+    new_prices = sample_prices[::-1] + 0.5
+    new_marketed_volumes = np.array([np.nan] * 10 + [-1.0] * 3 + [np.nan] * 17)
+
+    fo = sample_fleet_optimizer(builder=builder)
+    fo.add_marketed_volumes(marketed_volumes)
+    fo.optimize()
+    model = fo.model
+    fo.update_prices(
+        tariffs_import=new_prices,
+        tariffs_export=new_prices * 0.8,
+        marketed_volumes=new_marketed_volumes,
+    )
+    result = fo.resolve()
+    assert fo.model is model
+
+    reference = sample_fleet_optimizer(builder=builder)
+    reference.add_prices(tariffs_import=new_prices, tariffs_export=new_prices * 0.8)
+    reference.add_marketed_volumes(new_marketed_volumes)
+    expected = reference.optimize()
+
+    assert result.success == 0
+    assert np.isclose(result.objective_value, expected.objective_value)
+
+
+@pytest.mark.parametrize("builder", ["expression", "matrix"])
+def test_attach_and_retire_battery(sample_fleet_optimizer, builder):
+    def new_battery():
+        return Battery(
+            id=99,
+            capacity=50,
+            energy_start=8,
+            energy_end=30,
+            energy_min=5,
+            energy_max=45,
+            power_charge_max=7,
+            power_discharge_max=7,
+            connected=[False] * 3 + [True] * 20 + [False] * 7,
+        )
+
+    fo = sample_fleet_optimizer(builder=builder)
+    fo.add_flex(prices_flex_pos=np.array([0] * 10 + [0.5] * 5 + [0] * 15))
+    fo.optimize()
+    model = fo.model
+
+    fo.attach_battery(new_battery())
+    attached = fo.resolve()
+    fo.retire_battery(42)
+    retired = fo.resolve()
+    assert fo.model is model
+
+    reference = sample_fleet_optimizer(builder=builder)
+    reference.add_flex(prices_flex_pos=np.array([0] * 10 + [0.5] * 5 + [0] * 15))
+    reference.add_battery(new_battery())
+    assert np.isclose(attached.objective_value, reference.optimize().objective_value)
+
+    reference.batteries = [bat for bat in reference.batteries if bat.id != 42]
+    assert np.isclose(retired.objective_value, reference.optimize().objective_value)
+    assert 42 not in retired.battery_results.index.get_level_values("battery_id")
+
+    with pytest.raises(ValueError):
+        fo.retire_battery(42)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from battery_management.optimizer.battery_optimization_or import FleetOptimizationOR
+
+
+def test_unknown_builder():
+    with pytest.raises(ValueError):
+        FleetOptimizationOR(id=1, builder="foo")
+
+
+def test_matrix_builder_matches_expression_builder(sample_fleet_optimizer):
+    expression = sample_fleet_optimizer(builder="expression").optimize()
+    matrix = sample_fleet_optimizer(builder="matrix").optimize()
+
+    assert expression.success == matrix.success == 0
+    assert np.isclose(expression.objective_value, matrix.objective_value)
+    assert matrix.battery_results.index.equals(expression.battery_results.index)
+    assert np.allclose(
+        matrix.site_results["power_kw"].sum(), expression.site_results["power_kw"].sum()
+    )
+
+
+def test_matrix_builder_with_flex_and_marketed_volumes(sample_fleet_optimizer):
+    results = {}
+    for builder in ["expression", "matrix"]:
+        fo = sample_fleet_optimizer(builder=builder, penalize_spiky_behaviour=True)
+        fo.add_marketed_volumes(np.array([2.0] * 4 + [np.nan] * 26))
+        fo.add_flex(prices_flex_pos=np.array([0] * 10 + [0.5] * 5 + [0] * 15))
+        results[builder] = fo.optimize()
+
+    assert np.isclose(
+        results["expression"].objective_value, results["matrix"].objective_value
+    )
+    assert "FlexPos" in results["matrix"].site_results.columns
@@ -0,0 +1,142 @@
+import numpy as np
+
+from battery_management.assets.battery import Battery
+from battery_management.optimizer.battery_optimization_or import FleetOptimizationOR
+from battery_management.optimizer.model_cache import ModelCache
+from battery_management.optimizer.components import (
+    ComponentOptimizer,
+    independent_components,
+)
+
+
+def _optimizer(sample_prices, site_load, **kwargs):
+    fo = FleetOptimizationOR(id=1, dt=0.5, **kwargs)
+    for battery_id, (start, end) in {1: (0, 10), 2: (3, 12), 3: (15, 28)}.items():
+        fo.add_battery(
+            Battery(
+                id=battery_id,
+                capacity=40,
+                energy_start=10,
+                energy_end=30,
+                energy_min=5,
+                energy_max=40,
+                power_charge_max=5,
+                power_discharge_max=5,
+                connected=[start <= t < end for t in range(30)],
+            )
+        )
+    fo.add_prices(tariffs_import=sample_prices, tariffs_export=sample_prices * 0.8)
+    fo.add_site_load(site_load)
+    return fo
+
+
+def test_independent_components(sample_prices):
+    # Purchasing in every step: the grid cost is linear in the power of each battery
+    fo = _optimizer(sample_prices, np.full(30, 20.0))
+    components = independent_components(fo)
+    assert components == [
+        {"start": 0, "end": 15, "batteries": [0]},
+        {"start": 0, "end": 15, "batteries": [1]},
+        {"start": 15, "end": 30, "batteries": [2]},
+    ]
+
+    # The site can feed in while the first two batteries discharge
+    fo = _optimizer(sample_prices, np.full(30, 5.0))
+    assert independent_components(fo) == [
+        {"start": 0, "end": 15, "batteries": [0, 1]},
+        {"start": 15, "end": 30, "batteries": [2]},
+    ]
+
+    fo.add_prices(
+        tariffs_import=sample_prices,
+        tariffs_export=sample_prices * 0.8,
+        capacity_tariffs_import=3,
+    )
+    assert len(independent_components(fo)) == 1
+
+
+def test_component_optimizer(sample_prices):
+    site_load = np.full(30, 20.0)
+    expected = _optimizer(sample_prices, site_load).optimize()
+    result = ComponentOptimizer(_optimizer(sample_prices, site_load), 1).optimize()
+
+    assert result.success == 0
+    assert len(result.extra_info["components"]) == 3
+    assert np.isclose(result.objective_value, expected.objective_value)
+    assert np.allclose(
+        result.grid_results.values, expected.grid_results.values, atol=1e-6
+    )
+    assert np.isclose(
+        result.site_results["SpotCost"].sum(), expected.site_results["SpotCost"].sum()
+    )
+    assert np.allclose(
+        result.battery_results.sort_index()["energy_content_kwh"],
+        expected.battery_results.sort_index()["energy_content_kwh"],
+    )
+
+
+def test_component_optimizer_spiky(sample_prices):
+    site_load = np.full(30, 20.0)
+    expected = _optimizer(
+        sample_prices, site_load, penalize_spiky_behaviour=True
+    ).optimize()
+    optimizer = ComponentOptimizer(
+        _optimizer(sample_prices, site_load, penalize_spiky_behaviour=True), 1
+    )
+    # The idle step before the second segment keeps the jump of the fleet power
+    assert [c["start"] for c in optimizer.components] == [0, 14]
+
+    result = optimizer.optimize()
+    assert np.isclose(result.objective_value, expected.objective_value)
+
+
+def test_component_optimizer_sessions(sample_prices):
+    def optimizer():
+        fo = FleetOptimizationOR(id=1, dt=0.5)
+        for battery_id, connected in {
+            1: [t < 3 or 12 <= t < 20 for t in range(20)],
+            2: [3 <= t < 11 for t in range(20)],
+        }.items():
+            fo.add_battery(
+                Battery(
+                    id=battery_id,
+                    capacity=40,
+                    energy_start=10,
+                    energy_end=30,
+                    energy_min=5,
+                    energy_max=40,
+                    power_charge_max=5,
+                    power_discharge_max=5,
+                    connected=connected,
+                )
+            )
+        fo.add_prices(tariffs_import=sample_prices[:20])
+        fo.add_site_load(np.full(20, 20.0))
+        return fo
+
+    # Both sessions of the first battery stay in one segment
+    optimizer_ = ComponentOptimizer(optimizer(), 1)
+    assert optimizer_.components == [
+        {"start": 0, "end": 20, "batteries": [0]},
+        {"start": 0, "end": 20, "batteries": [1]},
+    ]
+
+    expected = optimizer().optimize()
+    result = optimizer_.optimize()
+    assert result.success == 0
+    assert np.isclose(result.objective_value, expected.objective_value)
+    assert np.allclose(
+        result.grid_results.values, expected.grid_results.values, atol=1e-6
+    )
+
+
+def test_component_optimizer_processes(sample_prices):
+    site_load = np.full(30, 20.0)
+    fo = _optimizer(sample_prices, site_load)
+    fo.add_model_cache(ModelCache())
+    expected = fo.optimize()
+
+    # Cached models stay in this process
+    result = ComponentOptimizer(fo, 2).optimize()
+    assert result.success == 0
+    assert np.isclose(result.objective_value, expected.objective_value)
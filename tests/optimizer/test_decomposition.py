@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from battery_management.optimizer.decomposition import ADMMOptimizer
+
+
+def _lp_optimizer(sample_fleet_optimizer, **kwargs):
+    fo = sample_fleet_optimizer(**kwargs)
+    for battery in fo.batteries:
+        battery.power_charge_min = 0
+    return fo
+
+
+def test_admm(sample_fleet_optimizer):
+    expected = _lp_optimizer(sample_fleet_optimizer).optimize()
+    admm = ADMMOptimizer(_lp_optimizer(sample_fleet_optimizer), processes=1)
+    result = admm.optimize()
+
+    assert result.success == 0
+    assert result.extra_info["admm"]["converged"]
+    assert not result.limit_reached
+    # Close to the optimum of the whole fleet, not exact
+    assert result.objective_value == pytest.approx(expected.objective_value, abs=0.2)
+    for battery in admm.optimizer.batteries:
+        schedule = result.battery_results.xs(battery.id, level="battery_id")
+        assert schedule["energy_content_kwh"].max() <= battery.energy_max + 1e-3
+        if not battery.stationary:
+            assert schedule["energy_content_kwh"].iloc[-1] >= battery.energy_end - 1e-3
+
+
+def test_admm_processes(sample_fleet_optimizer):
+    admm = ADMMOptimizer(
+        _lp_optimizer(sample_fleet_optimizer, builder="matrix"),
+        max_iterations=2,
+        processes=2,
+    )
+    result = admm.optimize()
+    assert result.limit_reached
+    assert len(result.extra_info["admm"]["residuals"]) == 2
+    assert len(result.battery_results) == 3 * 30
+
+
+def test_admm_invalid(sample_fleet_optimizer):
+    fo = sample_fleet_optimizer()
+    fo.add_prices(tariffs_import=np.full(30, 0.2), tariffs_export=np.full(30, 0.3))
+    with pytest.raises(ValueError):
+        ADMMOptimizer(fo, processes=1).optimize()
+
+    fo = sample_fleet_optimizer()
+    fo.add_marketed_volumes(np.ones(30))
+    with pytest.raises(ValueError):
+        ADMMOptimizer(fo)
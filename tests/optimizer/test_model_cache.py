@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from battery_management.optimizer.model_cache import ModelCache
+
+
+def test_model_cache_lru():
+    cache = ModelCache(maxsize=2)
+    cache.put("a", {"model": 1})
+    cache.put("b", {"model": 2})
+    assert cache.get("a") == {"model": 1}
+    cache.put("c", {"model": 3})
+    assert "b" not in cache
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    with pytest.raises(ValueError):
+        ModelCache(maxsize=0)
+
+
+def test_fingerprint(sample_fleet_optimizer, sample_prices):
+    fo = sample_fleet_optimizer()
+    fingerprint = fo.fingerprint()
+
+    # Energy tariffs and site load are patched, not part of the structure
+    fo.add_prices(tariffs_import=sample_prices + 1)
+    fo.add_site_load(np.ones(30))
+    assert fo.fingerprint() == fingerprint
+
+    fo.batteries[0].connected = [True] * 30
+    assert fo.fingerprint() != fingerprint
+    assert sample_fleet_optimizer(builder="matrix").fingerprint() != fingerprint
+
+
+@pytest.mark.parametrize("builder", ["expression", "matrix"])
+def test_model_cache(sample_fleet_optimizer, sample_prices, builder):
+    triad = np.array([0] * 20 + [2.0] * 3 + [0] * 7)
+    new_prices = sample_prices[::-1] + 0.5
+    new_site_load = np.sin(np.linspace(0, 2 * np.pi, 30)) * 12
+    cache = ModelCache()
+
+    first = sample_fleet_optimizer(builder=builder)
+    first.add_prices(triad_tariffs_import=triad, triad_tariffs_export=triad)
+    first.add_model_cache(cache)
+    first_result = first.optimize()
+
+    second = sample_fleet_optimizer(builder=builder)
+    second.add_prices(
+        tariffs_import=new_prices,
+        tariffs_export=new_prices * 0.8,
+        triad_tariffs_import=triad,
+        triad_tariffs_export=triad,
+    )
+    second.add_site_load(new_site_load)
+    second.add_model_cache(cache)
+    result = second.optimize()
+    assert second.model is first.model
+    assert cache.hits == 1
+
+    reference = sample_fleet_optimizer(builder=builder)
+    reference.add_prices(
+        tariffs_import=new_prices,
+        tariffs_export=new_prices * 0.8,
+        triad_tariffs_import=triad,
+        triad_tariffs_export=triad,
+    )
+    reference.add_site_load(new_site_load)
+    expected = reference.optimize()
+
+    assert result.success == 0
+    assert np.isclose(result.objective_value, expected.objective_value)
+
+    # The shared model gets the prices and site load of the optimizer that solves it
+    assert np.isclose(first.resolve().objective_value, first_result.objective_value)
+    assert np.isclose(second.resolve().objective_value, expected.objective_value)
+
+    # A model changed in place is no longer cached, nor used by the others
+    second.retire_battery(42)
+    assert second.model_fingerprint not in cache
+    assert len(cache) == 0
+    assert np.isclose(first.resolve().objective_value, first_result.objective_value)
+    assert first.model is not second.model
+
+
+@pytest.mark.parametrize("builder", ["expression", "matrix"])
+def test_update_site_load(sample_fleet_optimizer, builder):
+    new_site_load = np.sin(np.linspace(0, 2 * np.pi, 30)) * 12
+
+    fo = sample_fleet_optimizer(builder=builder)
+    fo.optimize()
+    model = fo.model
+    fo.update_site_load(new_site_load)
+    result = fo.resolve()
+    assert fo.model is model
+
+    reference = sample_fleet_optimizer(builder=builder)
+    reference.add_site_load(new_site_load)
+    expected = reference.optimize()
+
+    assert result.success == 0
+    assert np.isclose(result.objective_value, expected.objective_value)
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from battery_management.optimizer.model_export import load_model, read_metadata, replay
+from battery_management.optimizer.solver_settings import SolverSettings
+
+
+@pytest.mark.parametrize("file_format", ["mps", "proto"])
+def test_export_and_replay(sample_fleet_optimizer, tmp_path, file_format):
+    fo = sample_fleet_optimizer()
+    fo.add_model_export(str(tmp_path), file_format=file_format)
+    result = fo.optimize()
+
+    metadata = read_metadata(fo.exported_model)
+    assert metadata["fingerprint"] == fo.fingerprint()
+    assert metadata["solver_mode"] == fo.solver_mode
+
+    model = load_model(fo.exported_model)
+    assert model.NumVariables() == fo.model.NumVariables()
+    assert model.NumConstraints() == fo.model.NumConstraints()
+
+    replayed = replay(fo.exported_model, SolverSettings(mip_backend="SCIP"))
+    assert replayed["status"] == 0
+    assert replayed["fingerprint"] == metadata["fingerprint"]
+    assert np.isclose(replayed["objective_value"], result.objective_value)
+
+
+def test_export_invalid_format(sample_fleet_optimizer, tmp_path):
+    with pytest.raises(ValueError):
+        sample_fleet_optimizer().add_model_export(str(tmp_path), file_format="lp")
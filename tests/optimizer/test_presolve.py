@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from battery_management.assets.battery import Battery
+from battery_management.optimizer.presolve import energy_envelopes, feasibility_check
+
+
+def _battery(**kwargs):
+    parameters = dict(
+        id=1,
+        capacity=10,
+        energy_min=0,
+        energy_max=10,
+        energy_start=2,
+        energy_end=8,
+        power_charge_max=4,
+        power_discharge_max=2,
+        connected=[0, 1, 1, 1, 0],
+    )
+    parameters.update(kwargs)
+    return Battery(**parameters)
+
+
+def test_energy_envelopes():
+    bounds = energy_envelopes([_battery()], n_t=5, dt=1, targets=np.array([True]))
+
+    # 8 kWh at departure require at least 4 kWh after the second connected step
+    np.testing.assert_allclose(bounds["energy_min"][0], [2, 0, 4, 8, 8])
+    np.testing.assert_allclose(bounds["energy_max"][0], [2, 6, 10, 10, 10])
+    np.testing.assert_allclose(bounds["charge_min"][0], [0, 0, 0, 0, 0])
+
+    # Without target only the forward envelope remains
+    bounds = energy_envelopes([_battery()], n_t=5, dt=1, targets=np.array([False]))
+    np.testing.assert_allclose(bounds["energy_min"][0], [2, 0, 0, 0, 0])
+
+
+def test_energy_envelopes_no_slack():
+    # The target can only be met by charging at full power in every connected step
+    battery = _battery(energy_end=14, energy_max=14, capacity=14)
+    bounds = energy_envelopes([battery], n_t=5, dt=1, targets=np.array([True]))
+
+    np.testing.assert_allclose(bounds["energy_min"][0], bounds["energy_max"][0])
+    np.testing.assert_allclose(bounds["energy_min"][0], [2, 6, 10, 14, 14])
+    np.testing.assert_allclose(bounds["charge_min"][0], [0, 4, 4, 4, 0])
+
+
+def test_energy_envelopes_unreachable_target():
+    battery = _battery(
+        energy_end=10, energy_max=20, capacity=20, connected=[0, 1] + [0] * 3
+    )
+    bounds = energy_envelopes([battery], n_t=5, dt=1, targets=np.array([True]))
+
+    # Static bounds, the solver reports the infeasibility
+    np.testing.assert_allclose(bounds["energy_min"][0], 0)
+    np.testing.assert_allclose(bounds["energy_max"][0], 20)
+
+
+@pytest.mark.parametrize("builder", ["expression", "matrix"])
+def test_tighten_bounds(sample_fleet_optimizer, builder):
+    results = [
+        sample_fleet_optimizer(
+            builder=builder, tighten_bounds=tighten_bounds
+        ).optimize()
+        for tighten_bounds in [False, True]
+    ]
+
+    assert results[1].success == 0
+    assert np.isclose(results[0].objective_value, results[1].objective_value)
+
+
+def test_feasibility_check():
+    batteries = [_battery(), _battery(id=2, energy_end=16, energy_max=20, capacity=20)]
+    check = feasibility_check(batteries, n_t=5, dt=1, targets=np.array([True, True]))
+    np.testing.assert_allclose(check["reachable"], [10, 14])
+    np.testing.assert_array_equal(check["unreachable"], [False, True])
+    assert not check["site_limit"]
+
+    # 6 + 12 kWh to charge (grid side 1 / 0.95 more) within 5 steps of 3 kW
+    check = feasibility_check(
+        batteries, n_t=5, dt=1, targets=np.array([True, True]), purchase_limit=3
+    )
+    assert check["site_limit"]
+    check = feasibility_check(
+        batteries, n_t=5, dt=1, targets=np.array([True, True]), purchase_limit=5
+    )
+    assert not check["site_limit"]
+
+
+@pytest.mark.parametrize("infeasible_targets", [None, "clip", "penalty"])
+def test_infeasible_targets(sample_fleet_optimizer, infeasible_targets):
+    fo = sample_fleet_optimizer(infeasible_targets=infeasible_targets)
+    battery = fo.batteries[0]
+    battery.energy_end = battery.energy_max = battery.capacity = 200
+    result = fo.optimize()
+
+    unreachable = result.extra_info["feasibility_check"]["unreachable_targets"]
+    assert list(unreachable) == [battery.id]
+    if infeasible_targets is None:
+        assert fo.precheck_failed
+        assert result.success == 2
+    else:
+        assert result.success == 0
+        reachable = unreachable[battery.id]["reachable"]
+        energy = result.battery_results.xs(battery.id, level="battery_id")
+        assert np.isclose(energy["energy_content_kwh"].iloc[-1], reachable)
+
+        # Only the model is changed, not the battery or the flags of the optimizer
+        assert battery.energy_end == unreachable[battery.id]["energy_end"] == 200
+        assert not fo.fully_charged_as_penalty
+        assert fo.clipped_targets == (
+            {battery.id: reachable} if infeasible_targets == "clip" else {}
+        )
+        assert fo.penalized_targets == (
+            {battery.id} if infeasible_targets == "penalty" else set()
+        )
+
+        # Without the battery, the other targets are constraints again
+        fo.retire_battery(battery.id)
+        assert not fo.penalized_targets and not fo.clipped_targets
+        assert fo._hard_targets(fo.batteries).tolist() == [True, False]
+        assert fo.resolve().success == 0
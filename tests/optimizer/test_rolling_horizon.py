@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from battery_management.optimizer.rolling_horizon import RollingHorizonOptimizer
+
+
+def test_single_window(sample_fleet_optimizer):
+    expected = sample_fleet_optimizer().optimize()
+    result = RollingHorizonOptimizer(sample_fleet_optimizer(), 30, 30).optimize()
+
+    assert result.success == 0
+    assert len(result.extra_info["rolling_horizon"]) == 1
+    assert np.allclose(
+        result.battery_results["power_kw"],
+        expected.battery_results["power_kw"].sort_index(),
+    )
+
+
+def test_rolling_horizon(sample_fleet_optimizer):
+    rolling = RollingHorizonOptimizer(sample_fleet_optimizer(), window=12, commit=6)
+    assert rolling.windows() == [(0, 12, 6), (6, 18, 6), (12, 24, 6), (18, 30, 12)]
+
+    result = rolling.optimize()
+    assert result.success == 0
+    assert len(result.site_results) == 30
+
+    for battery in rolling.optimizer.batteries:
+        schedule = result.battery_results.xs(battery.id, level="battery_id")
+        # The energy content is continuous across the windows
+        energy = battery.energy_start + np.cumsum(schedule["power_kw"]) * 0.5
+        assert np.allclose(schedule["energy_content_kwh"], energy)
+        if not battery.stationary:
+            assert schedule["energy_content_kwh"].iloc[-1] >= battery.energy_end - 1e-6
+
+
+def test_rolling_horizon_invalid(sample_fleet_optimizer):
+    with pytest.raises(ValueError):
+        RollingHorizonOptimizer(sample_fleet_optimizer(), window=4, commit=6)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from battery_management import battery_optimizer
+from battery_management.optimizer.solver_settings import SolverSettings
+
+
+def test_solver_settings_invalid_values():
+    with pytest.raises(ValueError):
+        SolverSettings(mip_backend="GLOP")
+
+    with pytest.raises(ValueError):
+        SolverSettings(lp_backend="CBC")
+
+    with pytest.raises(ValueError):
+        SolverSettings(time_limit=0)
+
+    with pytest.raises(ValueError):
+        SolverSettings(relative_gap=-0.1)
+
+
+def test_create_solver():
+    settings = SolverSettings(mip_backend="SCIP", num_threads=2, time_limit=10)
+    assert "SCIP" in settings.create_solver("MIP").SolverVersion()
+    assert "Glop" in settings.create_solver("LP").SolverVersion()
+
+
+def test_create_passes_solver_settings():
+    settings = SolverSettings(mip_backend="SCIP", relative_gap=0.01)
+    fo = battery_optimizer.create(id=1, solver_settings=settings)
+    assert fo.solver_settings is settings
+
+
+@pytest.mark.parametrize(
+    "settings, solver_mode",
+    [
+        (SolverSettings(mip_backend="SCIP", time_limit=60, relative_gap=0), "MIP"),
+        (SolverSettings(lp_backend="CLP", num_threads=1), "LP"),
+    ],
+)
+def test_backends(sample_fleet_optimizer, settings, solver_mode):
+    results = []
+    for solver_settings in [None, settings]:
+        fo = sample_fleet_optimizer(
+            solver_settings=solver_settings, relax_binaries=solver_mode == "LP"
+        )
+        for battery in fo.batteries:
+            battery.power_charge_min = 0
+        results.append(fo.optimize())
+    expected, result = results
+
+    assert result.success == 0
+    assert result.solver_mode == solver_mode
+    assert np.isclose(result.objective_value, expected.objective_value)
+    assert np.isclose(result.mip_gap, 0, atol=1e-6)
+    assert not result.limit_reached
+
+
+@pytest.mark.parametrize("anytime", [False, True])
+def test_anytime(sample_fleet_optimizer, anytime):
+    fo = sample_fleet_optimizer(
+        solver_settings=SolverSettings(mip_backend="SCIP", anytime=anytime)
+    )
+    fo._build_model()
+    # Stop at the first incumbent, like a time limit would
+    fo.model.SetSolverSpecificParametersAsString("limits/solutions = 1")
+    result = fo._solve()
+
+    assert result.success == 1
+    assert result.has_solution == anytime
+    if anytime:
+        assert result.best_bound <= result.objective_value
+        power = result.battery_results.loc[23, "power_kw"].to_numpy()
+        charge = [
+            fo.fleet_power[23]["charge"][t].solution_value()
+            - fo.fleet_power[23]["discharge"][t].solution_value()
+            for t in range(fo.n_t)
+        ]
+        assert np.allclose(power, charge)
+    else:
+        assert np.isnan(result.objective_value)
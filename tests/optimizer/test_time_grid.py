@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from battery_management.optimizer.time_grid import (
+    aggregate,
+    coarsen,
+    constant_blocks,
+    expand,
+    time_grid,
+)
+
+
+def test_time_grid():
+    groups = time_grid(10, [(2, 1), (4, 2)])
+    assert groups.tolist() == [0, 1, 2, 2, 3, 3, 4, 4, 5, 5]
+    assert time_grid(5, [(3, 2), (2, 1)]).tolist() == [0, 0, 1, 2, 3]
+
+    with pytest.raises(ValueError):
+        time_grid(10, [(2, 0)])
+
+
+def test_aggregate():
+    groups = np.array([0, 0, 1, 1, 1])
+    dt = np.array([1, 3, 1, 1, 2])
+    assert np.allclose(aggregate([1, 5, 2, 2, 6], groups, "mean", dt), [4, 4])
+    summed = aggregate([1, np.nan, np.nan, np.nan, np.nan], groups, "sum")
+    assert summed[0] == 1 and np.isnan(summed[1])
+    assert aggregate([True, False, True, True, True], groups, "all").tolist() == [
+        False,
+        True,
+    ]
+    assert aggregate(3, groups) == 3
+    assert expand([1, 2], groups).tolist() == [1, 1, 2, 2, 2]
+
+
+@pytest.mark.parametrize("builder", ["expression", "matrix"])
+def test_step_durations(sample_fleet_optimizer, builder):
+    expected = sample_fleet_optimizer(builder=builder).optimize()
+    fo = sample_fleet_optimizer(builder=builder)
+    fo.dt = np.full(30, 0.5)
+    assert np.isclose(fo.optimize().objective_value, expected.objective_value)
+
+
+@pytest.mark.parametrize("builder", ["expression", "matrix"])
+def test_coarsen(sample_fleet_optimizer, builder):
+    # Block borders where the batteries connect and disconnect
+    groups = np.repeat(np.arange(6), [5, 2, 6, 6, 6, 5])
+
+    fo = sample_fleet_optimizer(builder=builder)
+    coarse = coarsen(fo, groups)
+    assert coarse.n_t == 6
+    assert np.allclose(coarse.dt, [2.5, 1, 3, 3, 3, 2.5])
+    result = coarse.optimize()
+    assert result.success == 0
+
+    # Same as the fine grid with inputs that are constant on the blocks
+    fine = sample_fleet_optimizer(builder=builder)
+    fine.add_prices(
+        tariffs_import=expand(coarse.tariffs_import, groups),
+        tariffs_export=expand(coarse.tariffs_export, groups),
+    )
+    fine.add_site_load(expand(coarse.site_load, groups))
+    assert np.isclose(result.objective_value, fine.optimize().objective_value)
+
+
+def _flat_optimizer(sample_fleet_optimizer, builder, **kwargs):
+    fo = sample_fleet_optimizer(builder=builder, **kwargs)
+    for battery in fo.batteries:
+        battery.power_charge_min = 0
+    # Fixed tariffs with a cheap night and a constant site load
+    tariffs = np.where(np.arange(30) < 12, 0.2, 0.3)
+    fo.add_prices(tariffs_import=tariffs, tariffs_export=tariffs * 0.8)
+    fo.add_site_load(np.full(30, 4.0))
+    return fo
+
+
+def test_constant_blocks(sample_fleet_optimizer):
+    fo = _flat_optimizer(sample_fleet_optimizer, "expression")
+    groups = constant_blocks(fo)
+    # Borders where the tariff changes and the batteries connect and disconnect
+    assert np.flatnonzero(np.diff(groups, prepend=-1)).tolist() == [0, 5, 7, 12, 25]
+
+
+@pytest.mark.parametrize("builder", ["expression", "matrix"])
+def test_compress_time(sample_fleet_optimizer, builder):
+    expected = _flat_optimizer(sample_fleet_optimizer, builder).optimize()
+    fo = _flat_optimizer(
+        sample_fleet_optimizer, builder, compress_time=True, calculate_savings=True
+    )
+    result = fo.optimize()
+
+    assert result.success == 0
+    assert result.extra_info["time_compression"] == {"n_t": 30, "compressed_n_t": 5}
+    assert np.isclose(result.objective_value, expected.objective_value)
+    assert np.isclose(
+        result.site_results["SpotCost"].sum(), expected.site_results["SpotCost"].sum()
+    )
+    assert len(result.site_results) == 30 and not result.savings.empty
+
+    for battery in fo.batteries:
+        schedule = result.battery_results.xs(battery.id, level="battery_id")
+        energy = battery.energy_start + np.cumsum(schedule["power_kw"]) * 0.5
+        assert np.allclose(schedule["energy_content_kwh"], energy)
+        assert np.allclose(schedule["power_kw"][~np.array(battery.connected)], 0)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from battery_management.assets.battery import Battery
+from battery_management.optimizer.battery_optimization_or import FleetOptimizationOR
+from battery_management.optimizer.model_cache import ModelCache
+from battery_management.request_handler.pool_optimizer import PoolOptimizer
+
+
+def _fleet(fleet_id, n_batteries, power, sample_prices):
+    fo = FleetOptimizationOR(id=fleet_id, dt=0.5)
+    for i in range(n_batteries):
+        fo.add_battery(
+            Battery(
+                id=10 * fleet_id + i,
+                capacity=40,
+                energy_start=10,
+                energy_end=20,
+                energy_min=5,
+                energy_max=40,
+                power_charge_max=power,
+                power_discharge_max=power,
+                connected=[True] * 30,
+            )
+        )
+    fo.add_prices(tariffs_import=sample_prices, tariffs_export=sample_prices)
+    return fo
+
+
+def _pool(sample_prices, **kwargs):
+    # The first fleet has most batteries but little power
+    return PoolOptimizer(
+        [_fleet(1, 3, 1, sample_prices), _fleet(2, 1, 10, sample_prices)],
+        marketed_volumes=np.array([5.0] * 4 + [np.nan] * 26),
+        **kwargs,
+    )
+
+
+def _pool_gap(result, pool):
+    delivered = result.pool_results["power_kw"].values[:4] * 0.5
+    return np.abs(pool.marketed_volumes[:4] - delivered).sum()
+
+
+def test_coordinated_dispatcher(sample_prices):
+    simple = _pool(sample_prices)
+    assert _pool_gap(simple.optimize(), simple) > 1
+
+    pool = _pool(sample_prices, processes=1)
+    result = pool.optimize(type="coordinated")
+    assert _pool_gap(result, pool) < 1e-3
+    assert 1 < len(pool.iterations) < pool.max_iterations
+
+
+def test_coordinated_dispatcher_processes(sample_prices):
+    pool = _pool(sample_prices, processes=2)
+    # Cached models stay in this process
+    for fo in pool.fleet_optimizer:
+        fo.add_model_cache(ModelCache())
+        fo.optimize()
+    result = pool.optimize(type="coordinated")
+    assert _pool_gap(result, pool) < 1e-3
+
+
+def test_pool_optimizer_invalid(sample_prices):
+    with pytest.raises(ValueError):
+        _pool(sample_prices).optimize(type="joint")
+    with pytest.raises(ValueError):
+        _pool(sample_prices, tolerance=0)
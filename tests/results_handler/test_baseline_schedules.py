@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from battery_management.results_handler.baseline_schedules import baseline_schedules
+
+
+def test_baseline_schedules(sample_fleet):
+    batteries = sample_fleet()
+    dt = np.full(30, 0.5)
+    schedules = baseline_schedules(
+        batteries, dt, ["inactive", "early", "continuous", "late"]
+    )
+
+    connected = np.array([battery.connected for battery in batteries], dtype=bool)
+    power_max = np.array([battery.power_charge_max for battery in batteries])
+    need = np.array(
+        [battery.energy_end - battery.energy_start for battery in batteries]
+    )
+    for method, power in schedules.items():
+        assert power.shape == (3, 30)
+        assert np.all(power[~connected] == 0)
+        assert np.all(power <= power_max[:, None] + 1e-9)
+        if method != "inactive":
+            # The targets of the vehicles can be reached in time
+            assert np.allclose((power * dt).sum(axis=1)[:2], need[:2])
+
+    # Vehicle 42 needs 30 kWh with 2.5 kWh per step, connected from step 7 to 24
+    assert np.flatnonzero(schedules["early"][0]).tolist() == list(range(7, 19))
+    assert np.flatnonzero(schedules["late"][0]).tolist() == list(range(13, 25))
+    assert np.allclose(schedules["continuous"][0, 7:25], 30 / 9)
+
+    late = baseline_schedules(batteries, dt, ["late"], late_charging=10)["late"]
+    assert np.flatnonzero(late[0]).tolist() == list(range(9, 21))
+
+    with pytest.raises(ValueError):
+        baseline_schedules(batteries, dt, ["active"])
+
+
+def test_non_optimized_savings(sample_fleet_optimizer):
+    fo = sample_fleet_optimizer(calculate_savings=True)
+    fo.calculate_savings_non_optimized = True
+    result = fo.optimize()
+
+    for method in ["early", "continuous", "late"]:
+        power = result.battery_store[f"power_kw_{method}"]
+        assert np.allclose(result.site_results[f"power_kw_{method}"], power.sum(axis=0))
+        assert f"saving_{method}" in result.savings.columns
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from battery_management.results_handler.battery_result_store import (
+    BatteryResultStore,
+)
+from battery_management.results_handler.pool_result import PoolResult
+
+
+def test_battery_result_store(sample_fleet_optimizer):
+    result = sample_fleet_optimizer().optimize()
+    store = result.battery_store
+    assert store.shape == (3, 30)
+    assert np.allclose(store.total("power_kw"), result.site_results["power_kw"])
+
+    frame = result.battery_results
+    pd.testing.assert_frame_equal(
+        BatteryResultStore.from_frame(frame).to_frame(), frame
+    )
+    pd.testing.assert_frame_equal(store.schedule(23), frame.xs(23, level="battery_id"))
+
+    # Slices share the arrays
+    battery = store.battery(23)
+    assert np.shares_memory(battery["power_kw"], store["power_kw"])
+    assert battery.battery_ids.tolist() == [23]
+
+    with pytest.raises(ValueError):
+        BatteryResultStore([1, 2], range(2), {"power_kw": np.zeros((2, 3))})
+
+
+def test_pool_result(sample_fleet_optimizer):
+    results = {
+        1: sample_fleet_optimizer().optimize(),
+        2: sample_fleet_optimizer(calculate_savings=True).optimize(),
+    }
+    pool = PoolResult(results)
+
+    expected = pd.concat(
+        [result.battery_results.assign(site_id=i) for i, result in results.items()]
+    )
+    pd.testing.assert_frame_equal(pool.battery_results, expected)
+
+    site = pool.site_store(2)
+    assert np.shares_memory(site["power_kw"], pool.battery_store["power_kw"])
+    assert np.array_equal(site["power_kw"], results[2].battery_store["power_kw"])
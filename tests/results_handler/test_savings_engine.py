@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from battery_management.results_handler.savings_engine import counterfactual_costs
+
+
+def test_counterfactual_costs():
+    rng = np.random.default_rng(0)
+    n_t, dt = 24, 0.25
+    schedules = rng.uniform(-5, 10, (4, n_t))
+    site_load = rng.uniform(-8, 8, n_t)
+    tariffs_import = rng.uniform(0.1, 0.4, (3, n_t))
+    triad = np.zeros(n_t)
+    triad[10] = 50
+    capacity = np.array([0, 3, 10])
+
+    table = counterfactual_costs(
+        schedules,
+        dt,
+        tariffs_import=tariffs_import,
+        tariffs_export=0.05,
+        triad_tariffs_import=triad,
+        capacity_tariffs_import=capacity,
+        site_load=site_load,
+        reference=1,
+    )
+    assert len(table) == 12
+    assert table.columns.tolist()[:2] == ["schedule", "tariff"]
+
+    # Same as evaluating every combination on its own
+    base_purchase = np.maximum(site_load, 0)
+    base_feed = np.maximum(-site_load, 0)
+    for row in table.itertuples():
+        grid = site_load + schedules[row.schedule]
+        purchase = np.maximum(grid, 0) - base_purchase
+        feed = np.maximum(-grid, 0) - base_feed
+        energy = ((tariffs_import[row.tariff] * purchase - 0.05 * feed) * dt).sum()
+        peak = np.maximum(grid, 0).max() - base_purchase.max()
+        assert row.cost_energy == pytest.approx(energy)
+        assert row.cost_triad == pytest.approx(50 * purchase[10] * dt)
+        assert row.cost_capacity == pytest.approx(capacity[row.tariff] * peak)
+
+    costs = table.pivot(index="schedule", columns="tariff", values="cost")
+    savings = table.pivot(index="schedule", columns="tariff", values="saving")
+    assert np.allclose(savings, costs - costs.loc[1])
+
+    # Without charging, the site load alone costs nothing
+    idle = counterfactual_costs({"idle": np.zeros(n_t)}, dt, tariffs_import[0])
+    assert idle["cost"].tolist() == [0]
+
+    with pytest.raises(ValueError):
+        counterfactual_costs(schedules, dt, tariffs_import=np.ones((3, n_t + 1)))
+
+
+def test_site_counterfactual_savings(sample_fleet_optimizer, sample_prices):
+    fo = sample_fleet_optimizer()
+    result = fo.optimize()
+
+    table = result.counterfactual_savings(
+        {
+            "spot": {
+                "tariffs_import": sample_prices,
+                "tariffs_export": sample_prices * 0.8,
+            },
+            "peak": {"tariffs_import": sample_prices, "capacity_tariffs_import": 3},
+        }
+    )
+    assert table["schedule"].unique().tolist() == [
+        "optimized",
+        "early",
+        "continuous",
+        "late",
+    ]
+    assert table["tariff"].unique().tolist() == ["spot", "peak"]
+    # The optimized schedule is the cheapest under the tariffs it was optimized for
+    spot = table[table["tariff"] == "spot"]
+    assert (spot["saving"] >= -1e-6).all()
+
+    default = result.counterfactual_savings()
+    assert np.allclose(default["cost"], spot["cost"])
+
+    with pytest.raises(ValueError):
+        result.counterfactual_savings({"spot": {"prices": sample_prices}})
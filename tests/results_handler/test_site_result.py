@@ -0,0 +1,42 @@
+import gc
+import pickle
+import weakref
+
+import numpy as np
+
+
+def test_lazy_results(sample_fleet_optimizer):
+    fo = sample_fleet_optimizer(calculate_savings=True, relax_binaries=False)
+    result = fo.optimize()
+    assert result._savings is None and result._aggregated_results is None
+    assert callable(result._extra_info)
+
+    # The extra info comes from this solve, even if the model is solved again
+    disconnected = fo.fleet_bool[42]["disconnected"][0].solution_value()
+    fo.add_site_load(np.zeros(30))
+    fo.optimize()
+    assert result.extra_info["debug"]["disconnected"][42][0] == disconnected
+
+    assert not result.savings.empty
+    assert len(result.aggregated_results) == 30
+    assert result.aggregated_results is result.aggregated_results
+
+    result_dict = result.dict()
+    assert not any(key.startswith("_") for key in result_dict)
+    assert result_dict["extra_info"] == result.extra_info
+    assert result_dict["savings"] is result.savings
+
+    restored = pickle.loads(pickle.dumps(result))
+    assert restored.extra_info == result.extra_info
+
+
+def test_lazy_extra_info_releases_solver(sample_fleet_optimizer):
+    fo = sample_fleet_optimizer(relax_binaries=False)
+    result = fo.optimize()
+    model = weakref.ref(fo.model)
+    disconnected = fo.fleet_bool[42]["disconnected"][3].solution_value()
+
+    del fo
+    gc.collect()
+    assert model() is None
+    assert result.extra_info["debug"]["disconnected"][42][3] == disconnected